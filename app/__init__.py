@@ -12,6 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .agent import root_agent
+from typing import Any
 
 __all__ = ["root_agent"]
+
+
+def __getattr__(name: str) -> Any:
+    # Importing the package (or any of app.utils) neither builds the agents nor
+    # resolves credentials; `app.root_agent` does, on first access.
+    if name == "root_agent":
+        from .agent import get_root_agent
+
+        return get_root_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
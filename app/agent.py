@@ -12,147 +12,217 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import functools
+import logging
 import os
-import random
-from typing import List
+from collections.abc import Callable
+from typing import Any, Literal, cast
 
-import google.auth
-from google.adk.agents import Agent, ParallelAgent, SequentialAgent
-from google.adk.tools import FunctionTool, ToolContext
+from google.adk.agents import Agent, ParallelAgent
+from google.adk.tools import ToolContext
 from pydantic import BaseModel
 
-_, project_id = google.auth.default()
-os.environ.setdefault("GOOGLE_CLOUD_PROJECT", project_id)
-os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "global")
-os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "True")
+from app.utils.assets import AssetStore
+from app.utils.baselines import BaselineSelectionAgent, parse_weights
+from app.utils.catalog import get_catalog
+from app.utils.fanout import AssetGenerator, VariantFanOutAgent, parse_model_limits
+from app.utils.llm_cache import ResponseCache, enable_response_cache
+from app.utils.metrics import get_pipeline_metrics, instrument_agent
+from app.utils.models import model_backend, resolve_model
+from app.utils.pipeline import VisualMarketingPipeline
+from app.utils.projection import (
+    ProjectedInstruction,
+    asset_path,
+    first_concepts,
+    first_items,
+    truncate,
+)
+from app.utils.ratelimit import parse_limits, rate_limiter
+from app.utils.routing import hedge_budget, parse_routes
+
+BASELINE_IMAGE_DIR = "images_baseline"
+IMAGE_GENERATION_MODEL = "gemini-2.5-flash-image-preview"
+VIDEO_GENERATION_MODEL = "veo-3.0-generate-preview"
+
+# Process-wide rate limits in requests per minute, shared by every model and
+# generation call of every session in this process. Replayed runs are unlimited
+# unless RATE_LIMITS is set.
+DEFAULT_RATE_LIMITS = (
+    "gemini-2.5-flash=500,gemini-2.5-flash-lite=1000,"
+    f"{IMAGE_GENERATION_MODEL}=60,{VIDEO_GENERATION_MODEL}=10"
+)
+
+
+@functools.cache
+def get_asset_stores() -> tuple[AssetStore, AssetStore]:
+    """Returns the image and video stores. Generated assets are content-addressed,
+    so identical requests are served from disk."""
+    catalog = get_catalog(BASELINE_IMAGE_DIR)
+    return (
+        AssetStore("generated_images", catalog=catalog),
+        AssetStore("generated_videos", catalog=catalog),
+    )
+
+
+@functools.cache
+def configure_limits() -> None:
+    """Applies RATE_LIMITS and MODEL_MAX_ATTEMPTS to the process-wide rate limiter,
+    and HEDGE_BUDGET, the extra requests hedging may add per request, once."""
+    metrics = get_pipeline_metrics()
+    rate_limiter.configure(
+        parse_limits(
+            os.environ.get(
+                "RATE_LIMITS",
+                DEFAULT_RATE_LIMITS if model_backend() != "replay" else "",
+            )
+        )
+    )
+    rate_limiter.max_attempts = int(os.environ.get("MODEL_MAX_ATTEMPTS", "5"))
+    rate_limiter.metrics = metrics
+    hedge_budget.ratio = float(os.environ.get("HEDGE_BUDGET", "0.1"))
+    hedge_budget.metrics = metrics
+
 
 # --- Tool Data Models ---
 
+
 class ImageGenerationResult(BaseModel):
     """The result of the simulated image generation tool."""
+
     status: str
     generated_image_path: str
+    cached: bool = False
+
 
 class VideoGenerationResult(BaseModel):
     """The result of the simulated video generation tool."""
+
     status: str
     generated_video_path: str
+    cached: bool = False
+
 
 # --- Tools ---
 
-def list_baseline_images(tool_context: ToolContext) -> List[str]:
+
+def list_baseline_images(tool_context: ToolContext) -> list[str]:
     """
     Lists the available baseline images of the merchandise.
     This tool should be used to select a reference image for generation.
     """
-    image_dir = "images_baseline"
     try:
-        files = [os.path.join(image_dir, f) for f in os.listdir(image_dir) if f.endswith(".png")]
-        return files
+        return get_catalog(BASELINE_IMAGE_DIR).paths()
     except FileNotFoundError:
         return ["Error: 'images_baseline' directory not found."]
 
-def generate_image_from_prompt_and_image(prompt: str, baseline_image_path: str, tool_context: ToolContext) -> ImageGenerationResult:
+
+def _baseline_paths() -> list[str]:
+    return get_catalog(BASELINE_IMAGE_DIR).paths()
+
+
+async def _generate_image(
+    prompt: str, baseline_image_path: str
+) -> ImageGenerationResult:
+    _, file_ext = os.path.splitext(os.path.basename(baseline_image_path))
+    image_store, _ = get_asset_stores()
+
+    def generate() -> bytes:
+        logging.info(
+            f"Simulating image generation with {IMAGE_GENERATION_MODEL} "
+            f"from baseline {baseline_image_path}, prompt: {prompt}"
+        )
+        return f"This is a simulated image based on {baseline_image_path} and prompt: '{prompt}'".encode()
+
+    # Hashing, generation and file writes block, so they run off the event loop
+    # to let the image and video branches of the ParallelAgent overlap.
+    generated_image_path, cached = await get_pipeline_metrics().run_in_thread(
+        "generate_image_from_prompt_and_image",
+        lambda: image_store.get_or_create(
+            image_store.key(IMAGE_GENERATION_MODEL, prompt, baseline_image_path),
+            file_ext,
+            lambda: rate_limiter.call_sync(
+                IMAGE_GENERATION_MODEL, generate, "generate_image_from_prompt_and_image"
+            ),
+        ),
+    )
+    return ImageGenerationResult(
+        status="success", generated_image_path=generated_image_path, cached=cached
+    )
+
+
+async def generate_image_from_prompt_and_image(
+    prompt: str, baseline_image_path: str, tool_context: ToolContext
+) -> ImageGenerationResult:
     """
     Simulates generating an image from a text prompt and a baseline image using a Gemini model.
     In a real implementation, this tool would call the Gemini image generation API.
     """
-    print(f"--- SIMULATING IMAGE GENERATION ---")
-    print(f"Model: gemini-2.5-flash-image-preview")
-    print(f"Prompt: {prompt}")
-    print(f"Baseline Image: {baseline_image_path}")
+    return await _generate_image(prompt, baseline_image_path)
 
-    output_dir = "generated_images"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
 
-    base_name = os.path.basename(baseline_image_path)
-    file_name, file_ext = os.path.splitext(base_name)
-    generated_image_name = f"simulated_{file_name}_{random.randint(1000,9999)}{file_ext}"
-    generated_image_path = os.path.join(output_dir, generated_image_name)
+async def _generate_video(
+    prompt: str, baseline_image_path: str
+) -> VideoGenerationResult:
+    _, video_store = get_asset_stores()
 
-    with open(generated_image_path, "w") as f:
-        f.write(f"This is a simulated image based on {baseline_image_path} and prompt: '{prompt}'")
+    def generate() -> bytes:
+        logging.info(
+            f"Simulating two-step video generation (Imagen, then {VIDEO_GENERATION_MODEL}) "
+            f"from baseline {baseline_image_path}, prompt: {prompt}"
+        )
+        return f"This is a simulated video based on {baseline_image_path} and prompt: '{prompt}'".encode()
+
+    generated_video_path, cached = await get_pipeline_metrics().run_in_thread(
+        "generate_video_from_prompt_and_image",
+        lambda: video_store.get_or_create(
+            video_store.key(VIDEO_GENERATION_MODEL, prompt, baseline_image_path),
+            ".mp4",
+            lambda: rate_limiter.call_sync(
+                VIDEO_GENERATION_MODEL, generate, "generate_video_from_prompt_and_image"
+            ),
+        ),
+    )
+    return VideoGenerationResult(
+        status="success", generated_video_path=generated_video_path, cached=cached
+    )
 
-    return ImageGenerationResult(status="success", generated_image_path=generated_image_path)
 
-def generate_video_from_prompt_and_image(prompt: str, baseline_image_path: str, tool_context: ToolContext) -> VideoGenerationResult:
+async def generate_video_from_prompt_and_image(
+    prompt: str, baseline_image_path: str, tool_context: ToolContext
+) -> VideoGenerationResult:
     """
     Simulates a two-step video generation from a prompt and a baseline image using Imagen and Veo models.
     In a real implementation, this tool would call the respective Google Cloud APIs.
     """
-    print(f"--- SIMULATING VIDEO GENERATION (2-STEP) ---")
-    print(f"Step 1: Generating initial image with Imagen...")
-    print(f"   - Prompt: {prompt}")
-    print(f"   - Baseline Image: {baseline_image_path}")
-    print(f"Step 2: Generating video with Veo-3 using initial image...")
+    return await _generate_video(prompt, baseline_image_path)
 
-    output_dir = "generated_videos"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
 
-    base_name = os.path.basename(baseline_image_path)
-    file_name, _ = os.path.splitext(base_name)
-    generated_video_name = f"simulated_video_{file_name}_{random.randint(1000,9999)}.mp4"
-    generated_video_path = os.path.join(output_dir, generated_video_name)
+# --- Agent Instructions ---
 
-    with open(generated_video_path, "w") as f:
-        f.write(f"This is a simulated video based on {baseline_image_path} and prompt: '{prompt}'")
-
-    return VideoGenerationResult(status="success", generated_video_path=generated_video_path)
-
-# --- Agent Definitions ---
-
-visual_ideation_agent = Agent(
-    name="VisualIdeationAgent",
-    model="gemini-2.5-flash",
-    description="Brainstorms visual concepts for marketing assets.",
-    instruction="""Based on the user's business intent for an apparel shop, brainstorm a list of 3-5 distinct visual concepts or scenes.
+IDEATION_INSTRUCTION = """Based on the user's business intent for an apparel shop, brainstorm a list of 3-5 distinct visual concepts or scenes.
     For each concept, describe the setting, the vibe, the model (individual or couple), and the activity.
     Example: A couple having a relaxed picnic in a sunny park, with a 'chilling, holiday vibe'.
-    Output a bulleted list of these concepts.""",
-    output_key="visual_concepts",
-)
+    Output a bulleted list of these concepts."""
 
-image_generation_agent = Agent(
-    name="ImageGenerationAgent",
-    model="gemini-2.5-flash",
-    description="Generates a realistic still image for a marketing campaign by orchestrating multiple tools.",
-    instruction="""You are an AI Image Generation specialist. Your task is to generate a marketing image.
-
-    1.  **Get available merchandise images:** Use the `list_baseline_images` tool to see the list of available cat print t-shirt images.
-    2.  **Select a baseline image:** Randomly pick one image path from the list.
-    3.  **Review the visual concepts:** Read the concepts provided in `{visual_concepts}`.
-    4.  **Create a detailed prompt:** Combine the user's business intent and the most compelling visual concept into a detailed creative prompt for the image generation model. The prompt should be a single, descriptive paragraph.
-    5.  **Generate the image:** Call the `generate_image_from_prompt_and_image` tool with your detailed prompt and the selected baseline image path.
-    6.  **Output the result:** Your final output should be ONLY the path to the generated image, extracted from the tool's result.
-    """,
-    tools=[list_baseline_images, generate_image_from_prompt_and_image],
-    output_key="generated_image_path",
-)
+IMAGE_GENERATION_INSTRUCTION = """You are an AI Image Generation specialist. Your task is to generate a marketing image.
 
-video_generation_agent = Agent(
-    name="VideoGenerationAgent",
-    model="gemini-2.5-flash",
-    description="Generates a short video clip for a marketing campaign by orchestrating multiple tools.",
-    instruction="""You are an AI Video Generation specialist. Your task is to generate a short marketing video.
-
-    1.  **Get available merchandise images:** Use the `list_baseline_images` tool to see the list of available cat print t-shirt images.
-    2.  **Select a baseline image:** Randomly pick one image path from the list.
-    3.  **Review the visual concepts:** Read the concepts provided in `{visual_concepts}`.
-    4.  **Create a detailed prompt:** Combine the user's business intent and the most compelling visual concept into a detailed creative prompt for the video generation model. The prompt should be a single, descriptive paragraph.
-    5.  **Generate the video:** Call the `generate_video_from_prompt_and_image` tool with your detailed prompt and the selected baseline image path.
-    6.  **Output the result:** Your final output should be ONLY the path to the generated video, extracted from the tool's result.
-    """,
-    tools=[list_baseline_images, generate_video_from_prompt_and_image],
-    output_key="generated_video_path",
-)
+    1.  **Use the selected baseline image:** The cat print t-shirt image to build on is `{selected_baseline_image}` (chosen from the available images: {baseline_images}).
+    2.  **Review the visual concepts:** Read the concepts provided in `{visual_concepts}`.
+    3.  **Create a detailed prompt:** Combine the user's business intent and the most compelling visual concept into a detailed creative prompt for the image generation model. The prompt should be a single, descriptive paragraph.
+    4.  **Generate the image:** Call the `generate_image_from_prompt_and_image` tool with your detailed prompt and the selected baseline image path.
+    5.  **Output the result:** Your final output should be ONLY the path to the generated image, extracted from the tool's result.
+    """
+
+VIDEO_GENERATION_INSTRUCTION = """You are an AI Video Generation specialist. Your task is to generate a short marketing video.
+
+    1.  **Use the selected baseline image:** The cat print t-shirt image to build on is `{selected_baseline_image}` (chosen from the available images: {baseline_images}).
+    2.  **Review the visual concepts:** Read the concepts provided in `{visual_concepts}`.
+    3.  **Create a detailed prompt:** Combine the user's business intent and the most compelling visual concept into a detailed creative prompt for the video generation model. The prompt should be a single, descriptive paragraph.
+    4.  **Generate the video:** Call the `generate_video_from_prompt_and_image` tool with your detailed prompt and the selected baseline image path.
+    5.  **Output the result:** Your final output should be ONLY the path to the generated video, extracted from the tool's result.
+    """
 
-twitter_publisher_agent = Agent(
-    name="TwitterPublisherAgent",
-    model="gemini-2.5-flash",
-    description="Formats the generated visual assets into a social media post for X/Twitter.",
-    instruction="""You are a Social Media Manager for X/Twitter.
+PUBLISHER_INSTRUCTION = """You are a Social Media Manager for X/Twitter.
     Your task is to create a tweet for the apparel shop campaign.
 
     Use the following assets:
@@ -160,24 +230,263 @@ twitter_publisher_agent = Agent(
     - Generated Video Path: `{generated_video_path}`
 
     Draft a compelling tweet that is engaging and includes relevant hashtags (like #catmerch, #tshirt, #summerstyle). Decide whether the image or the video is more impactful and state which one should be attached to the tweet.
-    """,
-    output_key="twitter_post",
-)
 
-# --- Root Agent: Sequential Workflow ---
+    {variants_summary?}
+    """
+
+# --- Variant Generators ---
+
 
-root_agent = SequentialAgent(
-    name="VisualMarketingAgent",
-    sub_agents=[
-        visual_ideation_agent,
-        ParallelAgent(
-            name="VisualGenerationLayer",
-            sub_agents=[
+async def _generate_image_variant(
+    prompt: str, baseline_image_path: str
+) -> tuple[str, bool]:
+    result = await _generate_image(prompt, baseline_image_path)
+    return result.generated_image_path, result.cached
+
+
+async def _generate_video_variant(
+    prompt: str, baseline_image_path: str
+) -> tuple[str, bool]:
+    result = await _generate_video(prompt, baseline_image_path)
+    return result.generated_video_path, result.cached
+
+
+# --- Agent Definitions ---
+
+
+def _build_root_agent() -> VisualMarketingPipeline:
+    """Builds the agents and wires them into the root pipeline."""
+    configure_limits()
+    pipeline_metrics = get_pipeline_metrics()
+    # Each agent's models, preferred first; alternates take over when a model breaches
+    # its latency SLO or is rate limited. Agents without a route use gemini-2.5-flash.
+    model_routes = parse_routes(os.environ.get("MODEL_ROUTES", ""))
+
+    # Code-only first stage: puts the baseline catalog and the selected baseline into
+    # session state, so the generation agents skip the list_baseline_images model turn.
+    baseline_selection_agent = BaselineSelectionAgent(
+        name="BaselineSelectionAgent",
+        description="Selects the baseline merchandise image for the campaign.",
+        catalog=_baseline_paths,
+        strategy=cast(
+            Literal["deterministic", "weighted"],
+            os.environ.get("BASELINE_SELECTION", "deterministic").lower(),
+        ),
+        weights=parse_weights(os.environ.get("BASELINE_WEIGHTS", "")),
+    )
+
+    visual_ideation_agent = Agent(
+        name="VisualIdeationAgent",
+        model=resolve_model(
+            "VisualIdeationAgent",
+            model_routes.get("VisualIdeationAgent", ["gemini-2.5-flash"]),
+        ),
+        description="Brainstorms visual concepts for marketing assets.",
+        instruction=IDEATION_INSTRUCTION,
+        output_key="visual_concepts",
+    )
+
+    image_generation_agent = Agent(
+        name="ImageGenerationAgent",
+        model=resolve_model(
+            "ImageGenerationAgent",
+            model_routes.get("ImageGenerationAgent", ["gemini-2.5-flash"]),
+        ),
+        description="Generates a realistic still image for a marketing campaign by orchestrating multiple tools.",
+        instruction=IMAGE_GENERATION_INSTRUCTION,
+        tools=[generate_image_from_prompt_and_image],
+        output_key="generated_image_path",
+    )
+
+    video_generation_agent = Agent(
+        name="VideoGenerationAgent",
+        model=resolve_model(
+            "VideoGenerationAgent",
+            model_routes.get("VideoGenerationAgent", ["gemini-2.5-flash"]),
+        ),
+        description="Generates a short video clip for a marketing campaign by orchestrating multiple tools.",
+        instruction=VIDEO_GENERATION_INSTRUCTION,
+        tools=[generate_video_from_prompt_and_image],
+        output_key="generated_video_path",
+    )
+
+    twitter_publisher_agent = Agent(
+        name="TwitterPublisherAgent",
+        model=resolve_model(
+            "TwitterPublisherAgent",
+            model_routes.get("TwitterPublisherAgent", ["gemini-2.5-flash"]),
+        ),
+        description="Formats the generated visual assets into a social media post for X/Twitter.",
+        instruction=PUBLISHER_INSTRUCTION,
+        output_key="twitter_post",
+    )
+
+    # --- Variant Fan-Out ---
+    # With FANOUT_VARIANTS=N, the generation agents are replaced by a code-only stage that
+    # generates N variants per concept and baseline image, and the publisher ranks them.
+
+    fanout_variants = int(os.environ.get("FANOUT_VARIANTS", "0"))
+    variant_fanout_agent = VariantFanOutAgent(
+        name="VariantFanOutAgent",
+        description="Generates a matrix of image and video variants for A/B testing.",
+        generators=[
+            AssetGenerator("image", IMAGE_GENERATION_MODEL, _generate_image_variant),
+            AssetGenerator("video", VIDEO_GENERATION_MODEL, _generate_video_variant),
+        ],
+        baselines=_baseline_paths,
+        variants=max(1, fanout_variants),
+        max_concepts=int(os.environ.get("FANOUT_MAX_CONCEPTS", "3")),
+        max_baselines=int(os.environ.get("FANOUT_MAX_BASELINES", "2")),
+        concurrency=int(os.environ.get("FANOUT_CONCURRENCY", "8")),
+        model_concurrency=parse_model_limits(
+            os.environ.get(
+                "FANOUT_MODEL_CONCURRENCY",
+                f"{IMAGE_GENERATION_MODEL}=6,{VIDEO_GENERATION_MODEL}=2",
+            )
+        ),
+    )
+
+    # --- State Projection ---
+    # Each agent's instruction interpolates only the part of the state it needs: the
+    # first PROJECTION_MAX_CONCEPTS concepts cut to PROJECTION_CONCEPT_TOKENS tokens each,
+    # bare asset paths, and free text cut to PROJECTION_MAX_TOKENS. STATE_PROJECTION=off
+    # interpolates the full state.
+
+    if os.environ.get("STATE_PROJECTION", "on").lower() != "off":
+        concepts_projection = first_concepts(
+            int(os.environ.get("PROJECTION_MAX_CONCEPTS", "3")),
+            int(os.environ.get("PROJECTION_CONCEPT_TOKENS", "80")),
+        )
+        baselines_projection = first_items(
+            int(os.environ.get("PROJECTION_MAX_ITEMS", "5"))
+        )
+        state_projections = [
+            (
                 image_generation_agent,
+                IMAGE_GENERATION_INSTRUCTION,
+                {
+                    "visual_concepts": concepts_projection,
+                    "baseline_images": baselines_projection,
+                },
+            ),
+            (
                 video_generation_agent,
-            ],
-        ),
-        twitter_publisher_agent,
-    ],
-    description="Generates visual marketing assets for an apparel shop and formats them for social media.",
-)
\ No newline at end of file
+                VIDEO_GENERATION_INSTRUCTION,
+                {
+                    "visual_concepts": concepts_projection,
+                    "baseline_images": baselines_projection,
+                },
+            ),
+            (
+                twitter_publisher_agent,
+                PUBLISHER_INSTRUCTION,
+                {
+                    "generated_image_path": asset_path(),
+                    "generated_video_path": asset_path(),
+                    "variants_summary": truncate(
+                        int(os.environ.get("PROJECTION_MAX_TOKENS", "400"))
+                    ),
+                },
+            ),
+        ]
+        for llm_agent, template, projections in state_projections:
+            llm_agent.instruction = ProjectedInstruction(
+                template, projections, metrics=pipeline_metrics
+            )
+
+    # --- Response Caching ---
+    # Agents named in LLM_CACHE_AGENTS (comma-separated, none by default) answer
+    # repeated requests from a local response cache instead of calling the model again.
+
+    cached_agent_names = {
+        name.strip()
+        for name in os.environ.get("LLM_CACHE_AGENTS", "").split(",")
+        if name.strip()
+    }
+    if cached_agent_names:
+        response_cache = ResponseCache(
+            path=os.environ.get(
+                "LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite3")
+            ),
+            max_bytes=int(os.environ.get("LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+            ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+        )
+        for llm_agent in (
+            visual_ideation_agent,
+            image_generation_agent,
+            video_generation_agent,
+            twitter_publisher_agent,
+        ):
+            if llm_agent.name in cached_agent_names:
+                enable_response_cache(llm_agent, response_cache)
+
+    # --- Root Agent: Sequential Workflow ---
+    # With PIPELINE_MODE=pipelined, generation starts on each of the first
+    # PIPELINE_CONCEPTS concepts as soon as ideation has streamed it.
+
+    root_agent = VisualMarketingPipeline(
+        name="VisualMarketingAgent",
+        pipelined=os.environ.get("PIPELINE_MODE", "sequential").lower() == "pipelined",
+        fanout=fanout_variants > 0,
+        max_concepts=int(os.environ.get("PIPELINE_CONCEPTS", "1")),
+        sub_agents=[
+            baseline_selection_agent,
+            visual_ideation_agent,
+            ParallelAgent(
+                name="VisualGenerationLayer",
+                sub_agents=[
+                    image_generation_agent,
+                    video_generation_agent,
+                ],
+            ),
+            variant_fanout_agent,
+            twitter_publisher_agent,
+        ],
+        description="Generates visual marketing assets for an apparel shop and formats them for social media.",
+    )
+
+    instrument_agent(root_agent, pipeline_metrics)
+    return root_agent
+
+
+# --- Lazy Construction ---
+# Credentials are resolved and the agents are built on first use of root_agent, so
+# importing this module is cheap and works without credentials.
+
+
+@functools.cache
+def configure_vertex_ai() -> None:
+    """Resolves the Google Cloud project for Vertex AI from the default credentials, once."""
+    # Replayed runs never reach Vertex AI, so they must not require credentials.
+    if model_backend() == "replay":
+        return
+    import google.auth
+
+    _, project_id = google.auth.default()
+    if project_id:
+        os.environ.setdefault("GOOGLE_CLOUD_PROJECT", project_id)
+    os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "global")
+    os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "True")
+
+
+@functools.cache
+def get_root_agent() -> VisualMarketingPipeline:
+    """Returns the process-wide root agent, building it on first use."""
+    configure_vertex_ai()
+    return _build_root_agent()
+
+
+# `from app.agent import root_agent` builds the agent on first access; the metrics
+# and asset stores are created on first access too.
+_LAZY_ATTRIBUTES: dict[str, Callable[[], Any]] = {
+    "root_agent": get_root_agent,
+    "pipeline_metrics": get_pipeline_metrics,
+    "image_store": lambda: get_asset_stores()[0],
+    "video_store": lambda: get_asset_stores()[1],
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
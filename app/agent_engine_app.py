@@ -13,43 +13,90 @@
 # limitations under the License.
 
 # mypy: disable-error-code="attr-defined,arg-type"
-import copy
+import asyncio
 import datetime
 import json
 import logging
 import os
-from typing import Any
+import threading
+from collections.abc import AsyncGenerator, Generator
+from typing import TYPE_CHECKING, Any
 
-import google.auth
-import vertexai
-from google.adk.artifacts import GcsArtifactService
-from google.cloud import logging as google_cloud_logging
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider, export
-from vertexai import agent_engines
 from vertexai.preview.reasoning_engines import AdkApp
 
-from app.agent import root_agent
-from app.utils.gcs import create_bucket_if_not_exists
-from app.utils.tracing import CloudTraceLoggingSpanExporter
+from app.utils.pipeline import clone_root_agent
+from app.utils.serving import worker_settings
 from app.utils.typing import Feedback
 
+# Cloud Logging, Cloud Trace, Cloud Storage and the Agent Engine client are
+# imported where they are used, so that importing this module (as every Agent
+# Engine worker does) only pays for what the worker actually needs.
+if TYPE_CHECKING:
+    from vertexai import agent_engines
+
 
 class AgentEngineApp(AdkApp):
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._init_session_slots()
+
+    def _init_session_slots(self) -> None:
+        # At most SESSION_CONCURRENCY queries of this worker are in flight at once,
+        # for the synchronous and the asynchronous path each; the others wait.
+        _, sessions = worker_settings()
+        self._session_slots = threading.BoundedSemaphore(sessions)
+        self._async_session_slots = asyncio.Semaphore(sessions)
+
+    def __getstate__(self) -> dict[str, Any]:
+        # Locks cannot be pickled; the deployed copy creates its own slots.
+        state = self.__dict__.copy()
+        del state["_session_slots"], state["_async_session_slots"]
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._init_session_slots()
+
     def set_up(self) -> None:
         """Set up logging and tracing for the agent engine app."""
+        from google.cloud import logging as google_cloud_logging
+
+        from app.utils.tracing import create_span_exporter
+
         super().set_up()
         logging_client = google_cloud_logging.Client()
         self.logger = logging_client.logger(__name__)
         provider = TracerProvider()
-        processor = export.BatchSpanProcessor(
-            CloudTraceLoggingSpanExporter(
-                project_id=os.environ.get("GOOGLE_CLOUD_PROJECT")
-            )
+        exporter = create_span_exporter(
+            project_id=os.environ.get("GOOGLE_CLOUD_PROJECT")
         )
-        provider.add_span_processor(processor)
+        if exporter is not None:
+            provider.add_span_processor(export.BatchSpanProcessor(exporter))
         trace.set_tracer_provider(provider)
 
+    def stream_query(self, **kwargs: Any) -> Generator[dict[str, Any], None, None]:
+        """Streams a query, with at most ``SESSION_CONCURRENCY`` queries of this
+        worker in flight; the others wait for a slot."""
+        self._session_slots.acquire()
+        try:
+            yield from super().stream_query(**kwargs)
+        finally:
+            # Also runs when the caller closes or drops the stream early.
+            self._session_slots.release()
+
+    async def async_stream_query(
+        self, **kwargs: Any
+    ) -> AsyncGenerator[dict[str, Any], None]:
+        """Streams a query like ``stream_query``, under the same limit."""
+        await self._async_session_slots.acquire()
+        try:
+            async for event in super().async_stream_query(**kwargs):
+                yield event
+        finally:
+            self._async_session_slots.release()
+
     def register_feedback(self, feedback: dict[str, Any]) -> None:
         """Collect and log feedback."""
         feedback_obj = Feedback.model_validate(feedback)
@@ -65,11 +112,17 @@ class AgentEngineApp(AdkApp):
         return operations
 
     def clone(self) -> "AgentEngineApp":
-        """Returns a clone of the ADK application."""
+        """Returns a clone of the ADK application.
+
+        Every agent of the tree is copied shallowly, with its own lists and
+        dicts; the models, tools, instruction providers and callbacks they refer
+        to are shared with this app instead of deep-copied. Runners, session and
+        artifact services are built per instance by ``set_up``.
+        """
         template_attributes = self._tmpl_attrs
 
         return self.__class__(
-            agent=copy.deepcopy(template_attributes["agent"]),
+            agent=clone_root_agent(template_attributes["agent"]),
             enable_tracing=bool(template_attributes.get("enable_tracing", False)),
             session_service_builder=template_attributes.get("session_service_builder"),
             artifact_service_builder=template_attributes.get(
@@ -87,8 +140,21 @@ def deploy_agent_engine_app(
     extra_packages: list[str] = ["./app"],
     env_vars: dict[str, str] = {},
     service_account: str | None = None,
-) -> agent_engines.AgentEngine:
-    """Deploy the agent engine app to Vertex AI."""
+    num_workers: int | None = None,
+    session_concurrency: int | None = None,
+) -> "agent_engines.AgentEngine":
+    """Deploy the agent engine app to Vertex AI.
+
+    Each instance runs ``num_workers`` worker processes (``NUM_WORKERS``,
+    default 1), each serving up to ``session_concurrency`` campaigns at once
+    (``SESSION_CONCURRENCY``, default 16).
+    """
+    import vertexai
+    from google.adk.artifacts import GcsArtifactService
+    from vertexai import agent_engines
+
+    from app.agent import get_root_agent
+    from app.utils.gcs import create_bucket_if_not_exists
 
     staging_bucket_uri = f"gs://{project}-agent-engine"
     artifacts_bucket_name = f"{project}-marketingflow-logs-data"
@@ -106,14 +172,17 @@ def deploy_agent_engine_app(
         requirements = f.read().strip().split("\n")
 
     agent_engine = AgentEngineApp(
-        agent=root_agent,
+        agent=get_root_agent(),
         artifact_service_builder=lambda: GcsArtifactService(
             bucket_name=artifacts_bucket_name
         ),
     )
 
-    # Set worker parallelism to 1
-    env_vars["NUM_WORKERS"] = "1"
+    # Worker processes per instance and concurrent sessions per worker.
+    default_workers, default_sessions = worker_settings()
+    env_vars = dict(env_vars)
+    env_vars["NUM_WORKERS"] = str(num_workers or default_workers)
+    env_vars["SESSION_CONCURRENCY"] = str(session_concurrency or default_sessions)
 
     # Common configuration for both create and update operations
     agent_config = {
@@ -186,6 +255,18 @@ if __name__ == "__main__":
         "--set-env-vars",
         help="Comma-separated list of environment variables in KEY=VALUE format",
     )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=None,
+        help="Worker processes per instance (defaults to NUM_WORKERS or 1)",
+    )
+    parser.add_argument(
+        "--session-concurrency",
+        type=int,
+        default=None,
+        help="Concurrent sessions per worker (defaults to SESSION_CONCURRENCY or 16)",
+    )
     parser.add_argument(
         "--service-account",
         default=None,
@@ -201,6 +282,8 @@ if __name__ == "__main__":
             env_vars[key] = value
 
     if not args.project:
+        import google.auth
+
         _, args.project = google.auth.default()
 
     print("""
@@ -219,4 +302,6 @@ if __name__ == "__main__":
         extra_packages=args.extra_packages,
         env_vars=env_vars,
         service_account=args.service_account,
+        num_workers=args.num_workers,
+        session_concurrency=args.session_concurrency,
     )
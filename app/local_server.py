@@ -0,0 +1,400 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+from collections.abc import Awaitable, Callable
+from typing import Any
+from urllib.parse import parse_qs
+
+from google.adk.runners import Runner
+from google.genai import types as genai_types
+
+from app.utils.serving import (
+    CampaignWorker,
+    WorkerDraining,
+    build_runner,
+    worker_settings,
+)
+
+logger = logging.getLogger(__name__)
+
+Scope = dict[str, Any]
+Receive = Callable[[], Awaitable[dict[str, Any]]]
+Send = Callable[[dict[str, Any]], Awaitable[None]]
+
+# The same resource path as a deployed Agent Engine, so clients only change the host.
+STREAM_QUERY_PATH = re.compile(
+    r"^/v1(?:beta1)?/projects/[^/]+/locations/[^/]+/reasoningEngines/[^/:]+:streamQuery$"
+)
+MAX_BODY_BYTES = 1024 * 1024
+
+
+def _status(code: int) -> str:
+    return {
+        400: "INVALID_ARGUMENT",
+        404: "NOT_FOUND",
+        405: "METHOD_NOT_ALLOWED",
+        413: "PAYLOAD_TOO_LARGE",
+        429: "RESOURCE_EXHAUSTED",
+        500: "INTERNAL",
+        503: "UNAVAILABLE",
+    }.get(code, "UNKNOWN")
+
+
+def _error_body(code: int, message: str) -> dict[str, Any]:
+    return {"error": {"code": code, "message": message, "status": _status(code)}}
+
+
+def _dump_event(event: Any) -> dict[str, Any]:
+    # Same encoding as AdkApp.stream_query.
+    return event.model_dump(mode="json", exclude_none=True)
+
+
+class StreamQueryServer:
+    """
+    An ASGI app that serves ``root_agent`` over the Agent Engine
+    ``:streamQuery`` interface, for local load testing and latency profiling.
+
+    ``POST .../reasoningEngines/<id>:streamQuery`` takes
+    ``{"input": {"message": ..., "user_id": ..., "session_id": ...}}`` and streams
+    every event of every sub-agent as it is emitted: as server-sent events with
+    ``?alt=sse``, as newline-delimited JSON otherwise. Without a ``session_id``, a
+    new session is created.
+
+    Concurrency is bounded by a CampaignWorker: ``max_sessions`` queries run at
+    once and up to ``max_queue`` more wait for a slot. Beyond that, requests are
+    rejected with 429 and ``Retry-After``. While a query waits or a model call is
+    in flight, SSE streams carry a comment every ``keepalive_s`` seconds. At most
+    ``buffer_events`` events are buffered per stream, so a slow reader slows its
+    own run down instead of growing memory. Shutdown drains the worker.
+    ``GET /healthz`` reports the load.
+    """
+
+    def __init__(
+        self,
+        runner: Runner | None = None,
+        max_sessions: int = 16,
+        max_queue: int = 16,
+        keepalive_s: float = 15.0,
+        buffer_events: int = 32,
+        drain_timeout_s: float = 60.0,
+    ) -> None:
+        """
+        :param runner: Runner to serve; defaults to one around the cached root agent
+        :param max_sessions: Queries running at once
+        :param max_queue: Queries waiting for a slot before new ones get 429
+        :param keepalive_s: Interval of SSE keep-alive comments
+        :param buffer_events: Events buffered per stream before the run waits for the client
+        :param drain_timeout_s: How long shutdown waits for running queries
+        """
+        self._runner = runner
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self.keepalive_s = keepalive_s
+        self.buffer_events = buffer_events
+        self.drain_timeout_s = drain_timeout_s
+        self._worker: CampaignWorker | None = None
+        # Requests accepted but not yet running in the worker, so that concurrent
+        # requests cannot all pass the capacity check at once.
+        self._admitting = 0
+
+    @property
+    def worker(self) -> CampaignWorker:
+        return self._ensure_worker()
+
+    def _ensure_worker(self) -> CampaignWorker:
+        if self._worker is None:
+            self._worker = CampaignWorker(
+                self._runner or build_runner(), max_sessions=self.max_sessions
+            )
+        return self._worker
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                # Build the agents before the first request rather than during it.
+                self._ensure_worker()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._worker and not await self._worker.drain(self.drain_timeout_s):
+                    logger.warning(
+                        "Shutting down with %d queries in flight",
+                        self._worker.in_flight,
+                    )
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path, method = scope["path"], scope["method"]
+        if path == "/healthz" and method == "GET":
+            worker = self.worker
+            status = 503 if worker.draining else 200
+            await self._send_json(
+                send,
+                status,
+                {
+                    "status": "draining" if worker.draining else "ok",
+                    "in_flight": worker.in_flight,
+                    "waiting": worker.waiting,
+                    "max_sessions": self.max_sessions,
+                    "max_queue": self.max_queue,
+                    **worker.stats,
+                },
+            )
+            return
+        if not STREAM_QUERY_PATH.match(path):
+            await self._send_json(send, 404, _error_body(404, f"No route for {path}"))
+            return
+        if method != "POST":
+            await self._send_json(send, 405, _error_body(405, "Use POST"))
+            return
+
+        body = await self._read_body(receive)
+        if body is None:
+            await self._send_json(send, 413, _error_body(413, "Request body too large"))
+            return
+        try:
+            payload = json.loads(body or b"{}")
+            query = payload["input"]
+            message, user_id = query["message"], query["user_id"]
+        except (ValueError, KeyError, TypeError):
+            await self._send_json(
+                send,
+                400,
+                _error_body(
+                    400, 'Expected {"input": {"message": ..., "user_id": ...}}'
+                ),
+            )
+            return
+
+        worker = self.worker
+        if worker.draining:
+            await self._send_json(
+                send, 503, _error_body(503, "Server is shutting down")
+            )
+            return
+        if worker.in_flight + self._admitting >= self.max_sessions + self.max_queue:
+            await self._send_json(
+                send,
+                429,
+                _error_body(429, "429 Too Many Requests: all sessions are busy"),
+                headers=[(b"retry-after", b"1")],
+            )
+            return
+
+        self._admitting += 1
+        admitted = False
+
+        def admit() -> None:
+            # Called as the query enters worker.stream, which counts it as in
+            # flight in the same step.
+            nonlocal admitted
+            self._admitting -= 1
+            admitted = True
+
+        try:
+            session_service = worker.runner.session_service
+            app_name = worker.runner.app_name
+            session_id = query.get("session_id")
+            if session_id:
+                session = await session_service.get_session(
+                    app_name=app_name, user_id=user_id, session_id=session_id
+                )
+                if session is None:
+                    await self._send_json(
+                        send, 404, _error_body(404, f"Session {session_id} not found")
+                    )
+                    return
+            else:
+                session = await session_service.create_session(
+                    app_name=app_name, user_id=user_id
+                )
+            sse = parse_qs(scope.get("query_string", b"").decode()).get("alt") == [
+                "sse"
+            ]
+            await self._stream(send, receive, sse, user_id, session.id, message, admit)
+        finally:
+            if not admitted:
+                self._admitting -= 1
+
+    async def _stream(
+        self,
+        send: Send,
+        receive: Receive,
+        sse: bool,
+        user_id: str,
+        session_id: str,
+        message: str,
+        admit: Callable[[], None],
+    ) -> None:
+        events: asyncio.Queue[tuple[str, Any]] = asyncio.Queue(
+            maxsize=self.buffer_events
+        )
+        new_message = genai_types.Content(
+            role="user", parts=[genai_types.Part.from_text(text=message)]
+        )
+
+        async def produce() -> None:
+            admit()
+            try:
+                async for event in self.worker.stream(user_id, session_id, new_message):
+                    await events.put(("event", _dump_event(event)))
+            except WorkerDraining:
+                await events.put(("error", _error_body(503, "Server is shutting down")))
+            except Exception as e:
+                logger.exception("Query in session %s failed", session_id)
+                await events.put(
+                    ("error", _error_body(500, f"{type(e).__name__}: {e}"))
+                )
+            await events.put(("end", None))
+
+        async def disconnected() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        producer = asyncio.create_task(produce())
+        watcher = asyncio.create_task(disconnected())
+        try:
+            content_type = b"text/event-stream" if sse else b"application/json"
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [
+                        (b"content-type", content_type),
+                        (b"cache-control", b"no-cache"),
+                        (b"x-session-id", session_id.encode()),
+                    ],
+                }
+            )
+            while True:
+                getter = asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait(
+                    {getter, watcher},
+                    timeout=self.keepalive_s,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if watcher in done:
+                    getter.cancel()
+                    return
+                if not done:
+                    getter.cancel()
+                    if sse:
+                        await send(
+                            {
+                                "type": "http.response.body",
+                                "body": b": keep-alive\n\n",
+                                "more_body": True,
+                            }
+                        )
+                    continue
+                kind, data = getter.result()
+                if kind == "end":
+                    break
+                chunk = json.dumps(data)
+                body = f"data: {chunk}\n\n" if sse else f"{chunk}\n"
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": body.encode(),
+                        "more_body": True,
+                    }
+                )
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            # A client that goes away cancels its run and frees its session slot.
+            producer.cancel()
+            watcher.cancel()
+            await asyncio.gather(producer, watcher, return_exceptions=True)
+
+    @staticmethod
+    async def _read_body(receive: Receive) -> bytes | None:
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if len(body) > MAX_BODY_BYTES:
+                return None
+            if not message.get("more_body"):
+                return body
+
+    @staticmethod
+    async def _send_json(
+        send: Send,
+        status: int,
+        body: dict[str, Any],
+        headers: list[tuple[bytes, bytes]] | None = None,
+    ) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"application/json"), *(headers or [])],
+            }
+        )
+        await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+
+def create_app() -> StreamQueryServer:
+    """Returns the server configured from the environment.
+
+    ``SESSION_CONCURRENCY`` (default 16) queries run at once, ``SERVER_MAX_QUEUE``
+    (default: the same) more may wait, and ``SERVER_KEEPALIVE_S`` (default 15)
+    spaces SSE keep-alive comments.
+    """
+    _, sessions = worker_settings()
+    return StreamQueryServer(
+        max_sessions=sessions,
+        max_queue=int(os.environ.get("SERVER_MAX_QUEUE", str(sessions))),
+        keepalive_s=float(os.environ.get("SERVER_KEEPALIVE_S", "15")),
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(
+        description="Serve root_agent over a local :streamQuery endpoint"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=worker_settings()[0],
+        help="Server processes (defaults to NUM_WORKERS or 1)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(
+        "app.local_server:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_keep_alive=75,
+        timeout_graceful_shutdown=60,
+    )
@@ -0,0 +1,131 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections.abc import Callable
+
+from app.utils.catalog import BaselineImageCatalog
+
+_CHUNK_BYTES = 1024 * 1024
+# Keys share a fixed set of locks, so the store does not keep one lock per key.
+_LOCK_STRIPES = 64
+
+
+def file_digest(path: str) -> str:
+    """Returns the sha256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AssetStore:
+    """
+    A content-addressed store for generated assets.
+
+    Assets are keyed on a hash of the generation model, the prompt and the
+    content of the baseline image, so identical requests resolve to the same
+    file and are only generated once. Files are written to a temporary file in
+    the store directory and renamed into place, so concurrent writers (threads
+    or processes) never observe a partially written asset.
+    """
+
+    def __init__(
+        self, root_dir: str, catalog: BaselineImageCatalog | None = None
+    ) -> None:
+        """
+        :param root_dir: Directory the assets are stored in
+        :param catalog: Catalog used to look up baseline image hashes without re-reading them
+        """
+        self.root_dir = root_dir
+        self.catalog = catalog
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+    def baseline_digest(self, baseline_image_path: str) -> str:
+        """Returns a digest identifying the content of a baseline image.
+
+        Paths that do not exist are identified by the path itself, so a request
+        with a bogus path is still cached consistently.
+        """
+        if self.catalog is not None:
+            try:
+                entry = self.catalog.get(baseline_image_path)
+            except FileNotFoundError:
+                entry = None
+            if entry is not None:
+                return entry.sha256
+        try:
+            return file_digest(baseline_image_path)
+        except OSError:
+            return "path:" + baseline_image_path
+
+    def key(self, model: str, prompt: str, baseline_image_path: str) -> str:
+        """Returns the content address for a generation request."""
+        material = json.dumps(
+            [model, prompt, self.baseline_digest(baseline_image_path)]
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def path_for(self, key: str, extension: str) -> str:
+        """Returns the path an asset with ``key`` is stored at."""
+        return os.path.join(self.root_dir, f"{key[:32]}{extension}")
+
+    def get(self, key: str, extension: str) -> str | None:
+        """Returns the path of a stored asset, or ``None`` if it does not exist."""
+        path = self.path_for(key, extension)
+        return path if os.path.exists(path) else None
+
+    def put(self, key: str, extension: str, data: bytes) -> str:
+        """Atomically stores ``data`` under ``key`` and returns its path."""
+        os.makedirs(self.root_dir, exist_ok=True)
+        path = self.path_for(key, extension)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def get_or_create(
+        self, key: str, extension: str, generate: Callable[[], bytes]
+    ) -> tuple[str, bool]:
+        """Returns the asset for ``key``, generating and storing it on a miss.
+
+        Concurrent requests for the same key within a process wait for the
+        first one instead of generating the asset again. Keys are spread over a
+        fixed number of locks, so requests for two different keys occasionally
+        share one and generate one after the other.
+
+        :return: The asset path and whether it was served from the store
+        """
+        path = self.get(key, extension)
+        if path is not None:
+            return path, True
+        with self._lock_for(key):
+            path = self.get(key, extension)
+            if path is not None:
+                return path, True
+            return self.put(key, extension, generate()), False
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        return self._locks[hash(key) % len(self._locks)]
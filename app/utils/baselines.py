@@ -0,0 +1,121 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import hashlib
+import os
+import random
+from collections.abc import AsyncGenerator, Callable
+from typing import Literal
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai import types as genai_types
+from pydantic import Field
+
+
+def parse_weights(spec: str) -> dict[str, float]:
+    """Parses ``file=weight,file=weight`` into a dict keyed by file name."""
+    weights = {}
+    for item in spec.split(","):
+        if item.strip():
+            name, weight = item.split("=", 1)
+            weights[name.strip()] = float(weight)
+    return weights
+
+
+def select_baseline(
+    paths: list[str],
+    seed: str,
+    strategy: Literal["deterministic", "weighted"] = "deterministic",
+    weights: dict[str, float] | None = None,
+) -> str:
+    """
+    Selects a baseline image in code instead of asking the model to pick one.
+
+    Both strategies depend only on ``seed`` (the user's intent), so a campaign is
+    reproducible while different campaigns spread across the catalog.
+    ``deterministic`` picks uniformly; ``weighted`` picks by the weight of each
+    file name (default 1).
+    """
+    if not paths:
+        raise ValueError("No baseline images to select from")
+    digest = int(hashlib.sha256(seed.encode()).hexdigest(), 16)
+    if strategy == "deterministic":
+        return paths[digest % len(paths)]
+    weights = weights or {}
+    return random.Random(digest).choices(
+        paths, weights=[weights.get(os.path.basename(p), 1.0) for p in paths]
+    )[0]
+
+
+class BaselineSelectionAgent(BaseAgent):
+    """
+    Puts the baseline catalog into session state and selects the baseline image.
+
+    It runs once per campaign, before any model call, and writes
+    ``baseline_images`` (all catalog paths) and ``selected_baseline_image``.
+    The generation agents read both from their instructions, so they no longer
+    spend a model turn calling ``list_baseline_images`` and picking a path.
+
+    When the catalog is missing or empty, there is nothing to generate from: it
+    writes the reason to ``pipeline_error`` instead and escalates, which ends
+    the pipeline before any generation stage runs.
+    """
+
+    catalog: Callable[[], list[str]]
+    strategy: Literal["deterministic", "weighted"] = "deterministic"
+    weights: dict[str, float] = Field(default_factory=dict)
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        try:
+            paths = await asyncio.to_thread(self.catalog)
+        except FileNotFoundError as e:
+            paths, reason = [], f"Baseline image directory not found: {e}"
+        else:
+            reason = "No baseline images found"
+        if not paths:
+            message = f"{reason}. Skipping asset generation."
+            yield Event(
+                invocation_id=ctx.invocation_id,
+                author=self.name,
+                branch=ctx.branch,
+                content=genai_types.Content(
+                    role="model", parts=[genai_types.Part(text=message)]
+                ),
+                actions=EventActions(
+                    state_delta={"baseline_images": [], "pipeline_error": message},
+                    escalate=True,
+                ),
+            )
+            return
+        intent = ""
+        if ctx.user_content and ctx.user_content.parts:
+            intent = " ".join(part.text or "" for part in ctx.user_content.parts)
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(
+                state_delta={
+                    "baseline_images": paths,
+                    "selected_baseline_image": select_baseline(
+                        paths, intent, self.strategy, self.weights
+                    ),
+                }
+            ),
+        )
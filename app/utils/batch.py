@@ -0,0 +1,221 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, TextIO
+
+from google.adk.runners import Runner
+from google.genai import types as genai_types
+
+
+@dataclass(frozen=True)
+class CampaignIntent:
+    """A single business intent to run through the marketing pipeline."""
+
+    id: str
+    intent: str
+
+
+def intent_id(intent: str) -> str:
+    """Returns a stable identifier for an intent that has no explicit id."""
+    return hashlib.sha1(intent.strip().encode()).hexdigest()[:12]
+
+
+def load_intents(path: str) -> list[CampaignIntent]:
+    """Loads campaign intents from a JSONL file.
+
+    Each line is either a JSON string or an object with an ``intent`` field and
+    an optional ``id`` field. Blank lines are ignored.
+
+    Args:
+        path: Path to the JSONL file.
+    """
+    intents = []
+    with open(path) as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                text, record_id = record, None
+            elif isinstance(record, dict) and "intent" in record:
+                text, record_id = record["intent"], record.get("id")
+            else:
+                raise ValueError(f"{path}:{line_no}: expected an 'intent' field")
+            intents.append(
+                CampaignIntent(id=str(record_id or intent_id(text)), intent=text)
+            )
+    return intents
+
+
+def load_completed_ids(path: str) -> set[str]:
+    """Returns the ids of intents that already have a successful result.
+
+    Unparseable lines (e.g. a line torn by a crash mid-write) are skipped, so
+    the corresponding intent is simply run again.
+    """
+    if not os.path.exists(path):
+        return set()
+    completed = set()
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict) and record.get("status") == "ok":
+                completed.add(str(record["id"]))
+    return completed
+
+
+async def run_campaign(
+    runner: Runner, intent: CampaignIntent, user_id: str = "batch_user"
+) -> dict[str, Any]:
+    """Runs one intent through the runner and returns its result record.
+
+    Stage timings are derived from the event stream: a stage starts at the last
+    event emitted before its own first event (so parallel branches share the
+    same start) and ends at its own last event.
+    """
+    session = await runner.session_service.create_session(
+        app_name=runner.app_name, user_id=user_id
+    )
+    message = genai_types.Content(
+        role="user", parts=[genai_types.Part.from_text(text=intent.intent)]
+    )
+
+    start = time.perf_counter()
+    last_event_at = 0.0
+    stages: dict[str, dict[str, float]] = {}
+    state: dict[str, Any] = {}
+    async for event in runner.run_async(
+        user_id=user_id, session_id=session.id, new_message=message
+    ):
+        now = time.perf_counter() - start
+        if event.author and event.author != "user":
+            stage = stages.setdefault(
+                event.author, {"start_s": last_event_at, "end_s": now}
+            )
+            stage["end_s"] = now
+        if event.actions and event.actions.state_delta:
+            state.update(event.actions.state_delta)
+        last_event_at = now
+
+    for stage in stages.values():
+        stage["duration_s"] = stage["end_s"] - stage["start_s"]
+        for key, value in stage.items():
+            stage[key] = round(value, 3)
+
+    record: dict[str, Any] = {
+        "id": intent.id,
+        "intent": intent.intent,
+        "status": "ok",
+        "twitter_post": state.get("twitter_post"),
+        "generated_image_path": state.get("generated_image_path"),
+        "generated_video_path": state.get("generated_video_path"),
+        "timings": stages,
+        "total_s": round(time.perf_counter() - start, 3),
+    }
+    if not record["twitter_post"]:
+        record["status"] = "error"
+        record["error"] = (
+            state.get("pipeline_error") or "Pipeline finished without a twitter_post"
+        )
+    return record
+
+
+def _open_output(path: str) -> TextIO:
+    """Opens the output file for appending, repairing a torn last line."""
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    out = open(path, "a+")
+    if out.tell() > 0:
+        out.seek(out.tell() - 1)
+        if out.read(1) != "\n":
+            out.write("\n")
+    return out
+
+
+async def run_batch(
+    runner: Runner,
+    intents: list[CampaignIntent],
+    output_path: str,
+    concurrency: int = 8,
+    resume: bool = True,
+) -> dict[str, int]:
+    """Runs intents concurrently through one shared runner.
+
+    Each result is appended to ``output_path`` as soon as its campaign finishes.
+    With ``resume`` set, intents that already have a successful result in the
+    output file are skipped.
+
+    Args:
+        runner: The shared runner, built once for the whole batch.
+        intents: The intents to run.
+        output_path: JSONL file that results are streamed to.
+        concurrency: Maximum number of campaigns in flight at once.
+        resume: Skip intents already completed in ``output_path``.
+
+    Returns:
+        Counts of ``ok``, ``error`` and ``skipped`` campaigns.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    completed = load_completed_ids(output_path) if resume else set()
+    pending: asyncio.Queue[CampaignIntent] = asyncio.Queue()
+    seen = set(completed)
+    for intent in intents:
+        if intent.id not in seen:
+            seen.add(intent.id)
+            pending.put_nowait(intent)
+    counts = {"ok": 0, "error": 0, "skipped": len(intents) - pending.qsize()}
+
+    with _open_output(output_path) as out:
+
+        async def worker() -> None:
+            while True:
+                try:
+                    intent = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    record = await run_campaign(runner, intent)
+                except Exception as e:
+                    logging.exception(f"Campaign {intent.id} failed")
+                    record = {
+                        "id": intent.id,
+                        "intent": intent.intent,
+                        "status": "error",
+                        "error": f"{type(e).__name__}: {e}",
+                    }
+                counts[record["status"]] += 1
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                logging.info(
+                    f"Campaign {intent.id} finished with status {record['status']}"
+                )
+
+        workers = min(concurrency, pending.qsize())
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+    return counts
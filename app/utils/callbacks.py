@@ -0,0 +1,41 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections.abc import Callable
+from typing import Any
+
+from google.adk.agents import BaseAgent
+
+
+def add_callback(agent: BaseAgent, name: str, callback: Callable[..., Any]) -> None:
+    """Appends a callback to an agent without replacing the ones already set.
+
+    ADK runs a list of callbacks in order and stops at the first one that
+    returns a value, so callbacks added later only run when earlier ones do not
+    short-circuit.
+
+    Args:
+        agent: The agent to attach the callback to.
+        name: The callback attribute, e.g. ``before_model_callback``.
+        callback: The callback to append.
+    """
+    existing = getattr(agent, name)
+    if existing is None:
+        callbacks = []
+    elif isinstance(existing, list):
+        callbacks = list(existing)
+    else:
+        callbacks = [existing]
+    callbacks.append(callback)
+    setattr(agent, name, callbacks)
@@ -0,0 +1,325 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import threading
+from dataclasses import dataclass, field
+from typing import Any
+
+INDEX_VERSION = 1
+TAGS_FILE = "tags.json"
+_HEADER_BYTES = 256 * 1024
+_CHUNK_BYTES = 1024 * 1024
+
+
+@dataclass
+class BaselineImage:
+    """Index entry for a single baseline merchandise image."""
+
+    path: str
+    size: int
+    mtime_ns: int
+    sha256: str
+    width: int | None = None
+    height: int | None = None
+    tags: list[str] = field(default_factory=list)
+
+    @property
+    def orientation(self) -> str | None:
+        """Returns ``portrait``, ``landscape`` or ``square`` when dimensions are known."""
+        if not self.width or not self.height:
+            return None
+        if self.width == self.height:
+            return "square"
+        return "portrait" if self.height > self.width else "landscape"
+
+
+def _png_dimensions(header: bytes) -> tuple[int, int] | None:
+    if header[:8] != b"\x89PNG\r\n\x1a\n" or header[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", header[16:24])
+
+
+def _jpeg_dimensions(header: bytes) -> tuple[int, int] | None:
+    if header[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(header):
+        if header[i] != 0xFF:
+            return None
+        marker = header[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        (length,) = struct.unpack(">H", header[i + 2 : i + 4])
+        # SOFn markers carry the frame size; C4, C8 and CC are not frames.
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", header[i + 5 : i + 9])
+            return width, height
+        i += 2 + length
+    return None
+
+
+def _filename_tags(file_name: str) -> list[str]:
+    stem = os.path.splitext(file_name)[0].lower()
+    return [
+        token
+        for token in re.split(r"[^a-z0-9]+", stem)
+        if token and not token.isdigit()
+    ]
+
+
+def _index_file(path: str, stat: os.stat_result) -> BaselineImage:
+    """Reads a single image once to compute its content hash and dimensions."""
+    digest = hashlib.sha256()
+    header = b""
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK_BYTES):
+            if len(header) < _HEADER_BYTES:
+                header += chunk[: _HEADER_BYTES - len(header)]
+            digest.update(chunk)
+    dimensions = _png_dimensions(header) or _jpeg_dimensions(header)
+    return BaselineImage(
+        path=path,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        sha256=digest.hexdigest(),
+        width=dimensions[0] if dimensions else None,
+        height=dimensions[1] if dimensions else None,
+    )
+
+
+def _image_tags(entry: BaselineImage, extra_tags: list[str]) -> list[str]:
+    tags = _filename_tags(os.path.basename(entry.path)) + [
+        t.lower() for t in extra_tags
+    ]
+    if entry.orientation:
+        tags.append(entry.orientation)
+    return sorted(set(tags))
+
+
+class BaselineImageCatalog:
+    """
+    An index of the baseline merchandise images, persisted to disk.
+
+    The index is built once with the size, dimensions, content hash and tags of
+    every image. Afterwards, lookups are answered from memory and the only
+    filesystem access per lookup is a ``stat`` of the image directory, plus one
+    of the image itself for ``get``. When the directory or the image changes, it
+    is rescanned incrementally: only files whose size or mtime changed are read
+    and hashed again.
+
+    Tags are derived from the file name (``red_cat_tee.png`` is tagged ``red``,
+    ``cat`` and ``tee``), the image orientation, and an optional ``tags.json``
+    file in the image directory that maps file names to extra tags.
+    """
+
+    def __init__(
+        self,
+        image_dir: str = "images_baseline",
+        index_path: str | None = None,
+        extensions: tuple[str, ...] = (".png",),
+    ) -> None:
+        """
+        :param image_dir: Directory holding the baseline images
+        :param index_path: Where to persist the index; ``None`` keeps it in memory only
+        :param extensions: File extensions to include in the catalog
+        """
+        self.image_dir = image_dir
+        self.index_path = index_path
+        self.extensions = extensions
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._dir_mtime_ns: int | None = None
+        self._entries: dict[str, BaselineImage] = {}
+        self._paths: list[str] = []
+        self._by_tag: dict[str, list[str]] = {}
+
+    def paths(self) -> list[str]:
+        """Returns the paths of all images in the catalog, sorted by name.
+
+        :raises FileNotFoundError: If the image directory does not exist
+        """
+        self._ensure_fresh()
+        return list(self._paths)
+
+    def get(self, path: str) -> BaselineImage | None:
+        """Returns the index entry for ``path``, if it is in the catalog."""
+        self._ensure_fresh()
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        # Rewriting a file in place leaves the directory mtime unchanged, so the
+        # entry is checked against the file itself before its hash is trusted.
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+            return entry
+        with self._lock:
+            self._rescan()
+            return self._entries.get(path)
+
+    def query(self, tag: str | None = None, **attributes: Any) -> list[BaselineImage]:
+        """Returns the images carrying ``tag`` whose attributes match exactly.
+
+        Example: ``catalog.query(tag="cat", orientation="portrait")``.
+        """
+        self._ensure_fresh()
+        paths = self._by_tag.get(tag.lower(), []) if tag else self._paths
+        entries = [self._entries[p] for p in paths]
+        return [
+            entry
+            for entry in entries
+            if all(
+                getattr(entry, key, None) == value for key, value in attributes.items()
+            )
+        ]
+
+    def refresh(self, force: bool = False) -> None:
+        """Rescans the image directory, re-indexing only files that changed.
+
+        :param force: Re-read and re-hash every file, ignoring recorded mtimes
+        """
+        with self._lock:
+            self._load()
+            self._rescan(force=force)
+
+    def _ensure_fresh(self) -> None:
+        dir_mtime_ns = os.stat(self.image_dir).st_mtime_ns
+        if self._loaded and dir_mtime_ns == self._dir_mtime_ns:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._load()
+                self._rescan()
+            elif dir_mtime_ns != self._dir_mtime_ns:
+                self._rescan()
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION:
+                return
+            self._entries = {
+                e["path"]: BaselineImage(**e) for e in data.get("entries", [])
+            }
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable catalog index {self.index_path}: {e}")
+            self._entries = {}
+
+    def _load_extra_tags(self) -> dict[str, list[str]]:
+        tags_path = os.path.join(self.image_dir, TAGS_FILE)
+        if not os.path.exists(tags_path):
+            return {}
+        try:
+            with open(tags_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable tags file {tags_path}: {e}")
+            return {}
+
+    def _rescan(self, force: bool = False) -> None:
+        dir_mtime_ns = os.stat(self.image_dir).st_mtime_ns
+        extra_tags = self._load_extra_tags()
+        entries: dict[str, BaselineImage] = {}
+        changed = False
+        for file_name in sorted(os.listdir(self.image_dir)):
+            if not file_name.endswith(self.extensions):
+                continue
+            path = os.path.join(self.image_dir, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entry = self._entries.get(path)
+            if (
+                force
+                or entry is None
+                or entry.mtime_ns != stat.st_mtime_ns
+                or entry.size != stat.st_size
+            ):
+                entry = _index_file(path, stat)
+                changed = True
+            tags = _image_tags(entry, extra_tags.get(file_name, []))
+            if tags != entry.tags:
+                entry.tags = tags
+                changed = True
+            entries[path] = entry
+
+        changed = changed or entries.keys() != self._entries.keys()
+        self._entries = entries
+        self._paths = list(entries)
+        by_tag: dict[str, list[str]] = {}
+        for path, entry in entries.items():
+            for tag in entry.tags:
+                by_tag.setdefault(tag, []).append(path)
+        self._by_tag = by_tag
+        self._dir_mtime_ns = dir_mtime_ns
+        if changed:
+            self._save()
+
+    def _save(self) -> None:
+        if not self.index_path:
+            return
+        data = {
+            "version": INDEX_VERSION,
+            "image_dir": self.image_dir,
+            "entries": [dataclasses.asdict(e) for e in self._entries.values()],
+        }
+        try:
+            parent = os.path.dirname(self.index_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            logging.warning(f"Unable to persist catalog index {self.index_path}: {e}")
+
+
+_catalogs: dict[str, BaselineImageCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(image_dir: str = "images_baseline") -> BaselineImageCatalog:
+    """Returns the process-wide catalog for ``image_dir``, creating it on first use.
+
+    The index is persisted under ``$BASELINE_CATALOG_DIR`` (default ``.cache``).
+    """
+    key = os.path.abspath(image_dir)
+    with _catalogs_lock:
+        catalog = _catalogs.get(key)
+        if catalog is None:
+            index_dir = os.environ.get("BASELINE_CATALOG_DIR", ".cache")
+            index_name = f"catalog-{hashlib.sha1(key.encode()).hexdigest()[:12]}.json"
+            catalog = BaselineImageCatalog(
+                image_dir=image_dir, index_path=os.path.join(index_dir, index_name)
+            )
+            _catalogs[key] = catalog
+        return catalog
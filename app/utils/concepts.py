@@ -0,0 +1,79 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+
+_BULLET = re.compile(r"^\s*(?:[*\-•]|\d+[.)])\s+")
+
+
+class ConceptStreamParser:
+    """
+    Splits a streamed bulleted list into concepts as soon as each one is complete.
+
+    A concept is complete when the next bullet starts or the stream ends.
+    Continuation lines belong to the current bullet, and text before the first
+    bullet is ignored. If the whole text has no bullets, it is a single concept.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._current: list[str] = []
+        self._preamble: list[str] = []
+        self._seen_bullet = False
+
+    def feed(self, text: str) -> list[str]:
+        """Adds streamed text and returns the concepts completed by it."""
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        completed = []
+        for line in lines:
+            concept = self._add_line(line)
+            if concept:
+                completed.append(concept)
+        if self._current and _BULLET.match(self._buffer):
+            # The next bullet has started, so the current one cannot grow any more.
+            concept = self._flush()
+            if concept:
+                completed.append(concept)
+        return completed
+
+    def close(self) -> list[str]:
+        """Ends the stream and returns the remaining concepts."""
+        completed = self.feed("\n")
+        last = self._flush()
+        if last:
+            completed.append(last)
+        if not self._seen_bullet:
+            text = " ".join(line.strip() for line in self._preamble if line.strip())
+            if text:
+                completed.append(text)
+            self._preamble = []
+        return completed
+
+    def _add_line(self, line: str) -> str | None:
+        if _BULLET.match(line):
+            self._seen_bullet = True
+            finished = self._flush()
+            self._current = [_BULLET.sub("", line, count=1)]
+            return finished
+        if self._current:
+            self._current.append(line)
+        else:
+            self._preamble.append(line)
+        return None
+
+    def _flush(self) -> str | None:
+        text = " ".join(line.strip() for line in self._current if line.strip())
+        self._current = []
+        return text or None
@@ -0,0 +1,207 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import os
+import time
+from collections.abc import AsyncGenerator, Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.genai import types as genai_types
+from pydantic import Field
+
+from app.utils.concepts import ConceptStreamParser
+
+# Rotated across variants so that variants of one concept and baseline differ.
+VARIANT_STYLES = (
+    "golden-hour light, wide establishing shot",
+    "close-up, shallow depth of field",
+    "candid street-photography style",
+    "bright midday light, vivid colors",
+)
+
+
+@dataclass(frozen=True)
+class AssetGenerator:
+    """A kind of asset produced by the fan-out, and the model that produces it.
+
+    ``generate(prompt, baseline_image_path)`` returns the asset path and whether
+    it was served from the asset cache.
+    """
+
+    kind: str
+    model: str
+    generate: Callable[[str, str], Awaitable[tuple[str, bool]]]
+
+
+def parse_model_limits(spec: str) -> dict[str, int]:
+    """Parses ``model=limit,model=limit`` into a dict."""
+    limits = {}
+    for item in spec.split(","):
+        if item.strip():
+            model, limit = item.split("=", 1)
+            limits[model.strip()] = int(limit)
+    return limits
+
+
+def variant_prompt(intent: str, concept: str, variant: int) -> str:
+    """Builds the generation prompt of one variant."""
+    style = VARIANT_STYLES[variant % len(VARIANT_STYLES)]
+    return f"{intent.strip()} Scene: {concept} Photographic style: {style}."
+
+
+def format_variants(variants: list[dict[str, Any]]) -> str:
+    """Renders the variant list for the publisher's instruction."""
+    lines = [
+        "Several variants were generated for A/B testing. Rank the successful ones "
+        "from most to least engaging for this campaign and list the ranking by id. "
+        "Attach the top-ranked variant to the tweet instead of the assets above.",
+    ]
+    for variant in variants:
+        if variant["status"] != "ok":
+            continue
+        lines.append(
+            f"- [{variant['id']}] {variant['kind']}, concept: {variant['concept']} "
+            f"baseline: {os.path.basename(variant['baseline'])}, path: {variant['path']}"
+        )
+    return "\n".join(lines)
+
+
+class VariantFanOutAgent(BaseAgent):
+    """
+    Generates a matrix of asset variants without any model turn.
+
+    For each of the first ``max_concepts`` concepts in ``state[concepts_key]``,
+    each of the first ``max_baselines`` baseline images (from
+    ``state["baseline_images"]`` when a selection stage has set it, otherwise
+    from ``baselines()``) and each generator, it
+    produces ``variants`` variants. All of them run concurrently, limited to
+    ``concurrency`` at once overall and by ``model_concurrency`` per model.
+
+    A job waits for a slot of its own model before taking a global slot. So
+    queued jobs of a slow model, such as video, never hold global slots that
+    other models' jobs could use.
+
+    The results go to ``state["variants"]`` as a list of dicts, with a text
+    rendering in ``state["variants_summary"]``. The first successful asset of
+    each kind also goes to ``generated_<kind>_path`` for agents that expect a
+    single asset; when every variant of a kind failed, that key holds a note
+    saying so, so instructions that interpolate it still render.
+    """
+
+    generators: list[AssetGenerator]
+    baselines: Callable[[], list[str]]
+    variants: int = 1
+    max_concepts: int = 3
+    max_baselines: int = 2
+    concurrency: int = 8
+    model_concurrency: dict[str, int] = Field(default_factory=dict)
+    concepts_key: str = "visual_concepts"
+
+    def _concepts(self, ctx: InvocationContext) -> list[str]:
+        parser = ConceptStreamParser()
+        text = str(ctx.session.state.get(self.concepts_key, ""))
+        return (parser.feed(text) + parser.close())[: self.max_concepts]
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        intent = ""
+        if ctx.user_content and ctx.user_content.parts:
+            intent = " ".join(part.text or "" for part in ctx.user_content.parts)
+        baselines: list[str] = ctx.session.state.get("baseline_images") or []
+        if not baselines:
+            baselines = await asyncio.to_thread(self.baselines)
+        baselines = baselines[: self.max_baselines]
+        jobs = [
+            {
+                "id": f"{generator.kind}-c{c + 1}-b{b + 1}-v{v + 1}",
+                "kind": generator.kind,
+                "model": generator.model,
+                "concept": concept,
+                "baseline": baseline,
+                "variant": v + 1,
+                "prompt": variant_prompt(intent, concept, v),
+                "generator": generator,
+            }
+            for c, concept in enumerate(self._concepts(ctx))
+            for b, baseline in enumerate(baselines)
+            for v in range(self.variants)
+            for generator in self.generators
+        ]
+
+        # Semaphores belong to the running event loop, so they are created per run.
+        global_slots = asyncio.Semaphore(self.concurrency)
+        model_slots = {
+            generator.model: asyncio.Semaphore(
+                self.model_concurrency.get(generator.model, self.concurrency)
+            )
+            for generator in self.generators
+        }
+
+        async def run(job: dict[str, Any]) -> dict[str, Any]:
+            generator = job.pop("generator")
+            async with model_slots[generator.model], global_slots:
+                start = time.perf_counter()
+                try:
+                    path, cached = await generator.generate(
+                        job["prompt"], job["baseline"]
+                    )
+                    job.update(status="ok", path=path, cached=cached)
+                except Exception as e:
+                    logging.warning(f"Variant {job['id']} failed: {e}")
+                    job.update(status="error", error=str(e), path=None, cached=False)
+                job["duration_s"] = round(time.perf_counter() - start, 3)
+            return job
+
+        results = await asyncio.gather(*(run(job) for job in jobs))
+
+        state_delta: dict[str, Any] = {
+            "variants": results,
+            "variants_summary": format_variants(results),
+        }
+        for generator in self.generators:
+            first = next(
+                (
+                    r
+                    for r in results
+                    if r["kind"] == generator.kind and r["status"] == "ok"
+                ),
+                None,
+            )
+            state_delta[f"generated_{generator.kind}_path"] = (
+                first["path"]
+                if first is not None
+                else f"No {generator.kind} was generated: every variant failed."
+            )
+        succeeded = sum(r["status"] == "ok" for r in results)
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            content=genai_types.Content(
+                role="model",
+                parts=[
+                    genai_types.Part(
+                        text=f"Generated {succeeded} of {len(results)} variants."
+                    )
+                ],
+            ),
+            actions=EventActions(state_delta=state_delta),
+        )
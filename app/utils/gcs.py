@@ -13,9 +13,106 @@
 # limitations under the License.
 
 import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Protocol
 
-import google.cloud.storage as storage
-from google.api_core import exceptions
+if TYPE_CHECKING:
+    import google.cloud.storage as storage
+
+
+class PayloadStore(Protocol):
+    """Where large span payloads are offloaded to.
+
+    Implementations must be safe to call from multiple threads.
+    """
+
+    def available(self) -> bool:
+        """Returns whether uploads can currently succeed."""
+        ...
+
+    def upload(
+        self,
+        name: str,
+        data: bytes,
+        content_type: str = "application/json",
+        content_encoding: str | None = None,
+    ) -> None:
+        """Stores ``data`` under ``name``."""
+        ...
+
+    def uri(self, name: str) -> str:
+        """Returns the canonical URI of a stored payload."""
+        ...
+
+    def url(self, name: str) -> str:
+        """Returns a browser URL for a stored payload."""
+        ...
+
+
+class GcsPayloadStore:
+    """Stores payloads in a GCS bucket.
+
+    Whether the bucket exists is checked once and then revalidated at most every
+    ``revalidate_seconds``, instead of on every upload.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str,
+        storage_client: "storage.Client | None" = None,
+        project: str | None = None,
+        revalidate_seconds: float = 300.0,
+    ) -> None:
+        """
+        Args:
+            bucket_name: Name of the bucket to store payloads in
+            storage_client: Client to use; created for ``project`` when omitted
+            project: Google Cloud project ID used to create the client
+            revalidate_seconds: How long a bucket existence check is trusted
+        """
+        self.bucket_name = bucket_name
+        if storage_client is None:
+            import google.cloud.storage as storage
+
+            storage_client = storage.Client(project=project)
+        self.storage_client = storage_client
+        self.bucket = self.storage_client.bucket(bucket_name)
+        self.revalidate_seconds = revalidate_seconds
+        self._lock = threading.Lock()
+        self._exists: bool | None = None
+        self._checked_at = 0.0
+
+    def available(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._exists is None or now - self._checked_at > self.revalidate_seconds:
+                self._exists = self.bucket.exists()
+                self._checked_at = now
+                if not self._exists:
+                    logging.warning(
+                        f"Bucket {self.bucket_name} not found. "
+                        "Unable to store span attributes in GCS."
+                    )
+            return bool(self._exists)
+
+    def upload(
+        self,
+        name: str,
+        data: bytes,
+        content_type: str = "application/json",
+        content_encoding: str | None = None,
+    ) -> None:
+        blob = self.bucket.blob(name)
+        if content_encoding:
+            blob.content_encoding = content_encoding
+        blob.upload_from_string(data, content_type=content_type)
+
+    def uri(self, name: str) -> str:
+        return f"gs://{self.bucket_name}/{name}"
+
+    def url(self, name: str) -> str:
+        return f"https://storage.mtls.cloud.google.com/{self.bucket_name}/{name}"
 
 
 def create_bucket_if_not_exists(bucket_name: str, project: str, location: str) -> None:
@@ -26,6 +123,9 @@ def create_bucket_if_not_exists(bucket_name: str, project: str, location: str) -
         project: Google Cloud project ID
         location: Location to create the bucket in (defaults to us-central1)
     """
+    import google.cloud.storage as storage
+    from google.api_core import exceptions
+
     storage_client = storage.Client(project=project)
 
     if bucket_name.startswith("gs://"):
@@ -0,0 +1,264 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from google.adk.agents import LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types as genai_types
+
+from app.utils.callbacks import add_callback
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes user input so trivially different wordings share a cache entry.
+
+    Case, punctuation and runs of whitespace are ignored.
+    """
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def cache_key(model: str, instruction: str, user_input: str) -> str:
+    """Returns the cache key for a model call."""
+    material = json.dumps([model, instruction, normalize_text(user_input)])
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    A disk-backed cache of model responses with a size bound and a TTL.
+
+    Entries live in a local SQLite database. When the total size of the stored
+    values exceeds ``max_bytes``, the least recently used entries are evicted.
+    Entries older than ``ttl_seconds`` are treated as misses and removed.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 7 * 24 * 3600,
+    ) -> None:
+        """
+        :param path: SQLite database file, or ``:memory:``
+        :param max_bytes: Maximum total size of the cached values
+        :param ttl_seconds: Age after which an entry is no longer served
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        parent = os.path.dirname(path)
+        if parent and path != ":memory:":
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> str | None:
+        """Returns the cached value for ``key``, or ``None`` on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """Stores ``value`` under ``key``, evicting least recently used entries."""
+        size = len(value.encode())
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            (total,) = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            if total > self.max_bytes:
+                for old_key, old_size in self._conn.execute(
+                    "SELECT key, size FROM responses WHERE key != ?"
+                    " ORDER BY accessed_at ASC",
+                    (key,),
+                ).fetchall():
+                    self._conn.execute(
+                        "DELETE FROM responses WHERE key = ?", (old_key,)
+                    )
+                    self.evictions += 1
+                    total -= old_size
+                    if total <= self.max_bytes:
+                        break
+            self._conn.commit()
+
+    def stats(self) -> dict[str, int]:
+        """Returns hit, miss and eviction counters plus the current entry count."""
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
+
+    def close(self) -> None:
+        """Closes the underlying database."""
+        with self._lock:
+            self._conn.close()
+
+
+def _instruction_text(llm_request: LlmRequest) -> str:
+    instruction = llm_request.config.system_instruction if llm_request.config else None
+    if instruction is None:
+        return ""
+    if isinstance(instruction, str):
+        return instruction
+    if isinstance(instruction, genai_types.Content):
+        return "".join(part.text or "" for part in instruction.parts or [])
+    return str(instruction)
+
+
+class ResponseCacheCallbacks:
+    """
+    Model callbacks that serve an agent's responses from a ``ResponseCache``.
+
+    Only plain text exchanges are cached: requests that carry function calls or
+    responses, and responses that contain function calls, always go to the
+    model. A hit short-circuits the model call; ADK then treats the cached
+    response as the agent's final response, so ``output_key`` is still written
+    into session state.
+
+    A miss is remembered until its response arrives. If the model call fails or
+    is cancelled, no response arrives, so misses older than
+    ``pending_ttl_seconds`` are forgotten.
+    """
+
+    def __init__(
+        self, cache: ResponseCache, pending_ttl_seconds: float = 600.0
+    ) -> None:
+        """
+        :param cache: Cache the responses are read from and written to
+        :param pending_ttl_seconds: How long a miss waits for its model response
+        """
+        self.cache = cache
+        self.pending_ttl_seconds = pending_ttl_seconds
+        self._pending: dict[tuple[str, str], tuple[str, float]] = {}
+
+    def _expire_pending(self, now: float) -> None:
+        expired = [
+            k
+            for k, (_, started) in self._pending.items()
+            if now - started > self.pending_ttl_seconds
+        ]
+        for k in expired:
+            del self._pending[k]
+
+    @staticmethod
+    def request_key(llm_request: LlmRequest) -> str | None:
+        """Returns the cache key for a request, or ``None`` if it is not cacheable."""
+        texts = []
+        for content in llm_request.contents:
+            for part in content.parts or []:
+                if part.function_call or part.function_response:
+                    return None
+                if part.text:
+                    texts.append(part.text)
+        return cache_key(
+            llm_request.model or "", _instruction_text(llm_request), "\n".join(texts)
+        )
+
+    async def before_model(
+        self, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> LlmResponse | None:
+        key = self.request_key(llm_request)
+        if key is None:
+            return None
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is None:
+            now = time.monotonic()
+            self._expire_pending(now)
+            self._pending[
+                (callback_context.invocation_id, callback_context.agent_name)
+            ] = (key, now)
+            return None
+        logging.info(f"Serving {callback_context.agent_name} response from cache")
+        return LlmResponse(content=genai_types.Content.model_validate_json(cached))
+
+    async def after_model(
+        self, callback_context: CallbackContext, llm_response: LlmResponse
+    ) -> LlmResponse | None:
+        if llm_response.partial:
+            return None
+        pending = self._pending.pop(
+            (callback_context.invocation_id, callback_context.agent_name), None
+        )
+        content = llm_response.content
+        if (
+            pending is None
+            or llm_response.error_code
+            or content is None
+            or not content.parts
+            or any(part.function_call for part in content.parts)
+            or not any(part.text for part in content.parts)
+        ):
+            return None
+        await asyncio.to_thread(
+            self.cache.put, pending[0], content.model_dump_json(exclude_none=True)
+        )
+        return None
+
+
+def enable_response_cache(
+    agent: LlmAgent, cache: ResponseCache
+) -> ResponseCacheCallbacks:
+    """Opts an agent into response caching and returns the attached callbacks."""
+    callbacks = ResponseCacheCallbacks(cache)
+    add_callback(agent, "before_model_callback", callbacks.before_model)
+    add_callback(agent, "after_model_callback", callbacks.after_model)
+    return callbacks
@@ -0,0 +1,284 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import abc
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from typing import Any
+
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from app.utils.gcs import PayloadStore
+from app.utils.span_offload import LargeAttributeOffloadMixin
+
+
+class LocalPayloadStore:
+    """Stores payloads as files under a local directory."""
+
+    def __init__(self, root_dir: str) -> None:
+        self.root_dir = os.path.abspath(root_dir)
+
+    def available(self) -> bool:
+        return True
+
+    def upload(
+        self,
+        name: str,
+        data: bytes,
+        content_type: str = "application/json",
+        content_encoding: str | None = None,
+    ) -> None:
+        path = os.path.join(self.root_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def uri(self, name: str) -> str:
+        return f"file://{os.path.join(self.root_dir, name)}"
+
+    def url(self, name: str) -> str:
+        return self.uri(name)
+
+
+class InMemoryPayloadStore:
+    """
+    Keeps payloads in a dict, for tests and benchmarks. When ``max_payloads`` is
+    set, the oldest payloads are discarded beyond that number.
+    """
+
+    def __init__(self, max_payloads: int | None = None) -> None:
+        self.max_payloads = max_payloads
+        self.payloads: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        return True
+
+    def upload(
+        self,
+        name: str,
+        data: bytes,
+        content_type: str = "application/json",
+        content_encoding: str | None = None,
+    ) -> None:
+        with self._lock:
+            self.payloads[name] = data
+            self.payloads.move_to_end(name)
+            if self.max_payloads is not None:
+                while len(self.payloads) > self.max_payloads:
+                    self.payloads.popitem(last=False)
+
+    def uri(self, name: str) -> str:
+        return f"memory://{name}"
+
+    def url(self, name: str) -> str:
+        return self.uri(name)
+
+
+class _LocalSpanExporter(LargeAttributeOffloadMixin, SpanExporter, abc.ABC):
+    """
+    Base class of the local exporters: builds the same log entries as
+    CloudTraceLoggingSpanExporter, without any Google Cloud client.
+    """
+
+    def __init__(
+        self,
+        payload_store: PayloadStore,
+        project_id: str | None = None,
+        upload_workers: int = 2,
+        max_pending_uploads: int = 64,
+        compress_payloads: bool = True,
+    ) -> None:
+        self.project_id = project_id or "local"
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "exports": 0,
+            "exported_spans": 0,
+            "export_seconds_total": 0.0,
+            "export_seconds_last": 0.0,
+            "export_seconds_max": 0.0,
+        }
+        self._init_offload(
+            payload_store,
+            upload_workers=upload_workers,
+            max_pending_uploads=max_pending_uploads,
+            compress_payloads=compress_payloads,
+        )
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        start = time.perf_counter()
+        entries = [self._span_entry(span) for span in spans]
+        self._write_entries(entries)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._stats["exports"] += 1
+            self._stats["exported_spans"] += len(entries)
+            self._stats["export_seconds_total"] += elapsed
+            self._stats["export_seconds_last"] = elapsed
+            self._stats["export_seconds_max"] = max(
+                self._stats["export_seconds_max"], elapsed
+            )
+        return SpanExportResult.SUCCESS
+
+    def stats(self) -> dict[str, float]:
+        """Return export counters, in the same format as the cloud exporter."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._wait_for_uploads(timeout_millis / 1000)
+
+    def shutdown(self) -> None:
+        self._shutdown_uploads()
+
+    @abc.abstractmethod
+    def _write_entries(self, entries: list[dict[str, Any]]) -> None:
+        """Write the log entries of one export."""
+
+
+class JsonlSpanExporter(_LocalSpanExporter):
+    """
+    Appends one JSON log entry per span to a local file.
+
+    When the file would grow past ``max_bytes`` it is rotated to ``<path>.1``
+    (``<path>.1.gz`` when ``compress`` is set), older files shift up and at most
+    ``backup_count`` of them are kept. Offloaded attribute values are written
+    under ``payload_dir``.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        backup_count: int = 5,
+        compress: bool = True,
+        payload_dir: str | None = None,
+        **kwargs: Any,
+    ) -> None:
+        """
+        :param path: The JSONL file to append to
+        :param max_bytes: Size at which the file is rotated
+        :param backup_count: Number of rotated files to keep
+        :param compress: Gzip rotated files
+        :param payload_dir: Directory for offloaded attribute values; defaults to
+            a ``payloads`` directory next to ``path``
+        :param kwargs: Additional arguments for the offload logic
+        """
+        payload_dir = payload_dir or os.path.join(
+            os.path.dirname(os.path.abspath(path)), "payloads"
+        )
+        super().__init__(LocalPayloadStore(payload_dir), **kwargs)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self._stats.update(log_writes=0, rotations=0)
+        self._file_lock = threading.Lock()
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._file = open(path, "ab")
+
+    def _write_entries(self, entries: list[dict[str, Any]]) -> None:
+        if not entries:
+            return
+        data = "".join(json.dumps(entry) + "\n" for entry in entries).encode()
+        with self._file_lock:
+            if self._file.tell() and self._file.tell() + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+        with self._stats_lock:
+            self._stats["log_writes"] += 1
+
+    def _backup_path(self, index: int) -> str:
+        return f"{self.path}.{index}" + (".gz" if self.compress else "")
+
+    def _rotate(self) -> None:
+        """Rotate the current file; called with the file lock held."""
+        self._file.close()
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                if os.path.exists(self._backup_path(index)):
+                    os.replace(self._backup_path(index), self._backup_path(index + 1))
+            if self.compress:
+                with (
+                    open(self.path, "rb") as src,
+                    gzip.open(self._backup_path(1), "wb") as dst,
+                ):
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self._backup_path(1))
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "ab")
+        with self._stats_lock:
+            self._stats["rotations"] += 1
+
+    def shutdown(self) -> None:
+        super().shutdown()
+        with self._file_lock:
+            self._file.close()
+
+
+class RingBufferSpanExporter(_LocalSpanExporter):
+    """
+    Keeps the log entries of the last ``capacity`` spans in memory.
+
+    Meant for benchmarks and tests: export costs the same encoding and offload
+    work as the real exporters, without any I/O. Offloaded attribute values go
+    to an ``InMemoryPayloadStore`` holding at most ``capacity`` payloads unless
+    another store is given.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 10000,
+        payload_store: PayloadStore | None = None,
+        **kwargs: Any,
+    ) -> None:
+        """
+        :param capacity: Number of log entries kept; older entries are discarded
+        :param payload_store: Where offloaded attribute values are stored
+        :param kwargs: Additional arguments for the offload logic
+        """
+        super().__init__(
+            payload_store or InMemoryPayloadStore(max_payloads=capacity), **kwargs
+        )
+        self._entries: deque[dict[str, Any]] = deque(maxlen=capacity)
+        self._entries_lock = threading.Lock()
+
+    def _write_entries(self, entries: list[dict[str, Any]]) -> None:
+        with self._entries_lock:
+            self._entries.extend(entries)
+
+    def entries(self) -> list[dict[str, Any]]:
+        """Return the buffered log entries, oldest first."""
+        with self._entries_lock:
+            return list(self._entries)
+
+    def clear(self) -> None:
+        with self._entries_lock:
+            self._entries.clear()
@@ -0,0 +1,481 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, TypeVar
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.tools import BaseTool, ToolContext
+from opentelemetry import metrics as otel_metrics
+
+from app.utils.callbacks import add_callback
+
+T = TypeVar("T")
+
+# name: (kind, unit, description)
+METRICS: dict[str, tuple[str, str, str]] = {
+    "agent.duration": (
+        "histogram",
+        "s",
+        "Wall time of an agent run, sub-agents included",
+    ),
+    "model.duration": ("histogram", "s", "Time from model request to final response"),
+    "model.calls": ("counter", "1", "Model calls"),
+    "model.tokens": ("counter", "1", "Model tokens, by direction (input or output)"),
+    "model.retries": ("counter", "1", "Model calls retried after an error"),
+    "model.hedges": (
+        "counter",
+        "1",
+        "Hedged model requests, by outcome (won, lost or denied)",
+    ),
+    "state.tokens_saved": (
+        "counter",
+        "1",
+        "Instruction tokens saved by state projection (estimated)",
+    ),
+    "tool.duration": ("histogram", "s", "Tool execution time"),
+    "tool.calls": ("counter", "1", "Tool calls"),
+    "tool.queue_time": ("histogram", "s", "Time a tool waited for a worker thread"),
+    "ratelimit.wait_time": (
+        "histogram",
+        "s",
+        "Time a call waited for rate limit admission",
+    ),
+    "ratelimit.queue_depth": ("gauge", "1", "Calls waiting for rate limit admission"),
+    "ratelimit.throttled": ("counter", "1", "Rate limited (429) responses"),
+}
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class _HistogramData:
+    __slots__ = ("bucket_counts", "count", "max", "sum")
+
+    def __init__(self, buckets: int) -> None:
+        self.bucket_counts = [0] * (buckets + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+
+class PipelineMetrics:
+    """
+    Latency and throughput metrics of the agents and tools of a pipeline.
+
+    Every measurement is recorded on OpenTelemetry instruments, so any configured
+    meter provider exports it, and aggregated in process for a Prometheus text
+    snapshot and a per-stage breakdown.
+
+    The measurements come from agent, model and tool callbacks attached with
+    ``instrument_agent``, from ``run_in_thread`` for tools that run blocking
+    work on worker threads, and from a RateLimiter it is bound to.
+    """
+
+    def __init__(
+        self,
+        meter: otel_metrics.Meter | None = None,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        """
+        :param meter: OpenTelemetry meter; defaults to the global ``marketingflow`` meter
+        :param buckets: Upper bounds of the histogram buckets, in seconds
+        """
+        meter = meter or otel_metrics.get_meter("marketingflow")
+        self.buckets = buckets
+        self._instruments: dict[str, Any] = {}
+        factories: dict[str, Callable[..., Any]] = {
+            "histogram": meter.create_histogram,
+            "counter": meter.create_counter,
+            "gauge": meter.create_up_down_counter,
+        }
+        for name, (kind, unit, description) in METRICS.items():
+            self._instruments[name] = factories[kind](
+                f"marketingflow.{name}", unit=unit, description=description
+            )
+        self._lock = threading.Lock()
+        self._histograms: dict[str, dict[Labels, _HistogramData]] = {}
+        self._counters: dict[str, dict[Labels, float]] = {}
+        # Start times of running agents, model calls and tools. Written from
+        # callbacks and tool threads, so guarded by the lock too.
+        self._started: dict[tuple, float] = {}
+
+    def __reduce__(self) -> tuple[Callable[[], "PipelineMetrics"], tuple[()]]:
+        # Every instrumented agent holds bound callbacks of its metrics, which hold
+        # a lock and OpenTelemetry instruments. A pickled agent tree (as deployed to
+        # Agent Engine) therefore refers to the process-wide metrics of whichever
+        # process loads it instead of carrying a copy.
+        return get_pipeline_metrics, ()
+
+    # --- Recording ---
+
+    def observe(self, name: str, value: float, /, **labels: str) -> None:
+        """Record a histogram measurement."""
+        self._instruments[name].record(value, attributes=labels)
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            data = self._histograms.setdefault(name, {}).get(key)
+            if data is None:
+                data = self._histograms[name][key] = _HistogramData(len(self.buckets))
+            data.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            data.count += 1
+            data.sum += value
+            data.max = max(data.max, value)
+
+    def add(self, name: str, amount: float = 1, /, **labels: str) -> None:
+        """Increment a counter, or move a gauge up or down."""
+        self._instruments[name].add(amount, attributes=labels)
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counters = self._counters.setdefault(name, {})
+            counters[key] = counters.get(key, 0) + amount
+
+    def record_retry(self, agent: str, reason: str) -> None:
+        """Count a model call that is retried, e.g. after a rate limit error."""
+        self.add("model.retries", agent=agent, reason=reason)
+
+    async def run_in_thread(self, tool: str, func: Callable[[], T]) -> T:
+        """
+        Run blocking tool work on the default thread pool and record how long it
+        waited for a thread.
+        """
+        submitted = time.perf_counter()
+
+        def timed() -> T:
+            self.observe("tool.queue_time", time.perf_counter() - submitted, tool=tool)
+            return func()
+
+        return await asyncio.to_thread(timed)
+
+    def reset(self) -> None:
+        """Clear the in-process aggregates (OpenTelemetry instruments are unaffected)."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._started.clear()
+
+    # --- Callbacks ---
+
+    def _start(self, key: tuple) -> None:
+        with self._lock:
+            self._started[key] = time.perf_counter()
+
+    def _stop(self, key: tuple) -> float | None:
+        with self._lock:
+            started = self._started.pop(key, None)
+        return None if started is None else time.perf_counter() - started
+
+    @staticmethod
+    def _run_key(kind: str, callback_context: CallbackContext) -> tuple:
+        # Pipelined concept copies of an agent share its name and invocation but
+        # run concurrently on their own branch, so the branch is part of the key.
+        invocation = getattr(callback_context, "_invocation_context", None)
+        return (
+            kind,
+            callback_context.invocation_id,
+            getattr(invocation, "branch", None),
+            callback_context.agent_name,
+        )
+
+    async def before_agent(self, callback_context: CallbackContext) -> None:
+        self._start(self._run_key("agent", callback_context))
+        return None
+
+    async def after_agent(self, callback_context: CallbackContext) -> None:
+        elapsed = self._stop(self._run_key("agent", callback_context))
+        if elapsed is not None:
+            self.observe("agent.duration", elapsed, agent=callback_context.agent_name)
+        # Model calls answered by an earlier callback never reach after_model.
+        self._stop(self._run_key("model", callback_context))
+        return None
+
+    async def before_model(
+        self, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> None:
+        self._start(self._run_key("model", callback_context))
+        return None
+
+    async def after_model(
+        self, callback_context: CallbackContext, llm_response: LlmResponse
+    ) -> None:
+        if llm_response.partial:
+            return None
+        agent = callback_context.agent_name
+        elapsed = self._stop(self._run_key("model", callback_context))
+        if elapsed is not None:
+            self.observe("model.duration", elapsed, agent=agent)
+        status = "error" if llm_response.error_code else "ok"
+        self.add("model.calls", agent=agent, status=status)
+        usage = llm_response.usage_metadata
+        if usage is not None:
+            if usage.prompt_token_count:
+                self.add(
+                    "model.tokens",
+                    usage.prompt_token_count,
+                    agent=agent,
+                    direction="input",
+                )
+            if usage.candidates_token_count:
+                self.add(
+                    "model.tokens",
+                    usage.candidates_token_count,
+                    agent=agent,
+                    direction="output",
+                )
+        return None
+
+    async def before_tool(
+        self, tool: BaseTool, args: dict[str, Any], tool_context: ToolContext
+    ) -> None:
+        self._start(("tool", tool_context.invocation_id, tool_context.function_call_id))
+        return None
+
+    async def after_tool(
+        self,
+        tool: BaseTool,
+        args: dict[str, Any],
+        tool_context: ToolContext,
+        tool_response: Any,
+    ) -> None:
+        elapsed = self._stop(
+            ("tool", tool_context.invocation_id, tool_context.function_call_id)
+        )
+        labels = {"agent": tool_context.agent_name, "tool": tool.name}
+        if elapsed is not None:
+            self.observe("tool.duration", elapsed, **labels)
+        failed = isinstance(tool_response, dict) and "error" in tool_response
+        self.add("tool.calls", **labels, status="error" if failed else "ok")
+        return None
+
+    # --- Reporting ---
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return the in-process aggregates as plain data."""
+        with self._lock:
+            return {
+                "histograms": {
+                    name: [
+                        {
+                            "labels": dict(labels),
+                            "count": data.count,
+                            "sum": data.sum,
+                            "max": data.max,
+                            "bucket_counts": list(data.bucket_counts),
+                        }
+                        for labels, data in series.items()
+                    ]
+                    for name, series in self._histograms.items()
+                },
+                "counters": {
+                    name: [
+                        {"labels": dict(labels), "value": value}
+                        for labels, value in series.items()
+                    ]
+                    for name, series in self._counters.items()
+                },
+            }
+
+    def render_prometheus(self) -> str:
+        """Render the aggregates in the Prometheus text exposition format."""
+        lines = []
+        snapshot = self.snapshot()
+        for name, series in snapshot["histograms"].items():
+            metric = _prometheus_name(name)
+            lines.append(f"# HELP {metric} {METRICS[name][2]}")
+            lines.append(f"# TYPE {metric} histogram")
+            for sample in series:
+                cumulative = 0
+                for bound, count in zip(
+                    (*self.buckets, float("inf")), sample["bucket_counts"], strict=True
+                ):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    labels = _prometheus_labels({**sample["labels"], "le": le})
+                    lines.append(f"{metric}_bucket{labels} {cumulative}")
+                labels = _prometheus_labels(sample["labels"])
+                lines.append(f"{metric}_sum{labels} {sample['sum']:.6f}")
+                lines.append(f"{metric}_count{labels} {sample['count']}")
+        for name, series in snapshot["counters"].items():
+            metric = _prometheus_name(name)
+            lines.append(f"# HELP {metric} {METRICS[name][2]}")
+            lines.append(f"# TYPE {metric} {METRICS[name][0]}")
+            for sample in series:
+                labels = _prometheus_labels(sample["labels"])
+                lines.append(f"{metric}{labels} {sample['value']:g}")
+        return "\n".join(lines) + "\n"
+
+    def stage_breakdown(self) -> dict[str, dict[str, float]]:
+        """
+        Summarize the aggregates per agent: runs and wall time, model calls and
+        time, tool calls and time, tokens in and out, and instruction tokens
+        saved by state projection.
+        """
+        snapshot = self.snapshot()
+        stages: dict[str, dict[str, float]] = {}
+
+        def stage(agent: str) -> dict[str, float]:
+            return stages.setdefault(
+                agent,
+                {
+                    "runs": 0,
+                    "wall_s": 0.0,
+                    "model_calls": 0,
+                    "model_s": 0.0,
+                    "tool_calls": 0,
+                    "tool_s": 0.0,
+                    "tokens_in": 0,
+                    "tokens_out": 0,
+                    "tokens_saved": 0,
+                },
+            )
+
+        for name, runs_key, seconds_key in [
+            ("agent.duration", "runs", "wall_s"),
+            ("model.duration", None, "model_s"),
+            ("tool.duration", None, "tool_s"),
+        ]:
+            for sample in snapshot["histograms"].get(name, []):
+                entry = stage(sample["labels"]["agent"])
+                entry[seconds_key] += sample["sum"]
+                if runs_key:
+                    entry[runs_key] += sample["count"]
+        for name, key in [
+            ("model.calls", "model_calls"),
+            ("tool.calls", "tool_calls"),
+            ("state.tokens_saved", "tokens_saved"),
+        ]:
+            for sample in snapshot["counters"].get(name, []):
+                stage(sample["labels"]["agent"])[key] += sample["value"]
+        for sample in snapshot["counters"].get("model.tokens", []):
+            key = (
+                "tokens_in"
+                if sample["labels"]["direction"] == "input"
+                else "tokens_out"
+            )
+            stage(sample["labels"]["agent"])[key] += sample["value"]
+        return stages
+
+    def format_stage_breakdown(self) -> str:
+        """Render ``stage_breakdown`` as a text table."""
+        header = (
+            f"{'stage':<24} {'runs':>5} {'wall s':>8} {'model':>6} {'model s':>8} "
+            f"{'tools':>6} {'tool s':>8} {'tok in':>8} {'tok out':>8} {'tok saved':>9}"
+        )
+        rows = [header, "-" * len(header)]
+        for agent, s in self.stage_breakdown().items():
+            rows.append(
+                f"{agent:<24} {s['runs']:>5.0f} {s['wall_s']:>8.2f} {s['model_calls']:>6.0f} "
+                f"{s['model_s']:>8.2f} {s['tool_calls']:>6.0f} {s['tool_s']:>8.2f} "
+                f"{s['tokens_in']:>8.0f} {s['tokens_out']:>8.0f} {s['tokens_saved']:>9.0f}"
+            )
+        return "\n".join(rows)
+
+
+def _prometheus_name(name: str) -> str:
+    kind, unit, _ = METRICS[name]
+    metric = "marketingflow_" + name.replace(".", "_")
+    if unit == "s":
+        metric += "_seconds"
+    if kind == "counter":
+        metric += "_total"
+    return metric
+
+
+def _prometheus_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = (
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+@functools.cache
+def get_pipeline_metrics() -> PipelineMetrics:
+    """Returns the process-wide metrics, creating them on first use."""
+    return PipelineMetrics()
+
+
+def instrument_agent(agent: BaseAgent, metrics: PipelineMetrics) -> None:
+    """
+    Attach metric callbacks to every agent in a tree. Agent callbacks go on every
+    agent; model and tool callbacks on every LlmAgent.
+    """
+    add_callback(agent, "before_agent_callback", metrics.before_agent)
+    add_callback(agent, "after_agent_callback", metrics.after_agent)
+    if isinstance(agent, LlmAgent):
+        add_callback(agent, "before_model_callback", metrics.before_model)
+        add_callback(agent, "after_model_callback", metrics.after_model)
+        add_callback(agent, "before_tool_callback", metrics.before_tool)
+        add_callback(agent, "after_tool_callback", metrics.after_tool)
+    for sub_agent in agent.sub_agents:
+        instrument_agent(sub_agent, metrics)
+
+
+def serve_metrics(
+    metrics: PipelineMetrics, port: int, host: str = "127.0.0.1"
+) -> ThreadingHTTPServer:
+    """
+    Serve ``render_prometheus`` on ``http://host:port/metrics`` from a daemon thread.
+
+    :return: The running server; call ``shutdown()`` to stop it
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    return server
@@ -0,0 +1,155 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from collections.abc import Iterator
+from typing import Literal
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.models import BaseLlm, Gemini
+
+from app.utils.replay import CassetteLlm
+from app.utils.routing import RouterLlm, router_settings
+
+MODEL_BACKENDS = ("live", "record", "replay")
+DEFAULT_CASSETTE_DIR = os.path.join("tests", "fixtures", "cassettes")
+
+
+def model_backend() -> str:
+    """Returns the configured model backend: ``live``, ``record`` or ``replay``.
+
+    Set with the ``MODEL_BACKEND`` environment variable (default ``live``).
+    """
+    backend = os.environ.get("MODEL_BACKEND", "live").lower()
+    if backend not in MODEL_BACKENDS:
+        raise ValueError(
+            f"Unknown MODEL_BACKEND {backend!r}, expected one of {MODEL_BACKENDS}"
+        )
+    return backend
+
+
+def cassette_path(agent_name: str, cassette_dir: str | None = None) -> str:
+    """Returns the cassette file used for an agent."""
+    directory = (
+        cassette_dir or os.environ.get("MODEL_CASSETTE_DIR") or DEFAULT_CASSETTE_DIR
+    )
+    return os.path.join(directory, f"{agent_name}.json")
+
+
+def resolve_model(
+    agent_name: str,
+    model: str | list[str],
+    backend: str | None = None,
+    cassette_dir: str | None = None,
+    latency: float | None = None,
+) -> RouterLlm:
+    """Returns the model an agent should use under the configured backend.
+
+    Each model name is resolved under the backend: ``live`` uses the model
+    directly, ``record`` wraps the real model so its responses are written to
+    the agent's cassette, and ``replay`` serves them back offline with
+    ``latency`` seconds of synthetic delay per call (default
+    ``MODEL_REPLAY_LATENCY_S``, or 0).
+
+    The result is a RouterLlm over the resolved models, with settings from the
+    environment (see ``router_settings``). It routes between them when there
+    are several, and applies the process-wide rate limits and 429 retries.
+
+    Args:
+        agent_name: Name of the agent, which selects its cassette file.
+        model: The model name, or the model names to route between, preferred
+            model first.
+        backend: Overrides ``MODEL_BACKEND``.
+        cassette_dir: Overrides ``MODEL_CASSETTE_DIR``.
+        latency: Overrides ``MODEL_REPLAY_LATENCY_S``.
+    """
+    backend = backend or model_backend()
+    models = [model] if isinstance(model, str) else list(model)
+    return RouterLlm(
+        model=models[0],
+        candidates=[
+            _backend_model(agent_name, name, backend, cassette_dir, latency)
+            for name in models
+        ],
+        agent_name=agent_name,
+        **router_settings(agent_name),
+    )
+
+
+def _backend_model(
+    agent_name: str,
+    model: str,
+    backend: str,
+    cassette_dir: str | None,
+    latency: float | None,
+) -> BaseLlm:
+    if backend == "live":
+        return Gemini(model=model)
+    if latency is None:
+        latency = float(os.environ.get("MODEL_REPLAY_LATENCY_S", "0"))
+    mode: Literal["record", "replay"] = "record" if backend == "record" else "replay"
+    return CassetteLlm(
+        model=model,
+        cassette_path=cassette_path(agent_name, cassette_dir),
+        mode=mode,
+        inner=Gemini(model=model) if backend == "record" else None,
+        latency=latency,
+    )
+
+
+def iter_llm_agents(agent: BaseAgent) -> Iterator[LlmAgent]:
+    """Yields every LlmAgent in an agent tree, depth first."""
+    if isinstance(agent, LlmAgent):
+        yield agent
+    for sub_agent in agent.sub_agents:
+        yield from iter_llm_agents(sub_agent)
+
+
+def use_model_backend(
+    agent: BaseAgent,
+    backend: str,
+    cassette_dir: str | None = None,
+    latency: float | None = None,
+) -> dict[str, str | BaseLlm]:
+    """Switches every LlmAgent in a tree to a model backend.
+
+    Returns the previous model of each agent by name, so callers such as tests
+    and benchmarks can restore them.
+    """
+    previous = {}
+    for llm_agent in iter_llm_agents(agent):
+        previous[llm_agent.name] = llm_agent.model
+        current = llm_agent.model
+        if isinstance(current, RouterLlm):
+            # Keep the routing settings and swap the backend of every candidate.
+            llm_agent.model = current.model_copy(
+                update={
+                    "candidates": [
+                        _backend_model(
+                            llm_agent.name, c.model, backend, cassette_dir, latency
+                        )
+                        for c in current.candidates
+                    ]
+                }
+            )
+            continue
+        model = current if isinstance(current, str) else current.model
+        llm_agent.model = resolve_model(
+            llm_agent.name,
+            model,
+            backend=backend,
+            cassette_dir=cassette_dir,
+            latency=latency,
+        )
+    return previous
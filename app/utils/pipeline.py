@@ -0,0 +1,258 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import copy
+from collections.abc import AsyncGenerator
+from typing import Any, TypeVar
+
+from google.adk.agents import BaseAgent, LlmAgent, SequentialAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.llm_agent import InstructionProvider
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.events import Event
+
+from app.utils.concepts import ConceptStreamParser
+from app.utils.fanout import VariantFanOutAgent
+from app.utils.projection import ProjectedInstruction, render
+
+AgentT = TypeVar("AgentT", bound=BaseAgent)
+
+
+def concept_agent(
+    agent: BaseAgent, concept: str, index: int, concepts_key: str
+) -> LlmAgent:
+    """
+    Returns a copy of a generation agent that works on a single concept.
+
+    The ``{concepts_key}`` placeholder of its instruction shows the concept, as
+    it is, instead of the state value. ADK does not inject state into an
+    instruction provider, so the copy's provider fills the other placeholders
+    from the state itself. Copies for the second and later concepts write their
+    output to ``<output_key>_<n>`` so they do not overwrite the first one. A
+    ProjectedInstruction keeps projecting the rest of the state.
+    """
+    if not isinstance(agent, LlmAgent):
+        raise TypeError(f"{agent.name} needs to be an LlmAgent to be pipelined")
+    provider: InstructionProvider
+    if isinstance(agent.instruction, ProjectedInstruction):
+        provider = agent.instruction.with_values({concepts_key: concept})
+    elif isinstance(agent.instruction, str):
+        template = agent.instruction
+
+        def render_concept(context: ReadonlyContext) -> str:
+            return render(template, {**context.state, concepts_key: concept}, {})
+
+        provider = render_concept
+    else:
+        raise TypeError(f"{agent.name} needs a string instruction to be pipelined")
+
+    update: dict[str, Any] = {"instruction": provider}
+    if index and agent.output_key:
+        update["output_key"] = f"{agent.output_key}_{index + 1}"
+    return agent.model_copy(update=update)
+
+
+def clone_root_agent(agent: AgentT) -> AgentT:
+    """
+    Returns a copy of an agent tree that shares its definition.
+
+    Every agent of the tree is copied, with its own lists and dicts, and each
+    copied sub-agent's ``parent_agent`` is its copied parent. Runtime flags set
+    on a copy (such as ``pipelined``), callbacks added to it and changes to its
+    ``sub_agents`` list therefore do not leak into other copies. The objects the
+    agents refer to (models, tools, instruction providers and callbacks) are the
+    immutable definition of the pipeline and are shared rather than deep-copied.
+    """
+    update: dict[str, Any] = {}
+    for name in type(agent).model_fields:
+        value = getattr(agent, name)
+        if name == "sub_agents":
+            update[name] = [clone_root_agent(sub_agent) for sub_agent in value]
+        elif name != "parent_agent" and isinstance(value, (list, dict)):
+            update[name] = copy.copy(value)
+    clone = agent.model_copy(update=update)
+    for sub_agent in clone.sub_agents:
+        sub_agent.parent_agent = clone
+    return clone
+
+
+class VisualMarketingPipeline(SequentialAgent):
+    """
+    A SequentialAgent that can overlap its first two stages, or swap its
+    generation stage for a variant fan-out.
+
+    Its sub-agents are optional code-only setup stages, the ideation agent (the
+    one whose ``output_key`` is ``concepts_key``), the generation layer, an
+    optional VariantFanOutAgent and the remaining stages. Only one of the generation layer
+    and the fan-out agent runs: the fan-out agent when ``fanout`` is set, the
+    generation layer otherwise.
+
+    A stage that escalates (for example baseline selection without any baseline
+    image) ends the pipeline after its event.
+
+    By default the stages run one after another. With ``pipelined`` set (and
+    ``fanout`` unset),
+    the setup stages run, then the ideation agent is streamed, and its bulleted
+    concepts are parsed as they arrive. As soon as a concept is complete, every
+    branch of the following sub-agent (the ParallelAgent generation layer) starts
+    working on it, while ideation continues. This happens for up to
+    ``max_concepts`` concepts. The remaining sub-agents then run in order.
+    """
+
+    pipelined: bool = False
+    fanout: bool = False
+    max_concepts: int = 1
+    concepts_key: str = "visual_concepts"
+
+    def _ideation_index(self) -> int:
+        # The ideation agent is the one writing the concepts; any code-only
+        # stages before it (such as baseline selection) run first.
+        for index, agent in enumerate(self.sub_agents):
+            if getattr(agent, "output_key", None) == self.concepts_key:
+                return index
+        return 0
+
+    def _stages(self) -> tuple[list[BaseAgent], list[BaseAgent]]:
+        """Returns the stages up to and including ideation, and the ones after it."""
+        index = self._ideation_index()
+        head = self.sub_agents[: index + 1]
+        generation_layer, *rest = self.sub_agents[index + 1 :]
+        if self.fanout:
+            return head, rest
+        return head, [
+            generation_layer,
+            *(agent for agent in rest if not isinstance(agent, VariantFanOutAgent)),
+        ]
+
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        head, tail = self._stages()
+        if not self.pipelined or self.fanout:
+            for sub_agent in head + tail:
+                async for event in sub_agent.run_async(ctx):
+                    yield event
+                    if event.actions.escalate:
+                        return
+            return
+
+        *setup, ideation = head
+        generation_layer, *rest = tail
+        for sub_agent in setup:
+            async for event in sub_agent.run_async(ctx):
+                yield event
+                if event.actions.escalate:
+                    return
+        async for event in self._run_overlapped(ctx, ideation, generation_layer):
+            yield event
+        for sub_agent in rest:
+            async for event in sub_agent.run_async(ctx):
+                yield event
+                if event.actions.escalate:
+                    return
+
+    async def _run_overlapped(
+        self, ctx: InvocationContext, ideation: BaseAgent, generation_layer: BaseAgent
+    ) -> AsyncGenerator[Event, None]:
+        outer_streaming = bool(
+            ctx.run_config and ctx.run_config.streaming_mode == StreamingMode.SSE
+        )
+        stream_config = (ctx.run_config or RunConfig()).model_copy(
+            update={"streaming_mode": StreamingMode.SSE}
+        )
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks: list[asyncio.Task] = []
+        parser = ConceptStreamParser()
+        dispatched = 0
+
+        async def forward(agent_run: AsyncGenerator[Event, None]) -> None:
+            # Each event waits until it has been yielded (and appended to the
+            # session by the runner) before the producing agent continues.
+            try:
+                async for event in agent_run:
+                    resume = asyncio.Event()
+                    await queue.put((event, resume))
+                    await resume.wait()
+            except Exception as e:
+                await queue.put((e, None))
+            finally:
+                await queue.put(None)
+
+        def start(agent_run: AsyncGenerator[Event, None]) -> None:
+            tasks.append(asyncio.create_task(forward(agent_run)))
+
+        def dispatch(concepts: list[str]) -> None:
+            nonlocal dispatched
+            for concept in concepts:
+                if dispatched >= self.max_concepts:
+                    return
+                for branch in generation_layer.sub_agents:
+                    agent = concept_agent(
+                        branch, concept, dispatched, self.concepts_key
+                    )
+                    suffix = f"{generation_layer.name}.{branch.name}"
+                    if dispatched:
+                        suffix += f".concept_{dispatched + 1}"
+                    branch_ctx = ctx.model_copy(
+                        update={
+                            "branch": f"{ctx.branch}.{suffix}" if ctx.branch else suffix
+                        }
+                    )
+                    start(agent.run_async(branch_ctx))
+                dispatched += 1
+
+        start(ideation.run_async(ctx.model_copy(update={"run_config": stream_config})))
+        streamed = False
+        finished = 0
+        try:
+            while finished < len(tasks):
+                item = await queue.get()
+                if item is None:
+                    finished += 1
+                    continue
+                event, resume = item
+                if resume is None:
+                    raise event
+
+                if (
+                    event.author == ideation.name
+                    and event.content
+                    and event.content.parts
+                ):
+                    text = "".join(
+                        part.text or ""
+                        for part in event.content.parts
+                        if not part.thought
+                    )
+                    if event.partial:
+                        streamed = True
+                        dispatch(parser.feed(text))
+                    else:
+                        if not streamed:
+                            dispatch(parser.feed(text))
+                        dispatch(parser.close())
+
+                if not event.partial or outer_streaming:
+                    yield event
+                resume.set()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if not dispatched:
+            # Ideation produced nothing to split; fall back to the sequential layer.
+            async for event in generation_layer.run_async(ctx):
+                yield event
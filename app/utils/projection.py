@@ -0,0 +1,193 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+import re
+from collections.abc import Callable, Mapping
+from typing import Any
+
+from google.adk.agents.readonly_context import ReadonlyContext
+
+from app.utils.concepts import ConceptStreamParser
+from app.utils.metrics import PipelineMetrics
+
+# Same placeholder syntax as ADK's state injection: {key}, or {key?} when optional.
+_PLACEHOLDER = re.compile(r"{+[^{}]*}+")
+_STATE_PREFIXES = ("app:", "user:", "temp:")
+_ASSET_PATH = re.compile(r"(?:gs://)?[\w./-]+\.(?:png|jpe?g|webp|gif|mp4|mov|webm)\b")
+
+CHARS_PER_TOKEN = 4
+
+Projector = Callable[[Any], str]
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimates the token count of a text at about four characters per token."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cuts a text to about ``max_tokens`` tokens, at a word boundary where possible."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[: max_tokens * CHARS_PER_TOKEN]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip() + " …"
+
+
+def truncate(max_tokens: int) -> Projector:
+    """Shows a value as text cut to a token budget."""
+
+    def project(value: Any) -> str:
+        return truncate_tokens(str(value), max_tokens)
+
+    return project
+
+
+def first_items(max_items: int) -> Projector:
+    """Shows the first ``max_items`` items of a list and how many were left out."""
+
+    def project(value: Any) -> str:
+        if not isinstance(value, (list, tuple)):
+            return str(value)
+        shown = [str(item) for item in value[:max_items]]
+        if len(value) > max_items:
+            shown.append(f"({len(value) - max_items} more)")
+        return ", ".join(shown)
+
+    return project
+
+
+def first_concepts(max_concepts: int, max_tokens_each: int) -> Projector:
+    """
+    Shows the first ``max_concepts`` concepts of a bulleted ideation output, each
+    cut to ``max_tokens_each`` tokens, instead of the whole text.
+    """
+
+    def project(value: Any) -> str:
+        parser = ConceptStreamParser()
+        concepts = parser.feed(str(value)) + parser.close()
+        lines = [
+            f"- {truncate_tokens(c, max_tokens_each)}" for c in concepts[:max_concepts]
+        ]
+        return "\n".join(lines)
+
+    return project
+
+
+def asset_path() -> Projector:
+    """Shows only the file path or URI in an agent's output, not the text around it."""
+
+    def project(value: Any) -> str:
+        match = _ASSET_PATH.search(str(value))
+        return match.group(0) if match else str(value).strip()
+
+    return project
+
+
+def render(
+    template: str, state: Mapping[str, Any], projections: Mapping[str, Projector]
+) -> str:
+    """
+    Fills the ``{key}`` and ``{key?}`` placeholders of a template from state,
+    passing values through their projector if they have one.
+
+    Like ADK's own state injection, a missing optional key renders as an empty
+    string, a missing required key raises KeyError, and anything that is not a
+    state key name is left as it is.
+    """
+
+    def replace(match: re.Match) -> str:
+        name = match.group().lstrip("{").rstrip("}").strip()
+        optional = name.endswith("?")
+        if optional:
+            name = name[:-1]
+        bare = name
+        for prefix in _STATE_PREFIXES:
+            if bare.startswith(prefix):
+                bare = bare[len(prefix) :]
+                break
+        if not bare.isidentifier():
+            return match.group()
+        if name not in state:
+            if optional:
+                return ""
+            raise KeyError(f"Context variable not found: `{name}`.")
+        project = projections.get(name, str)
+        return project(state[name])
+
+    return _PLACEHOLDER.sub(replace, template)
+
+
+class ProjectedInstruction:
+    """
+    An instruction provider that shows an agent only the projection of the state
+    it interpolates.
+
+    Each placeholder whose key has a projector is rendered through it; other keys
+    are rendered in full, as ADK would. Fixed ``values`` take precedence over the
+    state and are rendered as they are. Every render compares the instruction
+    with the one ADK would build from the full state, and records the difference
+    in the ``state.tokens_saved`` metric of the agent.
+    """
+
+    def __init__(
+        self,
+        template: str,
+        projections: Mapping[str, Projector],
+        metrics: PipelineMetrics | None = None,
+        values: Mapping[str, Any] | None = None,
+    ) -> None:
+        """
+        :param template: Instruction with ADK-style ``{key}`` placeholders
+        :param projections: Projector per state key
+        :param metrics: Metrics that the saved tokens are recorded on
+        :param values: Values that replace state keys, without projection
+        """
+        self.template = template
+        self.projections = dict(projections)
+        self.metrics = metrics
+        self.values = dict(values or {})
+
+    def with_template(self, template: str) -> "ProjectedInstruction":
+        """Returns a copy with another template and the same projections."""
+        return ProjectedInstruction(
+            template, self.projections, self.metrics, self.values
+        )
+
+    def with_values(self, values: Mapping[str, Any]) -> "ProjectedInstruction":
+        """Returns a copy that renders ``values`` in place of those state keys."""
+        return ProjectedInstruction(
+            self.template, self.projections, self.metrics, {**self.values, **values}
+        )
+
+    def __call__(self, context: ReadonlyContext) -> str:
+        state: Mapping[str, Any] = context.state
+        projections = self.projections
+        if self.values:
+            state = {**state, **self.values}
+            projections = {
+                key: project
+                for key, project in projections.items()
+                if key not in self.values
+            }
+        instruction = render(self.template, state, projections)
+        if self.metrics is not None:
+            full = render(self.template, state, {})
+            saved = estimate_tokens(full) - estimate_tokens(instruction)
+            self.metrics.add(
+                "state.tokens_saved", max(saved, 0), agent=context.agent_name
+            )
+        return instruction
@@ -0,0 +1,341 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from email.utils import parsedate_to_datetime
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    """Returns whether an error is a 429 / RESOURCE_EXHAUSTED response."""
+    code = getattr(error, "code", None)
+    status = getattr(error, "status", None)
+    return code == 429 or status == "RESOURCE_EXHAUSTED"
+
+
+def retry_after(error: BaseException) -> float | None:
+    """
+    Returns how long a rate-limited response asked the caller to wait, in seconds.
+
+    Looks at a ``retry_after`` attribute, a ``Retry-After`` response header
+    (seconds or an HTTP date), and a ``retryDelay`` in the error details.
+    """
+    value = getattr(error, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        details = getattr(error, "details", None) or str(error)
+        match = re.search(r"retryDelay\W+(\d+(?:\.\d+)?)s", str(details))
+        value = match.group(1) if match else None
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(str(value)).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base_s: float = 1.0, max_s: float = 60.0) -> float:
+    """Returns a full-jitter exponential backoff delay for the given attempt (1-based)."""
+    return random.uniform(0, min(max_s, base_s * 2 ** (attempt - 1)))
+
+
+def parse_limits(spec: str) -> dict[str, tuple[float, float | None]]:
+    """
+    Parses ``model=rpm[:burst],model=rpm`` into requests per minute and burst.
+
+    Without an explicit burst, the bucket holds a tenth of a minute's requests
+    (at least one).
+    """
+    limits = {}
+    for item in spec.split(","):
+        if item.strip():
+            key, value = item.split("=", 1)
+            rpm, _, burst = value.partition(":")
+            limits[key.strip()] = (float(rpm), float(burst) if burst else None)
+    return limits
+
+
+class TokenBucket:
+    """
+    A token bucket that hands out reservations, so sync and async callers share it.
+
+    ``rate`` is in tokens per second; ``None`` means unlimited. A rate-limited
+    response (``throttled``) applies backpressure: the bucket admits nothing
+    until the retry delay has passed, and its rate is halved (down to
+    ``min_rate_fraction`` of the configured rate). Each success restores
+    ``recovery`` of the configured rate.
+    """
+
+    def __init__(
+        self,
+        rate: float | None,
+        burst: float | None = None,
+        min_rate_fraction: float = 0.1,
+        recovery: float = 0.05,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst or (max(1.0, rate * 6) if rate else 1.0)
+        self.min_rate_fraction = min_rate_fraction
+        self.recovery = recovery
+        self._current_rate = rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def current_rate(self) -> float | None:
+        return self._current_rate
+
+    def _refill(self, now: float) -> None:
+        if self._current_rate:
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self._current_rate
+            )
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Takes a token and returns how long the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            blocked = max(0.0, self._blocked_until - now)
+            if not self._current_rate:
+                return blocked
+            self._refill(now)
+            self._tokens -= 1
+            wait = -self._tokens / self._current_rate if self._tokens < 0 else 0.0
+            return max(wait, blocked)
+
+    def blocked_for(self) -> float:
+        """Returns how long the bucket is still blocked by a rate-limited response."""
+        with self._lock:
+            return max(0.0, self._blocked_until - time.monotonic())
+
+    def throttled(self, delay_s: float) -> None:
+        """Blocks admission for ``delay_s`` and halves the rate."""
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + delay_s)
+            if self.rate and self._current_rate:
+                self._refill(now)
+                self._current_rate = max(
+                    self.rate * self.min_rate_fraction, self._current_rate / 2
+                )
+                self._tokens = min(self._tokens, 0.0)
+
+    def succeeded(self) -> None:
+        with self._lock:
+            if self.rate and self._current_rate:
+                self._refill(time.monotonic())
+                self._current_rate = min(
+                    self.rate, self._current_rate + self.rate * self.recovery
+                )
+
+
+class RateLimiter:
+    """
+    Process-wide rate limits and 429 handling, keyed by model name.
+
+    Every model and generation call takes a token from its model's bucket
+    before it starts, so parallel branches and concurrent sessions share one
+    quota. Models without a configured limit are not rate limited, but still
+    get the 429 backpressure.
+
+    A call that gets a 429 blocks its model's bucket for the longer of the
+    server's retry-after and a jittered exponential backoff. It is then retried
+    through the bucket like any other call (up to ``max_attempts`` attempts),
+    so retries queue behind the backpressure instead of piling onto the model.
+
+    Time spent waiting for admission, the number of callers waiting and 429s
+    are recorded on ``metrics`` (a PipelineMetrics) once one is bound.
+    """
+
+    def __init__(
+        self,
+        limits: dict[str, tuple[float, float | None]] | None = None,
+        max_attempts: int = 5,
+        base_delay_s: float = 1.0,
+        max_delay_s: float = 60.0,
+        metrics: Any = None,
+    ) -> None:
+        """
+        :param limits: Requests per minute and burst per model
+        :param max_attempts: Attempts per call, including the first, on 429s
+        :param base_delay_s: Base of the exponential backoff
+        :param max_delay_s: Cap of the exponential backoff
+        :param metrics: PipelineMetrics to record waits, queue depth and 429s on
+        """
+        self.max_attempts = max_attempts
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+        self.metrics = metrics
+        self._limits = dict(limits or {})
+        self._buckets: dict[str, TokenBucket] = {}
+        self._waiting: dict[str, int] = {}
+        self._throttled: dict[str, int] = {}
+        self._wait_s: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, limits: dict[str, tuple[float, float | None]]) -> None:
+        """Replaces the configured limits; buckets are recreated on next use."""
+        with self._lock:
+            self._limits = dict(limits)
+            self._buckets.clear()
+
+    def bucket(self, key: str) -> TokenBucket:
+        with self._lock:
+            if key not in self._buckets:
+                rpm, burst = self._limits.get(key, (None, None))
+                self._buckets[key] = TokenBucket(rpm / 60 if rpm else None, burst)
+            return self._buckets[key]
+
+    def _queued(self, key: str, delta: int) -> None:
+        with self._lock:
+            self._waiting[key] = self._waiting.get(key, 0) + delta
+        if self.metrics is not None:
+            self.metrics.add("ratelimit.queue_depth", delta, model=key)
+
+    def _waited(self, key: str, wait_s: float) -> None:
+        with self._lock:
+            self._wait_s[key] = self._wait_s.get(key, 0.0) + wait_s
+        if self.metrics is not None:
+            self.metrics.observe("ratelimit.wait_time", wait_s, model=key)
+
+    async def acquire(self, key: str) -> float:
+        """Waits for admission of one call; returns the time waited, in seconds."""
+        bucket = self.bucket(key)
+        delay = bucket.reserve()
+        if not delay:
+            self._waited(key, 0.0)
+            return 0.0
+        start = time.perf_counter()
+        self._queued(key, 1)
+        try:
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = bucket.blocked_for()
+        finally:
+            self._queued(key, -1)
+        waited = time.perf_counter() - start
+        self._waited(key, waited)
+        return waited
+
+    def acquire_sync(self, key: str) -> float:
+        """Blocking version of ``acquire``, for work running on worker threads."""
+        bucket = self.bucket(key)
+        delay = bucket.reserve()
+        if not delay:
+            self._waited(key, 0.0)
+            return 0.0
+        start = time.perf_counter()
+        self._queued(key, 1)
+        try:
+            while delay > 0:
+                time.sleep(delay)
+                delay = bucket.blocked_for()
+        finally:
+            self._queued(key, -1)
+        waited = time.perf_counter() - start
+        self._waited(key, waited)
+        return waited
+
+    def throttled(
+        self, key: str, error: BaseException, attempt: int, caller: str = ""
+    ) -> float:
+        """Applies backpressure after a 429; returns the delay applied, in seconds."""
+        delay = max(
+            retry_after(error) or 0.0,
+            backoff_delay(attempt, self.base_delay_s, self.max_delay_s),
+        )
+        self.bucket(key).throttled(delay)
+        with self._lock:
+            self._throttled[key] = self._throttled.get(key, 0) + 1
+        if self.metrics is not None:
+            self.metrics.add("ratelimit.throttled", model=key)
+            if caller:
+                self.metrics.record_retry(caller, "rate_limited")
+        logging.warning(
+            f"{key} is rate limited (attempt {attempt}), backing off {delay:.1f}s"
+        )
+        return delay
+
+    def succeeded(self, key: str) -> None:
+        self.bucket(key).succeeded()
+
+    async def call(
+        self, key: str, func: Callable[[], Awaitable[T]], caller: str = ""
+    ) -> T:
+        """Runs ``func`` under the rate limit of ``key``, retrying on 429s."""
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.acquire(key)
+            try:
+                result = await func()
+            except Exception as e:
+                if not is_rate_limited(e) or attempt >= self.max_attempts:
+                    raise
+                self.throttled(key, e, attempt, caller)
+                continue
+            self.succeeded(key)
+            return result
+
+    def call_sync(self, key: str, func: Callable[[], T], caller: str = "") -> T:
+        """Blocking version of ``call``."""
+        attempt = 0
+        while True:
+            attempt += 1
+            self.acquire_sync(key)
+            try:
+                result = func()
+            except Exception as e:
+                if not is_rate_limited(e) or attempt >= self.max_attempts:
+                    raise
+                self.throttled(key, e, attempt, caller)
+                continue
+            self.succeeded(key)
+            return result
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        """Returns the current rate, queue depth, 429 count and total wait per model."""
+        with self._lock:
+            keys = set(self._buckets) | set(self._waiting)
+            return {
+                key: {
+                    "rate_per_s": self._buckets[key].current_rate
+                    if key in self._buckets
+                    else None,
+                    "queue_depth": self._waiting.get(key, 0),
+                    "throttled": self._throttled.get(key, 0),
+                    "wait_s": self._wait_s.get(key, 0.0),
+                }
+                for key in keys
+            }
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,212 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections.abc import AsyncGenerator, Callable
+from typing import Any, Literal
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types as genai_types
+from pydantic import ConfigDict, PrivateAttr
+
+CASSETTE_VERSION = 1
+
+# ADK relays other agents' events to a model as "For context:" text parts.
+_CONTEXT_MARKER = "For context:"
+_RELAYED_TOOL_RESULT = re.compile(r"^(\[[^\]]*\] `[^`]*` tool returned result):")
+
+
+def _part_key(part: genai_types.Part) -> Any:
+    if part.function_call:
+        return {"call": part.function_call.name, "args": part.function_call.args}
+    if part.function_response:
+        # Tool results can carry volatile values, so only the tool name is keyed.
+        return {"response": part.function_response.name}
+    if part.text and (relayed := _RELAYED_TOOL_RESULT.match(part.text)):
+        return relayed.group(1)
+    return part.text
+
+
+def request_fingerprint(llm_request: LlmRequest) -> str:
+    """Returns a stable fingerprint of a model request.
+
+    Function call ids and tool result payloads are left out, since they vary
+    between otherwise identical runs. So is the order of the events relayed
+    from other agents, which interleave differently from run to run when the
+    agents ran in parallel.
+    """
+    instruction = llm_request.config.system_instruction if llm_request.config else None
+    if isinstance(instruction, genai_types.Content):
+        instruction = "".join(part.text or "" for part in instruction.parts or [])
+    contents = []
+    relayed = []
+    for content in llm_request.contents:
+        parts = content.parts or []
+        key = [content.role, [_part_key(part) for part in parts]]
+        if parts and parts[0].text == _CONTEXT_MARKER:
+            relayed.append(key)
+        else:
+            contents.append(key)
+    contents.append(sorted(relayed, key=lambda k: json.dumps(k, default=str)))
+    material = json.dumps(
+        [str(instruction or ""), contents], sort_keys=True, default=str
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def request_step(llm_request: LlmRequest) -> int:
+    """Returns how many tool results the agent has received in its current turn.
+
+    This identifies the position in an agent's tool loop (0 for its first model
+    call, 1 after its first tool call, ...) independently of the exact prompt.
+    """
+    step = 0
+    for content in reversed(llm_request.contents):
+        parts = content.parts or []
+        if any(part.function_response for part in parts):
+            step += 1
+        elif not any(part.function_call for part in parts):
+            break
+    return step
+
+
+class Cassette:
+    """
+    A JSON file of recorded model interactions for one agent.
+
+    Each interaction stores the request fingerprint, the tool-loop step and the
+    responses the model returned. Lookups match on the fingerprint first and,
+    unless ``strict``, fall back to the first interaction recorded for the same
+    step, so a cassette recorded for one intent can replay a different one.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self.interactions: list[dict[str, Any]] = []
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version in {path}")
+            self.interactions = data["interactions"]
+
+    def find(
+        self, fingerprint: str, step: int, strict: bool = False
+    ) -> list[dict] | None:
+        """Returns the recorded responses for a request, if any."""
+        for interaction in self.interactions:
+            if interaction.get("fingerprint") == fingerprint:
+                return interaction["responses"]
+        if strict:
+            return None
+        for interaction in self.interactions:
+            if interaction.get("step") == step:
+                return interaction["responses"]
+        return None
+
+    def record(self, fingerprint: str, step: int, responses: list[dict]) -> None:
+        """Adds or replaces an interaction and writes the cassette to disk."""
+        with self._lock:
+            self.interactions = [
+                i for i in self.interactions if i.get("fingerprint") != fingerprint
+            ]
+            self.interactions.append(
+                {"fingerprint": fingerprint, "step": step, "responses": responses}
+            )
+            parent = os.path.dirname(self.path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(
+                    {"version": CASSETTE_VERSION, "interactions": self.interactions},
+                    f,
+                    indent=2,
+                )
+            os.replace(tmp_path, self.path)
+
+
+class CassetteLlm(BaseLlm):
+    """
+    A model backend that records model responses to a cassette or replays them.
+
+    In ``record`` mode, requests are forwarded to ``inner`` (a real model) and
+    the responses, including function calls, are written to the cassette. In
+    ``replay`` mode, responses are served from the cassette without any network
+    access, after a synthetic ``latency`` (seconds, or a function of the
+    request) that is spread over the streamed chunks.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    cassette_path: str
+    mode: Literal["record", "replay"] = "replay"
+    inner: BaseLlm | None = None
+    latency: float | Callable[[LlmRequest], float] = 0.0
+    strict: bool = False
+
+    _cassette: Cassette | None = PrivateAttr(default=None)
+
+    @classmethod
+    def supported_models(cls) -> list[str]:
+        return []
+
+    @property
+    def cassette(self) -> Cassette:
+        if self._cassette is None:
+            self._cassette = Cassette(self.cassette_path)
+        return self._cassette
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        fingerprint = request_fingerprint(llm_request)
+        step = request_step(llm_request)
+        if self.mode == "record":
+            async for response in self._record(llm_request, stream, fingerprint, step):
+                yield response
+            return
+
+        recorded = self.cassette.find(fingerprint, step, strict=self.strict)
+        if recorded is None:
+            raise LookupError(
+                f"No recorded response in {self.cassette_path} for step {step} "
+                f"(fingerprint {fingerprint[:12]})"
+            )
+        if not stream:
+            recorded = [r for r in recorded if not r.get("partial")] or recorded[-1:]
+        latency = self.latency(llm_request) if callable(self.latency) else self.latency
+        for data in recorded:
+            if latency:
+                await asyncio.sleep(latency / len(recorded))
+            yield LlmResponse.model_validate(data)
+
+    async def _record(
+        self, llm_request: LlmRequest, stream: bool, fingerprint: str, step: int
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if self.inner is None:
+            raise ValueError("Record mode needs an inner model to forward requests to")
+        responses = []
+        async for response in self.inner.generate_content_async(llm_request, stream):
+            responses.append(response.model_dump(mode="json", exclude_none=True))
+            yield response
+        await asyncio.to_thread(self.cassette.record, fingerprint, step, responses)
+        logging.info(f"Recorded {len(responses)} responses to {self.cassette_path}")
@@ -0,0 +1,465 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncGenerator
+from typing import Any
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from opentelemetry import trace
+from pydantic import ConfigDict, Field
+
+from app.utils.ratelimit import RateLimiter, is_rate_limited, rate_limiter
+
+
+def parse_routes(spec: str) -> dict[str, list[str]]:
+    """Parses ``agent=model|fallback,agent=model`` into a dict of model lists."""
+    routes = {}
+    for item in spec.split(","):
+        if item.strip():
+            agent, models = item.split("=", 1)
+            routes[agent.strip()] = [m.strip() for m in models.split("|") if m.strip()]
+    return routes
+
+
+class ModelHealth:
+    """
+    Rolling latency and error statistics of one model.
+
+    Keeps the last ``window`` calls that are at most ``window_s`` seconds old,
+    so a model that breached its SLO recovers once its slow calls age out.
+    """
+
+    def __init__(self, window: int = 100, window_s: float = 300.0) -> None:
+        self.window_s = window_s
+        self._samples: deque[tuple[float, float, bool, float | None]] = deque(
+            maxlen=window
+        )
+        self._throttled_until = 0.0
+        self._lock = threading.Lock()
+
+    def record(
+        self, latency_s: float, ok: bool, first_response_s: float | None = None
+    ) -> None:
+        with self._lock:
+            self._samples.append((time.monotonic(), latency_s, ok, first_response_s))
+
+    def throttle(self, seconds: float) -> None:
+        """Marks the model as rate limited for ``seconds``."""
+        with self._lock:
+            self._throttled_until = max(
+                self._throttled_until, time.monotonic() + seconds
+            )
+
+    def _recent(self) -> tuple[list[tuple], bool]:
+        now = time.monotonic()
+        with self._lock:
+            while self._samples and now - self._samples[0][0] > self.window_s:
+                self._samples.popleft()
+            return list(self._samples), now < self._throttled_until
+
+    def first_response_quantile(self, percentile: float) -> tuple[float | None, int]:
+        """Returns a percentile of the time to first response, and the sample count."""
+        samples, _ = self._recent()
+        values = sorted(
+            first for _, _, ok, first in samples if ok and first is not None
+        )
+        if not values:
+            return None, 0
+        index = min(len(values) - 1, max(0, round(percentile / 100 * len(values)) - 1))
+        return values[index], len(values)
+
+    def stats(self) -> dict[str, Any]:
+        """Returns the call count, p50/p95 latency of successful calls and error rate."""
+        samples, throttled = self._recent()
+        latencies = sorted(latency for _, latency, ok, _ in samples if ok)
+        p50 = p95 = None
+        if len(latencies) >= 2:
+            quantiles = statistics.quantiles(latencies, n=20, method="inclusive")
+            p50, p95 = statistics.median(latencies), quantiles[18]
+        elif latencies:
+            p50 = p95 = latencies[0]
+        errors = sum(not ok for _, _, ok, _ in samples)
+        return {
+            "calls": len(samples),
+            "p50_s": p50,
+            "p95_s": p95,
+            "error_rate": errors / len(samples) if samples else 0.0,
+            "throttled": throttled,
+        }
+
+
+class ModelHealthTracker:
+    """Process-wide ModelHealth per model name."""
+
+    def __init__(self, window: int = 100, window_s: float = 300.0) -> None:
+        self.window = window
+        self.window_s = window_s
+        self._models: dict[str, ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str) -> ModelHealth:
+        with self._lock:
+            if model not in self._models:
+                self._models[model] = ModelHealth(self.window, self.window_s)
+            return self._models[model]
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            models = dict(self._models)
+        return {model: health.stats() for model, health in models.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+
+model_health = ModelHealthTracker()
+
+
+class HedgeBudget:
+    """
+    Process-wide budget of hedged model requests, and their outcomes.
+
+    Every hedge-enabled request adds ``ratio`` of a token, up to ``burst``
+    tokens, and every hedge spends one. So hedges never exceed ``ratio`` of the
+    requests (plus the burst), however slow the models get.
+
+    Outcomes are counted, and recorded on ``metrics`` (a PipelineMetrics) once
+    one is bound, as ``model.hedges`` by agent and outcome: ``won`` (the hedge
+    answered first), ``lost`` or ``denied`` (the budget was exhausted).
+    """
+
+    def __init__(
+        self, ratio: float = 0.1, burst: float = 5.0, metrics: Any = None
+    ) -> None:
+        self.ratio = ratio
+        self.burst = burst
+        self.metrics = metrics
+        self._tokens = burst
+        self._counts = {"requests": 0, "won": 0, "lost": 0, "denied": 0}
+        self._lock = threading.Lock()
+
+    def request(self) -> None:
+        """Credits the budget for a hedge-enabled request."""
+        with self._lock:
+            self._counts["requests"] += 1
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def record(self, agent: str, outcome: str) -> None:
+        with self._lock:
+            self._counts[outcome] += 1
+        if self.metrics is not None:
+            self.metrics.add("model.hedges", agent=agent, outcome=outcome)
+
+    def stats(self) -> dict[str, float]:
+        """Returns the counts, the hedge rate (hedges per request) and the win rate."""
+        with self._lock:
+            counts = dict(self._counts)
+        hedges = counts["won"] + counts["lost"]
+        return {
+            **counts,
+            "hedge_rate": hedges / counts["requests"] if counts["requests"] else 0.0,
+            "win_rate": counts["won"] / hedges if hedges else 0.0,
+        }
+
+
+hedge_budget = HedgeBudget()
+
+
+async def _next_response(
+    responses: AsyncGenerator[LlmResponse, None],
+) -> LlmResponse | None:
+    try:
+        return await responses.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+_PROCESS_FIELDS = frozenset({"health", "limiter", "hedge_budget"})
+
+
+class RouterLlm(BaseLlm):
+    """
+    A model that routes each request to the first healthy model of a list,
+    under process-wide rate limits.
+
+    ``candidates`` are tried in order. A candidate is skipped while it breaches
+    its SLO, that is while it is rate limited (it returned a 429 less than
+    ``cooldown_s`` ago), or, once it has ``min_samples`` recent calls, while its
+    p95 latency exceeds ``latency_slo_s`` or its error rate exceeds
+    ``max_error_rate``. If every candidate breaches, they are tried in order
+    anyway. A request that gets a 429 before any response was streamed fails
+    over to the next candidate; on the last candidate, it is retried up to
+    ``max_attempts`` attempts in all.
+
+    Every attempt is admitted by ``limiter`` (the process-wide RateLimiter) under
+    the model's rate limit, and every 429 applies backpressure to that model,
+    so retries wait behind it.
+
+    With ``hedge`` set, a request whose model has not answered (its first
+    streamed chunk, or its whole response) within ``hedge_percentile`` of the
+    model's recent time to first response is sent again to the same model. The
+    first of the two to answer is used and the other is cancelled. Until the
+    model has ``min_samples`` calls, ``hedge_delay_s`` is used instead. Hedges
+    are limited by ``hedge_budget``, so they cannot double the spend.
+
+    Each call sets ``routing.*`` attributes on the current span (the ADK
+    ``call_llm`` span), and each failover adds a span event, so routing
+    decisions are visible in traces. ``llm_request.model`` is set to the chosen
+    model, so ``gen_ai.request.model`` shows it too.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    candidates: list[BaseLlm]
+    latency_slo_s: float | None = None
+    max_error_rate: float = 0.5
+    min_samples: int = 5
+    cooldown_s: float = 30.0
+    max_attempts: int = 5
+    agent_name: str = ""
+    hedge: bool = False
+    hedge_percentile: float = 95.0
+    hedge_delay_s: float = 2.0
+    health: ModelHealthTracker = Field(
+        default_factory=lambda: model_health, exclude=True
+    )
+    limiter: RateLimiter = Field(default_factory=lambda: rate_limiter, exclude=True)
+    hedge_budget: HedgeBudget = Field(
+        default_factory=lambda: hedge_budget, exclude=True
+    )
+
+    @classmethod
+    def supported_models(cls) -> list[str]:
+        return []
+
+    def __getstate__(self) -> dict[Any, Any]:
+        # The health tracker, rate limiter and hedge budget hold locks and belong
+        # to a process: a pickled router (as deployed to Agent Engine) uses those
+        # of the process that loads it.
+        state = super().__getstate__()
+        state["__dict__"] = {
+            name: value
+            for name, value in state["__dict__"].items()
+            if name not in _PROCESS_FIELDS
+        }
+        return state
+
+    def __setstate__(self, state: dict[Any, Any]) -> None:
+        state["__dict__"] = {
+            **state["__dict__"],
+            "health": model_health,
+            "limiter": rate_limiter,
+            "hedge_budget": hedge_budget,
+        }
+        super().__setstate__(state)
+
+    def breach(self, model: str) -> str | None:
+        """Returns why a model currently breaches its SLO, or None."""
+        stats = self.health.get(model).stats()
+        if stats["throttled"]:
+            return "rate_limited"
+        if stats["calls"] < self.min_samples:
+            return None
+        if stats["error_rate"] > self.max_error_rate:
+            return "error_rate"
+        if (
+            self.latency_slo_s is not None
+            and (stats["p95_s"] or 0) > self.latency_slo_s
+        ):
+            return "latency_slo"
+        return None
+
+    def route(self) -> list[tuple[BaseLlm, str]]:
+        """Returns the candidates in the order to try them, each with the reason."""
+        breaches = [self.breach(llm.model) for llm in self.candidates]
+        healthy = [
+            llm for llm, b in zip(self.candidates, breaches, strict=True) if b is None
+        ]
+        unhealthy = [
+            llm
+            for llm, b in zip(self.candidates, breaches, strict=True)
+            if b is not None
+        ]
+        primary_breach = breaches[0]
+        order = []
+        for llm in healthy + unhealthy:
+            if llm is self.candidates[0]:
+                reason = "primary" if primary_breach is None else "all_breached"
+            else:
+                reason = f"failover:{primary_breach}" if primary_breach else "failover"
+            order.append((llm, reason))
+        return order
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        span = trace.get_current_span()
+        order = self.route()
+        index = 0
+        for attempt in range(1, self.max_attempts + 1):
+            llm, reason = order[index]
+            health = self.health.get(llm.model)
+            llm_request.model = llm.model
+            wait_s = await self.limiter.acquire(llm.model)
+            span.set_attributes(
+                {
+                    "routing.model": llm.model,
+                    "routing.reason": reason,
+                    "routing.attempt": attempt,
+                    "routing.candidates": [c.model for c in self.candidates],
+                    "ratelimit.wait_s": wait_s,
+                }
+            )
+            start = time.perf_counter()
+            responded = False
+            first_response_s = None
+            try:
+                async for response in self._generate(llm, llm_request, stream, span):
+                    if not responded:
+                        responded = True
+                        first_response_s = time.perf_counter() - start
+                    yield response
+            except Exception as e:
+                health.record(time.perf_counter() - start, ok=False)
+                if not is_rate_limited(e) or responded or attempt == self.max_attempts:
+                    raise
+                health.throttle(self.cooldown_s)
+                delay = self.limiter.throttled(llm.model, e, attempt, self.agent_name)
+                if index + 1 < len(order):
+                    index += 1
+                    order[index] = (order[index][0], "failover:rate_limited")
+                    event = "routing.failover"
+                else:
+                    event = "routing.retry"
+                span.add_event(
+                    event,
+                    {
+                        "routing.from_model": llm.model,
+                        "routing.error": type(e).__name__,
+                        "ratelimit.backoff_s": delay,
+                    },
+                )
+                continue
+            health.record(
+                time.perf_counter() - start, ok=True, first_response_s=first_response_s
+            )
+            self.limiter.succeeded(llm.model)
+            return
+
+    def hedge_after(self, model: str) -> float:
+        """Returns how long to wait for a model's first response before hedging."""
+        delay, samples = self.health.get(model).first_response_quantile(
+            self.hedge_percentile
+        )
+        if delay is None or samples < self.min_samples:
+            return self.hedge_delay_s
+        return delay
+
+    async def _generate(
+        self, llm: BaseLlm, llm_request: LlmRequest, stream: bool, span: Any
+    ) -> AsyncGenerator[LlmResponse, None]:
+        responses = llm.generate_content_async(llm_request, stream)
+        if not self.hedge:
+            async for response in responses:
+                yield response
+            return
+
+        self.hedge_budget.request()
+        first = asyncio.ensure_future(_next_response(responses))
+        runs = {first: responses}
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after(llm.model))
+        if not done:
+            if self.hedge_budget.try_spend():
+                hedge_responses = llm.generate_content_async(
+                    llm_request.model_copy(deep=True), stream
+                )
+
+                async def start_hedge() -> LlmResponse | None:
+                    await self.limiter.acquire(llm.model)
+                    return await _next_response(hedge_responses)
+
+                runs[asyncio.ensure_future(start_hedge())] = hedge_responses
+            else:
+                self.hedge_budget.record(self.agent_name, "denied")
+
+        winner: asyncio.Task[LlmResponse | None] | None = None
+        pending = set(runs)
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                # Prefer the original request when both answered in the same tick.
+                for task in sorted(done, key=lambda t: t is not first):
+                    if not task.cancelled() and task.exception() is None:
+                        winner = task
+                        break
+            if winner is None:
+                # Both failed; surface the original request's error.
+                await first
+        finally:
+            for task in pending:
+                task.cancel()
+            for task, run in runs.items():
+                if task is not winner:
+                    await asyncio.gather(task, return_exceptions=True)
+                    await run.aclose()
+
+        if len(runs) > 1:
+            outcome = "lost" if winner is first else "won"
+            self.hedge_budget.record(self.agent_name, outcome)
+            span.set_attributes(
+                {"routing.hedged": True, "routing.hedge_outcome": outcome}
+            )
+        # The loop above re-raised the original error when no request succeeded.
+        assert winner is not None
+        first_response = winner.result()
+        if first_response is None:
+            return
+        yield first_response
+        async for response in runs[winner]:
+            yield response
+
+
+def router_settings(agent_name: str = "") -> dict[str, Any]:
+    """Returns RouterLlm settings from ``MODEL_LATENCY_SLO_S``,
+    ``MODEL_MAX_ERROR_RATE``, ``MODEL_MIN_SAMPLES``, ``MODEL_FAILOVER_COOLDOWN_S``
+    and ``MODEL_MAX_ATTEMPTS``, and hedging for the agents listed in
+    ``HEDGE_AGENTS`` with ``HEDGE_PERCENTILE`` and ``HEDGE_DELAY_S``."""
+    slo = os.environ.get("MODEL_LATENCY_SLO_S")
+    hedge_agents = {a.strip() for a in os.environ.get("HEDGE_AGENTS", "").split(",")}
+    return {
+        "hedge": bool(agent_name) and agent_name in hedge_agents,
+        "hedge_percentile": float(os.environ.get("HEDGE_PERCENTILE", "95")),
+        "hedge_delay_s": float(os.environ.get("HEDGE_DELAY_S", "2")),
+        "latency_slo_s": float(slo) if slo else None,
+        "max_error_rate": float(os.environ.get("MODEL_MAX_ERROR_RATE", "0.5")),
+        "min_samples": int(os.environ.get("MODEL_MIN_SAMPLES", "5")),
+        "cooldown_s": float(os.environ.get("MODEL_FAILOVER_COOLDOWN_S", "30")),
+        "max_attempts": int(os.environ.get("MODEL_MAX_ATTEMPTS", "5")),
+    }
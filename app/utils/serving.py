@@ -0,0 +1,351 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import os
+import signal
+import statistics
+import time
+from collections.abc import AsyncIterator
+from typing import Any
+
+from google.adk.runners import Runner
+
+from app.utils.batch import CampaignIntent, load_intents, run_campaign
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTENT = (
+    "We are launching a new summer collection of cat print t-shirts. We need "
+    "assets for an X/Twitter campaign with a relaxed, holiday vibe."
+)
+
+
+class WorkerDraining(RuntimeError):
+    """Raised when a campaign is submitted to a worker that is draining."""
+
+
+def worker_settings() -> tuple[int, int]:
+    """Returns the worker processes (``NUM_WORKERS``) and sessions per worker
+    (``SESSION_CONCURRENCY``) configured in the environment."""
+    workers = max(1, int(os.environ.get("NUM_WORKERS", "1")))
+    sessions = max(1, int(os.environ.get("SESSION_CONCURRENCY", "16")))
+    return workers, sessions
+
+
+class CampaignWorker:
+    """
+    Runs campaigns as concurrent asyncio sessions on one shared Runner.
+
+    A worker belongs to one process and one event loop. Its runner, and with it
+    the agents, model clients and session service, is built once and reused by
+    every campaign. At most ``max_sessions`` campaigns run at once; the others
+    wait for a slot. ``drain`` stops admitting campaigns and waits for the ones
+    already admitted.
+    """
+
+    def __init__(self, runner: Runner, max_sessions: int = 16) -> None:
+        """
+        :param runner: Runner shared by every campaign of this worker
+        :param max_sessions: Maximum number of campaigns running at once
+        """
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.runner = runner
+        self.max_sessions = max_sessions
+        self.draining = False
+        self.in_flight = 0
+        self.stats = {"ok": 0, "error": 0, "rejected": 0}
+        self._slots = asyncio.Semaphore(max_sessions)
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def waiting(self) -> int:
+        """Admitted campaigns waiting for a session slot."""
+        return max(0, self.in_flight - self.max_sessions)
+
+    @contextlib.asynccontextmanager
+    async def session_slot(self) -> AsyncIterator[None]:
+        """Admits one campaign and holds a session slot while it runs.
+
+        Raises:
+            WorkerDraining: If the worker is draining.
+        """
+        if self.draining:
+            self.stats["rejected"] += 1
+            raise WorkerDraining("worker is draining")
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            async with self._slots:
+                yield
+        finally:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self._idle.set()
+
+    async def run(self, intent: CampaignIntent) -> dict[str, Any]:
+        """Runs one campaign and returns its result record.
+
+        Failures are returned as records with status ``error``, as in a batch.
+
+        Raises:
+            WorkerDraining: If the worker is draining.
+        """
+        async with self.session_slot():
+            try:
+                record = await run_campaign(self.runner, intent)
+            except Exception as e:
+                logger.exception("Campaign %s failed", intent.id)
+                record = {
+                    "id": intent.id,
+                    "intent": intent.intent,
+                    "status": "error",
+                    "error": f"{type(e).__name__}: {e}",
+                }
+        self.stats[record["status"]] += 1
+        return record
+
+    async def stream(
+        self, user_id: str, session_id: str, new_message: Any, **kwargs: Any
+    ) -> AsyncIterator[Any]:
+        """Runs one query in a session slot and yields the runner's events.
+
+        Args:
+            user_id: The session's user.
+            session_id: An existing session.
+            new_message: The user message.
+            **kwargs: Passed to ``Runner.run_async``, e.g. ``run_config``.
+
+        Raises:
+            WorkerDraining: If the worker is draining.
+        """
+        async with self.session_slot():
+            try:
+                async for event in self.runner.run_async(
+                    user_id=user_id,
+                    session_id=session_id,
+                    new_message=new_message,
+                    **kwargs,
+                ):
+                    yield event
+            except Exception:
+                self.stats["error"] += 1
+                raise
+        self.stats["ok"] += 1
+
+    async def drain(self, timeout: float | None = None) -> bool:
+        """Stops admitting campaigns and waits for the admitted ones to finish.
+
+        Args:
+            timeout: Seconds to wait at most; None waits indefinitely.
+
+        Returns:
+            True if every admitted campaign finished within the timeout.
+        """
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+def build_runner() -> Runner:
+    """Builds this process's runner around the cached root agent."""
+    from app.agent import get_root_agent
+    from app.utils.sessions import create_session_service
+
+    return Runner(
+        agent=get_root_agent(), app_name="app", session_service=create_session_service()
+    )
+
+
+def _worker_process(
+    worker_id: int,
+    intents: list[CampaignIntent],
+    max_sessions: int,
+    ready: Any,
+    start: Any,
+    results: Any,
+) -> None:
+    """Entry point of a harness worker process.
+
+    The runner is built and warmed up with one campaign before the worker
+    reports ready, so the measured time excludes process start-up. SIGTERM
+    drains the worker: campaigns not yet admitted are skipped, and admitted
+    ones finish.
+    """
+
+    async def main() -> tuple[list[dict[str, Any]], float]:
+        worker = CampaignWorker(build_runner(), max_sessions=max_sessions)
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, lambda: asyncio.ensure_future(worker.drain())
+        )
+        await worker.run(CampaignIntent(id=f"warmup-{worker_id}", intent=SAMPLE_INTENT))
+        ready.put(worker_id)
+        await asyncio.to_thread(start.wait)
+
+        pending = list(reversed(intents))
+        records: list[dict[str, Any]] = []
+
+        async def session() -> None:
+            # Campaigns are admitted one session at a time, so a drain skips the
+            # ones that have not started yet.
+            while pending:
+                intent = pending.pop()
+                try:
+                    records.append(await worker.run(intent))
+                except WorkerDraining:
+                    records.append(
+                        {"id": intent.id, "intent": intent.intent, "status": "drained"}
+                    )
+
+        began = time.perf_counter()
+        await asyncio.gather(*(session() for _ in range(max_sessions)))
+        return records, time.perf_counter() - began
+
+    records, elapsed = asyncio.run(main())
+    results.put((worker_id, records, elapsed))
+
+
+def run_worker_pool(
+    intents: list[CampaignIntent], workers: int, max_sessions: int
+) -> dict[str, Any]:
+    """Runs intents on ``workers`` processes of ``max_sessions`` sessions each.
+
+    Intents are sharded round-robin across the workers. Every worker builds its
+    own runner, so nothing is shared between processes.
+
+    Args:
+        intents: The campaigns to run.
+        workers: Number of worker processes.
+        max_sessions: Concurrent campaigns per worker.
+
+    Returns:
+        Counts by status, the wall time and throughput, and the p50/p95 campaign
+        latency.
+    """
+    context = multiprocessing.get_context("spawn")
+    ready, results, start = context.Queue(), context.Queue(), context.Event()
+    processes = [
+        context.Process(
+            target=_worker_process,
+            args=(i, intents[i::workers], max_sessions, ready, start, results),
+            daemon=True,
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for _ in processes:
+            ready.get()
+        began = time.perf_counter()
+        start.set()
+        records = []
+        for _ in processes:
+            _, worker_records, _ = results.get()
+            records.extend(worker_records)
+        wall_s = time.perf_counter() - began
+    except KeyboardInterrupt:
+        # Let the workers finish their admitted campaigns before exiting.
+        for process in processes:
+            if process.pid:
+                os.kill(process.pid, signal.SIGTERM)
+        raise
+    finally:
+        for process in processes:
+            process.join(timeout=30)
+
+    counts: dict[str, int] = {}
+    for record in records:
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+    latencies = sorted(r["total_s"] for r in records if "total_s" in r)
+    return {
+        "workers": workers,
+        "sessions": max_sessions,
+        "campaigns": len(records),
+        "counts": counts,
+        "wall_s": round(wall_s, 3),
+        "throughput": round(len(records) / wall_s, 2) if wall_s else 0.0,
+        "p50_s": round(statistics.median(latencies), 3) if latencies else None,
+        "p95_s": (
+            round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3)
+            if latencies
+            else None
+        ),
+    }
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Measures campaign throughput as the number of worker processes grows."""
+    default_workers, default_sessions = worker_settings()
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, default_workers}),
+        help="Worker process counts to measure",
+    )
+    parser.add_argument("--sessions", type=int, default=default_sessions)
+    parser.add_argument("--campaigns", type=int, default=64)
+    parser.add_argument(
+        "--intents",
+        default=None,
+        help="JSONL file of intents to cycle through (default: a sample intent)",
+    )
+    args = parser.parse_args(argv)
+
+    # The harness measures our own orchestration against the offline model stub.
+    os.environ.setdefault("MODEL_BACKEND", "replay")
+    os.environ.setdefault("LLM_CACHE_AGENTS", "")
+    pool = (
+        load_intents(args.intents)
+        if args.intents
+        else [CampaignIntent(id="sample", intent=SAMPLE_INTENT)]
+    )
+    intents = [
+        CampaignIntent(
+            id=f"{pool[i % len(pool)].id}-{i}", intent=pool[i % len(pool)].intent
+        )
+        for i in range(args.campaigns)
+    ]
+
+    print(
+        f"{'workers':>7} {'sessions':>8} {'campaigns':>9} {'wall s':>8} {'per s':>8} "
+        f"{'per s/worker':>12} {'speedup':>7} {'p50 s':>7} {'p95 s':>7}"
+    )
+    # Speedup is relative to the per-worker throughput of the first row.
+    per_worker_baseline = None
+    for workers in args.workers:
+        result = run_worker_pool(intents, workers, args.sessions)
+        per_worker_baseline = per_worker_baseline or result["throughput"] / workers
+        print(
+            f"{workers:>7} {args.sessions:>8} {result['campaigns']:>9} {result['wall_s']:>8.2f} "
+            f"{result['throughput']:>8.2f} {result['throughput'] / workers:>12.2f} "
+            f"{result['throughput'] / per_worker_baseline:>7.2f} {result['p50_s']:>7} {result['p95_s']:>7}"
+        )
+        if set(result["counts"]) - {"ok"}:
+            print(f"        non-ok campaigns: {result['counts']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import (
+    GetSessionConfig,
+    ListSessionsResponse,
+)
+
+APP_PREFIX = "app:"
+USER_PREFIX = "user:"
+TEMP_PREFIX = "temp:"
+
+SessionKey = tuple[str, str, str]
+
+
+class BoundedSessionService(BaseSessionService):
+    """
+    A session service whose memory use stays flat however many sessions it serves.
+
+    Sessions are kept in an LRU cache of at most ``max_sessions`` entries.
+    Sessions idle for longer than ``ttl_seconds`` are evicted too. Each session's
+    event history is compacted to its last ``max_events`` events. Only events of
+    earlier invocations are dropped, never those of the invocation being run.
+    Their state changes are already part of the session state.
+
+    Without ``db_path``, evicted sessions are gone, as with a cache. With
+    ``db_path``, sessions, app state and user state are also written to a local
+    SQLite database, so evicted sessions are reloaded on demand and survive
+    restarts. The database runs in WAL mode. Writes are batched: a background
+    thread writes the latest snapshot of every changed session in one
+    transaction, every ``flush_interval_s`` seconds, or sooner once
+    ``flush_batch_size`` sessions have changed. ``close`` (also run at exit)
+    writes what is left.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        ttl_seconds: float = 3600.0,
+        max_events: int = 200,
+        db_path: str | None = None,
+        flush_interval_s: float = 0.5,
+        flush_batch_size: int = 200,
+    ) -> None:
+        """
+        :param max_sessions: Maximum number of sessions kept in memory
+        :param ttl_seconds: Idle time after which a session is evicted from memory
+        :param max_events: Events kept per session after compaction
+        :param db_path: SQLite database file for persistence; in memory only if None
+        :param flush_interval_s: Maximum delay before changes are written
+        :param flush_batch_size: Number of changed sessions that triggers a write
+        """
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_events = max_events
+        self.db_path = db_path
+        self.flush_interval_s = flush_interval_s
+        self.flush_batch_size = flush_batch_size
+        self.stats = {
+            "evicted_lru": 0,
+            "evicted_ttl": 0,
+            "compacted_events": 0,
+            "loaded": 0,
+            "flushes": 0,
+            "rows_written": 0,
+        }
+        self._lock = threading.RLock()
+        self._sessions: OrderedDict[SessionKey, Session] = OrderedDict()
+        self._accessed: dict[SessionKey, float] = {}
+        self._app_state: dict[str, dict[str, Any]] = {}
+        self._user_state: dict[tuple[str, str], dict[str, Any]] = {}
+        self._dirty: set[SessionKey] = set()
+        self._dirty_app: set[str] = set()
+        self._dirty_user: set[tuple[str, str]] = set()
+        self._evicted_rows: dict[SessionKey, str] = {}
+        self._deleted: set[SessionKey] = set()
+
+        self._conn: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._writer: threading.Thread | None = None
+        if db_path:
+            parent = os.path.dirname(db_path)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            self._conn = sqlite3.connect(
+                db_path, check_same_thread=False, isolation_level=None
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " app_name TEXT NOT NULL, user_id TEXT NOT NULL, id TEXT NOT NULL,"
+                " data TEXT NOT NULL, update_time REAL NOT NULL,"
+                " PRIMARY KEY (app_name, user_id, id))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS app_states ("
+                " app_name TEXT PRIMARY KEY, state TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_states ("
+                " app_name TEXT NOT NULL, user_id TEXT NOT NULL, state TEXT NOT NULL,"
+                " PRIMARY KEY (app_name, user_id))"
+            )
+            self._writer = threading.Thread(
+                target=self._write_loop, name="session-writer", daemon=True
+            )
+            self._writer.start()
+            atexit.register(self.close)
+
+    # --- BaseSessionService ---
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: dict[str, Any] | None = None,
+        session_id: str | None = None,
+    ) -> Session:
+        if session_id and session_id.strip():
+            session_id = session_id.strip()
+            if await self._get_stored((app_name, user_id, session_id)) is not None:
+                raise ValueError(f"Session {session_id} already exists")
+        else:
+            session_id = str(uuid.uuid4())
+        key = (app_name, user_id, session_id)
+        session_state = {}
+        await self._load_state(app_name, user_id)
+        with self._lock:
+            for name, value in (state or {}).items():
+                if name.startswith(APP_PREFIX):
+                    self._app_state_locked(app_name)[name[len(APP_PREFIX) :]] = value
+                    self._dirty_app.add(app_name)
+                elif name.startswith(USER_PREFIX):
+                    self._user_state_locked(app_name, user_id)[
+                        name[len(USER_PREFIX) :]
+                    ] = value
+                    self._dirty_user.add((app_name, user_id))
+                elif not name.startswith(TEMP_PREFIX):
+                    session_state[name] = value
+            session = Session(
+                id=session_id,
+                app_name=app_name,
+                user_id=user_id,
+                state=session_state,
+                last_update_time=time.time(),
+            )
+            self._deleted.discard(key)
+            self._store_locked(key, session)
+            return self._merged_copy_locked(session)
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: GetSessionConfig | None = None,
+    ) -> Session | None:
+        session = await self._get_stored((app_name, user_id, session_id))
+        if session is None:
+            return None
+        await self._load_state(app_name, user_id)
+        with self._lock:
+            copy = self._merged_copy_locked(session)
+        if config:
+            if config.num_recent_events:
+                copy.events = copy.events[-config.num_recent_events :]
+            if config.after_timestamp:
+                copy.events = [
+                    e for e in copy.events if e.timestamp >= config.after_timestamp
+                ]
+        return copy
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: str
+    ) -> ListSessionsResponse:
+        with self._lock:
+            sessions = {
+                key[2]: session
+                for key, session in self._sessions.items()
+                if key[:2] == (app_name, user_id)
+            }
+        if self._conn is not None:
+            await asyncio.to_thread(self.flush)
+            rows = await asyncio.to_thread(self._read_sessions, app_name, user_id)
+            for session_id, data in rows:
+                sessions.setdefault(session_id, Session.model_validate_json(data))
+        listed = []
+        for session in sessions.values():
+            copy = session.model_copy(deep=True)
+            copy.events = []
+            listed.append(copy)
+        return ListSessionsResponse(sessions=listed)
+
+    async def delete_session(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> None:
+        key = (app_name, user_id, session_id)
+        with self._lock:
+            self._sessions.pop(key, None)
+            self._accessed.pop(key, None)
+            self._dirty.discard(key)
+            self._evicted_rows.pop(key, None)
+            if self._conn is not None:
+                self._deleted.add(key)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+        key = (session.app_name, session.user_id, session.id)
+        await self._load_state(session.app_name, session.user_id)
+        with self._lock:
+            stored = self._sessions.get(key)
+            if stored is None:
+                # Evicted while the invocation was running: the caller's copy is
+                # complete, since it was loaded at the start of the invocation.
+                stored = session.model_copy(deep=True)
+            else:
+                stored.events.append(event)
+                stored.last_update_time = event.timestamp
+            delta = event.actions.state_delta if event.actions else None
+            for name, value in (delta or {}).items():
+                if stored is not session and not name.startswith(TEMP_PREFIX):
+                    stored.state[name] = value
+                if name.startswith(APP_PREFIX):
+                    self._app_state_locked(session.app_name)[
+                        name[len(APP_PREFIX) :]
+                    ] = value
+                    self._dirty_app.add(session.app_name)
+                elif name.startswith(USER_PREFIX):
+                    state = self._user_state_locked(session.app_name, session.user_id)
+                    state[name[len(USER_PREFIX) :]] = value
+                    self._dirty_user.add((session.app_name, session.user_id))
+            self._compact_locked(stored, event.invocation_id)
+            self._store_locked(key, stored)
+        return event
+
+    # --- Memory ---
+
+    async def _get_stored(self, key: SessionKey) -> Session | None:
+        with self._lock:
+            self._evict_locked()
+            session = self._sessions.get(key)
+            if session is not None:
+                self._touch_locked(key)
+                return session
+            if self._conn is None or key in self._deleted:
+                return None
+            data = self._evicted_rows.get(key)
+        if data is None:
+            data = await asyncio.to_thread(self._read_session, key)
+        if data is None:
+            return None
+        loaded = Session.model_validate_json(data)
+        with self._lock:
+            if key in self._deleted:
+                return None
+            session = self._sessions.get(key)
+            if session is None:
+                session = loaded
+                self._sessions[key] = session
+                self.stats["loaded"] += 1
+                # A snapshot evicted before it was written is still pending.
+                if self._evicted_rows.pop(key, None) is not None:
+                    self._dirty.add(key)
+            self._touch_locked(key)
+            self._evict_locked()
+            return session
+
+    def _touch_locked(self, key: SessionKey) -> None:
+        self._sessions.move_to_end(key)
+        self._accessed[key] = time.monotonic()
+
+    def _store_locked(self, key: SessionKey, session: Session) -> None:
+        self._sessions[key] = session
+        self._touch_locked(key)
+        if self._conn is not None:
+            self._dirty.add(key)
+            if len(self._dirty) >= self.flush_batch_size:
+                self._wake.set()
+        self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        now = time.monotonic()
+        while self._sessions:
+            key = next(iter(self._sessions))
+            if now - self._accessed[key] > self.ttl_seconds:
+                self.stats["evicted_ttl"] += 1
+            elif len(self._sessions) > self.max_sessions:
+                self.stats["evicted_lru"] += 1
+            else:
+                break
+            session = self._sessions.pop(key)
+            self._accessed.pop(key, None)
+            if key in self._dirty:
+                self._dirty.discard(key)
+                self._evicted_rows[key] = session.model_dump_json()
+
+    def _compact_locked(self, session: Session, invocation_id: str) -> None:
+        excess = len(session.events) - self.max_events
+        drop = 0
+        while drop < excess and session.events[drop].invocation_id != invocation_id:
+            drop += 1
+        if drop:
+            del session.events[:drop]
+            self.stats["compacted_events"] += drop
+
+    async def _load_state(self, app_name: str, user_id: str) -> None:
+        """Reads the app and user state from the database, off the event loop and
+        outside the lock, unless they are already in memory."""
+        with self._lock:
+            if self._conn is None or (
+                app_name in self._app_state and (app_name, user_id) in self._user_state
+            ):
+                return
+        app_state = await asyncio.to_thread(
+            self._read_state,
+            "SELECT state FROM app_states WHERE app_name = ?",
+            (app_name,),
+        )
+        user_state = await asyncio.to_thread(
+            self._read_state,
+            "SELECT state FROM user_states WHERE app_name = ? AND user_id = ?",
+            (app_name, user_id),
+        )
+        with self._lock:
+            # Changes made while reading are newer than the stored state.
+            self._app_state.setdefault(app_name, app_state)
+            self._user_state.setdefault((app_name, user_id), user_state)
+
+    def _app_state_locked(self, app_name: str) -> dict[str, Any]:
+        return self._app_state.setdefault(app_name, {})
+
+    def _user_state_locked(self, app_name: str, user_id: str) -> dict[str, Any]:
+        return self._user_state.setdefault((app_name, user_id), {})
+
+    def _merged_copy_locked(self, session: Session) -> Session:
+        copy = session.model_copy(deep=True)
+        for name, value in self._app_state_locked(session.app_name).items():
+            copy.state[APP_PREFIX + name] = value
+        for name, value in self._user_state_locked(
+            session.app_name, session.user_id
+        ).items():
+            copy.state[USER_PREFIX + name] = value
+        return copy
+
+    # --- Persistence ---
+
+    def _read_session(self, key: SessionKey) -> str | None:
+        if self._conn is None:
+            return None
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT data FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                key,
+            ).fetchone()
+        return row[0] if row else None
+
+    def _read_sessions(self, app_name: str, user_id: str) -> list[tuple[str, str]]:
+        if self._conn is None:
+            return []
+        with self._db_lock:
+            return self._conn.execute(
+                "SELECT id, data FROM sessions WHERE app_name = ? AND user_id = ?",
+                (app_name, user_id),
+            ).fetchall()
+
+    def _read_state(self, query: str, params: tuple) -> dict[str, Any]:
+        if self._conn is None:
+            return {}
+        with self._db_lock:
+            row = self._conn.execute(query, params).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def flush(self) -> int:
+        """Writes every pending change in one transaction; returns the sessions written."""
+        if self._conn is None:
+            return 0
+        with self._lock:
+            rows = dict(self._evicted_rows)
+            self._evicted_rows.clear()
+            for key in self._dirty:
+                rows[key] = self._sessions[key].model_dump_json()
+            self._dirty.clear()
+            deleted = list(self._deleted)
+            self._deleted.clear()
+            app_rows = [(a, json.dumps(self._app_state[a])) for a in self._dirty_app]
+            self._dirty_app.clear()
+            user_rows = [
+                (a, u, json.dumps(self._user_state[(a, u)]))
+                for a, u in self._dirty_user
+            ]
+            self._dirty_user.clear()
+        if not (rows or deleted or app_rows or user_rows):
+            return 0
+        now = time.time()
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                    deleted,
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                    [(*key, data, now) for key, data in rows.items()],
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO app_states VALUES (?, ?)", app_rows
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO user_states VALUES (?, ?, ?)", user_rows
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.stats["flushes"] += 1
+        self.stats["rows_written"] += len(rows)
+        return len(rows)
+
+    def _write_loop(self) -> None:
+        while not self._closed.is_set():
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.warning(f"Failed to write sessions to {self.db_path}: {e}")
+
+    def memory_stats(self) -> dict[str, int]:
+        """Returns the number of sessions and events held in memory, and pending writes."""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "events": sum(len(s.events) for s in self._sessions.values()),
+                "pending_writes": len(self._dirty) + len(self._evicted_rows),
+            }
+
+    def close(self) -> None:
+        """Stops the writer thread and writes the remaining changes."""
+        if self._conn is None or self._closed.is_set():
+            return
+        self._closed.set()
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join()
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+        atexit.unregister(self.close)
+
+
+def create_session_service() -> BaseSessionService:
+    """
+    Returns the session service configured by the environment.
+
+    ``SESSION_DB_PATH`` enables SQLite persistence. ``SESSION_MAX_SESSIONS``,
+    ``SESSION_TTL_SECONDS`` and ``SESSION_MAX_EVENTS`` bound memory use.
+    """
+    return BoundedSessionService(
+        max_sessions=int(os.environ.get("SESSION_MAX_SESSIONS", "1000")),
+        ttl_seconds=float(os.environ.get("SESSION_TTL_SECONDS", "3600")),
+        max_events=int(os.environ.get("SESSION_MAX_EVENTS", "200")),
+        db_path=os.environ.get("SESSION_DB_PATH") or None,
+    )
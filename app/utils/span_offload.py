@@ -0,0 +1,292 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Span log entries shared by the span exporters.
+
+Kept apart from ``app.utils.tracing`` so the local exporters do not load the
+Google Cloud client libraries.
+"""
+
+import gzip
+import json
+import logging
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any
+
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.util import ns_to_iso_str
+from opentelemetry.trace import (
+    INVALID_SPAN_CONTEXT,
+    SpanContext,
+    format_span_id,
+    format_trace_id,
+)
+
+from app.utils.gcs import PayloadStore
+
+LARGE_ATTRIBUTES_BYTES = 255 * 1024  # 250 KB
+# Bytes of a value kept inline in the log entry when it could not be offloaded.
+_INLINE_PREVIEW_BYTES = 1024
+# Upper bound on the encoded size of the reference that replaces an offloaded value.
+# Escaping can at most double the size of the ASCII preview.
+_REFERENCE_BYTES = 512 + 2 * _INLINE_PREVIEW_BYTES
+
+
+def _format_attributes(attributes: Any) -> dict[str, Any]:
+    """Copy span attributes into a JSON-compatible dict (sequences become lists)."""
+    if not attributes:
+        return {}
+    return {
+        key: list(value) if isinstance(value, tuple) else value
+        for key, value in attributes.items()
+    }
+
+
+def _format_context(context: SpanContext) -> dict[str, str]:
+    return {
+        "trace_id": f"0x{format_trace_id(context.trace_id)}",
+        "span_id": f"0x{format_span_id(context.span_id)}",
+        "trace_state": repr(context.trace_state),
+    }
+
+
+_resource_cache: dict[int, tuple[Resource, dict[str, Any]]] = {}
+
+
+def _format_resource(resource: Resource) -> dict[str, Any]:
+    """Format a resource once; spans from one provider share the same instance."""
+    cached = _resource_cache.get(id(resource))
+    if cached is None or cached[0] is not resource:
+        formatted = {
+            "attributes": _format_attributes(resource.attributes),
+            "schema_url": resource.schema_url,
+        }
+        if len(_resource_cache) > 64:
+            _resource_cache.clear()
+        _resource_cache[id(resource)] = (resource, formatted)
+        return formatted
+    return cached[1]
+
+
+def span_to_dict(span: ReadableSpan) -> dict[str, Any]:
+    """
+    Build the same dict as ``json.loads(span.to_json())`` directly from the span,
+    without serializing it to a JSON string and parsing it back.
+
+    :param span: The finished span
+    :return: A JSON-compatible dict describing the span
+    """
+    status: dict[str, str] = {"status_code": span.status.status_code.name}
+    if span.status.description:
+        status["description"] = span.status.description
+    context = span.get_span_context()
+    return {
+        "name": span.name,
+        "context": _format_context(context) if context else None,
+        "kind": str(span.kind),
+        "parent_id": f"0x{format_span_id(span.parent.span_id)}"
+        if span.parent
+        else None,
+        "start_time": ns_to_iso_str(span.start_time) if span.start_time else None,
+        "end_time": ns_to_iso_str(span.end_time) if span.end_time else None,
+        "status": status,
+        "attributes": _format_attributes(span.attributes),
+        "events": [
+            {
+                "name": event.name,
+                "timestamp": ns_to_iso_str(event.timestamp),
+                "attributes": _format_attributes(event.attributes),
+            }
+            for event in span.events
+        ],
+        "links": [
+            {
+                "context": _format_context(link.context),
+                "attributes": _format_attributes(link.attributes),
+            }
+            for link in span.links
+        ],
+        "resource": _format_resource(span.resource),
+    }
+
+
+class LargeAttributeOffloadMixin:
+    """
+    Span export logic shared by the span exporters: turning spans into log entries
+    and moving attribute values that would make an entry too large to a
+    ``PayloadStore``.
+
+    Uploads run on a bounded thread pool so export never waits on storage.
+    Subclasses set ``project_id``, ``_stats`` and ``_stats_lock`` and call
+    ``_init_offload`` from their constructor.
+    """
+
+    project_id: str | None
+    _stats: dict[str, float]
+    _stats_lock: threading.Lock
+
+    def _init_offload(
+        self,
+        payload_store: PayloadStore,
+        upload_workers: int,
+        max_pending_uploads: int,
+        compress_payloads: bool,
+    ) -> None:
+        self.payload_store = payload_store
+        self.compress_payloads = compress_payloads
+        self._upload_pool = ThreadPoolExecutor(
+            max_workers=upload_workers, thread_name_prefix="span-payload-upload"
+        )
+        self._upload_slots = threading.BoundedSemaphore(max_pending_uploads)
+        self._pending_uploads: set[Future] = set()
+        self._stats.update(
+            offloaded_attributes=0,
+            uploads=0,
+            upload_bytes=0,
+            failed_uploads=0,
+            dropped_uploads=0,
+        )
+
+    def _span_entry(self, span: ReadableSpan) -> dict[str, Any]:
+        """
+        Build the log entry of a span, with oversized attributes offloaded.
+
+        :param span: The finished span
+        :return: The log entry
+        """
+        span_context = span.get_span_context() or INVALID_SPAN_CONTEXT
+        trace_id = format(span_context.trace_id, "x")
+        span_id = format(span_context.span_id, "x")
+        span_dict = span_to_dict(span)
+
+        span_dict["trace"] = f"projects/{self.project_id}/traces/{trace_id}"
+        span_dict["span_id"] = span_id
+
+        return self._process_large_attributes(span_dict=span_dict, span_id=span_id)
+
+    def _wait_for_uploads(self, timeout_seconds: float) -> bool:
+        """Wait for pending uploads and return whether they all finished in time."""
+        _, pending = wait(list(self._pending_uploads), timeout=timeout_seconds)
+        return not pending
+
+    def _shutdown_uploads(self) -> None:
+        self._upload_pool.shutdown(wait=True)
+
+    def _offload(self, name: str, data: bytes) -> dict[str, Any]:
+        """
+        Schedule the upload of a payload and return the reference that replaces it.
+
+        When the payload store is unavailable or too many uploads are pending, the
+        payload is not uploaded and the reference says so instead of pointing at an
+        object that will never exist: it carries ``offload_failed`` and the start of
+        the payload inline.
+
+        :param name: Object name of the payload
+        :param data: JSON-encoded payload
+        :return: A reference to the payload for the log entry
+        """
+        if not self.payload_store.available():
+            with self._stats_lock:
+                self._stats["failed_uploads"] += 1
+            return self._failed_reference(data)
+        if not self._upload_slots.acquire(blocking=False):
+            with self._stats_lock:
+                self._stats["dropped_uploads"] += 1
+            logging.warning(f"Too many pending payload uploads, dropping {name}")
+            return self._failed_reference(data)
+
+        future = self._upload_pool.submit(self._upload, name, data)
+        self._pending_uploads.add(future)
+        future.add_done_callback(self._upload_done)
+        return {
+            "uri_payload": self.payload_store.uri(name),
+            "url_payload": self.payload_store.url(name),
+            "size_bytes": len(data),
+        }
+
+    @staticmethod
+    def _failed_reference(data: bytes) -> dict[str, Any]:
+        """The reference of a payload that was not offloaded, with its start inline."""
+        return {
+            "offload_failed": True,
+            "payload_truncated": data[:_INLINE_PREVIEW_BYTES].decode(
+                "ascii", errors="ignore"
+            ),
+            "size_bytes": len(data),
+        }
+
+    def _upload(self, name: str, data: bytes) -> None:
+        encoding = None
+        if self.compress_payloads:
+            data = gzip.compress(data, compresslevel=6)
+            encoding = "gzip"
+        self.payload_store.upload(
+            name, data, content_type="application/json", content_encoding=encoding
+        )
+        with self._stats_lock:
+            self._stats["uploads"] += 1
+            self._stats["upload_bytes"] += len(data)
+
+    def _upload_done(self, future: Future) -> None:
+        self._pending_uploads.discard(future)
+        self._upload_slots.release()
+        if future.exception() is not None:
+            with self._stats_lock:
+                self._stats["failed_uploads"] += 1
+            logging.warning(f"Failed to store span payload: {future.exception()}")
+
+    def _process_large_attributes(self, span_dict: dict, span_id: str) -> dict:
+        """
+        Process large attribute values by moving them to the payload store if they
+        exceed the size limit of Google Cloud Logging.
+
+        Each attribute value is serialized once. When the attributes together exceed
+        the limit, the largest values are moved to storage one by one, each replaced
+        by a reference, until the rest fits; small attributes stay in the log entry.
+
+        :param span_dict: The span data dictionary
+        :param span_id: The span ID
+        :return: The updated span dictionary
+        """
+        attributes = span_dict["attributes"]
+        encoded = {key: json.dumps(value) for key, value in attributes.items()}
+        # Encoded values are ASCII, so their length is their size in bytes.
+        total = 2 + sum(
+            len(key.encode()) + len(value) + 6 for key, value in encoded.items()
+        )
+        if total <= LARGE_ATTRIBUTES_BYTES:
+            return span_dict
+
+        for key in sorted(encoded, key=lambda k: len(encoded[k]), reverse=True):
+            if total <= LARGE_ATTRIBUTES_BYTES:
+                break
+            safe_key = re.sub(r"[^A-Za-z0-9._-]", "_", key)
+            name = f"spans/{span_id}/{safe_key}.json"
+            if self.compress_payloads:
+                name += ".gz"
+            reference = self._offload(name, encoded[key].encode())
+            attributes[key] = reference
+            total -= len(encoded[key]) - _REFERENCE_BYTES
+            with self._stats_lock:
+                self._stats["offloaded_attributes"] += 1
+
+        logging.info(
+            "Length of payload span above 250 KB, storing largest attributes in the "
+            "payload store to avoid large log entry errors"
+        )
+        return span_dict
@@ -14,17 +14,31 @@
 
 import json
 import logging
+import os
+import threading
+import time
+from collections import deque
 from collections.abc import Sequence
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import google.cloud.storage as storage
-from google.cloud import logging as google_cloud_logging
 from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
 from opentelemetry.sdk.trace import ReadableSpan
-from opentelemetry.sdk.trace.export import SpanExportResult
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
 
+from app.utils.gcs import GcsPayloadStore, PayloadStore
+from app.utils.span_offload import LargeAttributeOffloadMixin
 
-class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
+if TYPE_CHECKING:
+    import google.cloud.storage as storage
+    from google.cloud import logging as google_cloud_logging
+
+
+# Used to size log entries into write requests; large attributes are already
+# offloaded by the time entries are built, so this only encodes references.
+_ENTRY_ENCODER = json.JSONEncoder(default=str)
+
+
+class CloudTraceLoggingSpanExporter(LargeAttributeOffloadMixin, CloudTraceSpanExporter):
     """
     An extended version of CloudTraceSpanExporter that logs span data to Google Cloud Logging
     and handles large attribute values by storing them in Google Cloud Storage.
@@ -35,10 +49,18 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
 
     def __init__(
         self,
-        logging_client: google_cloud_logging.Client | None = None,
-        storage_client: storage.Client | None = None,
+        logging_client: "google_cloud_logging.Client | None" = None,
+        storage_client: "storage.Client | None" = None,
         bucket_name: str | None = None,
+        payload_store: PayloadStore | None = None,
+        upload_workers: int = 4,
+        max_pending_uploads: int = 64,
+        compress_payloads: bool = True,
         debug: bool = False,
+        background: bool = False,
+        max_queue_size: int = 2048,
+        max_batch_size: int = 500,
+        max_batch_bytes: int = 8 * 1024 * 1024,
         **kwargs: Any,
     ) -> None:
         """
@@ -47,105 +69,283 @@ class CloudTraceLoggingSpanExporter(CloudTraceSpanExporter):
         :param logging_client: Google Cloud Logging client
         :param storage_client: Google Cloud Storage client
         :param bucket_name: Name of the GCS bucket to store large payloads
+        :param payload_store: Where large attribute values are offloaded to; defaults to
+            the GCS bucket. Tests can pass a local fake.
+        :param upload_workers: Number of threads uploading offloaded payloads
+        :param max_pending_uploads: Maximum number of uploads queued or in progress;
+            payloads beyond that are dropped rather than slowing down export
+        :param compress_payloads: Gzip offloaded payloads
         :param debug: Enable debug mode for additional logging
+        :param background: Write log entries from a background thread instead of inside export
+        :param max_queue_size: Maximum number of log entries waiting in the background queue;
+            when full, the oldest entries are dropped
+        :param max_batch_size: Maximum number of log entries per write request
+        :param max_batch_bytes: Maximum serialized size of the entries of one write
+            request, below Cloud Logging's 10 MB request limit
         :param kwargs: Additional arguments to pass to the parent class
         """
         super().__init__(**kwargs)
         self.debug = debug
-        self.logging_client = logging_client or google_cloud_logging.Client(
-            project=self.project_id
-        )
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "exports": 0,
+            "exported_spans": 0,
+            "log_writes": 0,
+            "failed_log_writes": 0,
+            "dropped_spans": 0,
+            "export_seconds_total": 0.0,
+            "export_seconds_last": 0.0,
+            "export_seconds_max": 0.0,
+        }
+        self.max_queue_size = max_queue_size
+        self._queue: deque[dict] = deque(maxlen=max_queue_size)
+        self._queue_cond = threading.Condition()
+        self._in_flight = 0
+        self._closed = False
+        self._worker: threading.Thread | None = None
+        if background:
+            self._worker = threading.Thread(
+                target=self._drain_queue, name="span-log-writer", daemon=True
+            )
+            self._worker.start()
+        if logging_client is None:
+            from google.cloud import logging as google_cloud_logging
+
+            logging_client = google_cloud_logging.Client(project=self.project_id)
+        self.logging_client = logging_client
         self.logger = self.logging_client.logger(__name__)
-        self.storage_client = storage_client or storage.Client(project=self.project_id)
-        self.bucket_name = (
-            bucket_name or f"{self.project_id}-marketingflow-logs-data"
+        self.bucket_name = bucket_name or f"{self.project_id}-marketingflow-logs-data"
+        self._init_offload(
+            payload_store
+            or GcsPayloadStore(
+                self.bucket_name, storage_client=storage_client, project=self.project_id
+            ),
+            upload_workers=upload_workers,
+            max_pending_uploads=max_pending_uploads,
+            compress_payloads=compress_payloads,
         )
-        self.bucket = self.storage_client.bucket(self.bucket_name)
 
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
         """
         Export the spans to Google Cloud Logging and Cloud Trace.
 
+        The log entries of all spans are written in as few requests as the batch
+        limits allow, or handed to the background writer when it is enabled. A
+        failed log write does not keep the spans from Cloud Trace.
+
         :param spans: A sequence of spans to export
         :return: The result of the export operation
         """
+        start = time.perf_counter()
+        entries = []
         for span in spans:
-            span_context = span.get_span_context()
-            trace_id = format(span_context.trace_id, "x")
-            span_id = format(span_context.span_id, "x")
-            span_dict = json.loads(span.to_json())
+            span_dict = self._span_entry(span)
+
+            if self.debug:
+                print(span_dict)
 
-            span_dict["trace"] = f"projects/{self.project_id}/traces/{trace_id}"
-            span_dict["span_id"] = span_id
+            entries.append(span_dict)
 
-            span_dict = self._process_large_attributes(
-                span_dict=span_dict, span_id=span_id
+        if self._worker is not None:
+            self._enqueue(entries)
+        else:
+            self._write_entries(entries)
+
+        # Export spans to Google Cloud Trace using the parent class method
+        result = super().export(spans)
+
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._stats["exports"] += 1
+            self._stats["exported_spans"] += len(entries)
+            self._stats["export_seconds_total"] += elapsed
+            self._stats["export_seconds_last"] = elapsed
+            self._stats["export_seconds_max"] = max(
+                self._stats["export_seconds_max"], elapsed
             )
+        return result
 
-            if self.debug:
-                print(span_dict)
+    def stats(self) -> dict[str, float]:
+        """
+        Return export counters: number of exports, exported and dropped spans,
+        log write requests, export latency (total, last and max, in seconds) and
+        failed log write requests and offloaded attributes with their uploads
+        (done, failed, dropped, bytes).
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queued_spans"] = len(self._queue)
+        return stats
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """
+        Wait until every pending payload upload and queued log entry has been written.
+
+        :param timeout_millis: Maximum time to wait
+        :return: Whether everything was written in time
+        """
+        deadline = time.monotonic() + timeout_millis / 1000
+        if not self._wait_for_uploads(timeout_millis / 1000):
+            return False
+        if self._worker is None:
+            return True
+        with self._queue_cond:
+            self._queue_cond.notify_all()
+            while self._queue or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue_cond.wait(remaining)
+        return True
+
+    def shutdown(self) -> None:
+        """Flush queued log entries and uploads, and stop the background threads."""
+        self._shutdown_uploads()
+        if self._worker is not None:
+            self.force_flush()
+            with self._queue_cond:
+                self._closed = True
+                self._queue_cond.notify_all()
+            self._worker.join()
+            self._worker = None
+        super().shutdown()
+
+    def _write_entries(self, entries: list[dict]) -> None:
+        """
+        Write log entries to Google Cloud Logging, in requests of at most
+        ``max_batch_size`` entries and ``max_batch_bytes`` bytes. A request that
+        fails is logged and counted, and the remaining requests are still sent.
+        """
+        chunk: list[dict] = []
+        chunk_bytes = 0
+        for entry in entries:
+            size = len(_ENTRY_ENCODER.encode(entry))
+            if chunk and (
+                len(chunk) >= self.max_batch_size
+                or chunk_bytes + size > self.max_batch_bytes
+            ):
+                self._write_chunk(chunk)
+                chunk, chunk_bytes = [], 0
+            chunk.append(entry)
+            chunk_bytes += size
+        if chunk:
+            self._write_chunk(chunk)
 
-            # Log the span data to Google Cloud Logging
-            self.logger.log_struct(
-                span_dict,
+    def _write_chunk(self, entries: list[dict]) -> None:
+        """Write log entries to Google Cloud Logging in one request."""
+        batch = self.logger.batch()
+        for entry in entries:
+            batch.log_struct(
+                entry,
                 labels={
                     "type": "agent_telemetry",
                     "service_name": "marketingflow",
                 },
                 severity="INFO",
             )
-        # Export spans to Google Cloud Trace using the parent class method
-        return super().export(spans)
+        try:
+            batch.commit()
+        except Exception:
+            logging.exception(f"Failed to write {len(entries)} span log entries")
+            with self._stats_lock:
+                self._stats["failed_log_writes"] += 1
+            return
+        with self._stats_lock:
+            self._stats["log_writes"] += 1
 
-    def store_in_gcs(self, content: str, span_id: str) -> str:
+    def _enqueue(self, entries: list[dict]) -> None:
+        """Queue log entries for the background writer, dropping the oldest on overflow."""
+        with self._queue_cond:
+            overflow = max(0, len(self._queue) + len(entries) - self.max_queue_size)
+            self._queue.extend(entries)
+            self._queue_cond.notify_all()
+        if overflow:
+            with self._stats_lock:
+                self._stats["dropped_spans"] += overflow
+            logging.warning(f"Span log queue full, dropped {overflow} oldest entries")
+
+    def _drain_queue(self) -> None:
+        """Background writer loop."""
+        while True:
+            with self._queue_cond:
+                while not self._queue and not self._closed:
+                    self._queue_cond.wait()
+                if not self._queue and self._closed:
+                    return
+                batch = [
+                    self._queue.popleft()
+                    for _ in range(min(self.max_batch_size, len(self._queue)))
+                ]
+                self._in_flight = len(batch)
+            try:
+                self._write_entries(batch)
+            except Exception:
+                logging.exception("Failed to write span log entries")
+            finally:
+                with self._queue_cond:
+                    self._in_flight = 0
+                    self._queue_cond.notify_all()
+
+    def store_in_gcs(self, content: str | bytes, span_id: str) -> str:
         """
-        Initiate storing large content in Google Cloud Storage/
+        Initiate storing large content in Google Cloud Storage.
+
+        The upload runs on the upload thread pool; the URI is returned immediately.
 
         :param content: The content to store
         :param span_id: The ID of the span
         :return: The  GCS URI of the stored content
         """
-        if not self.storage_client.bucket(self.bucket_name).exists():
-            logging.warning(
-                f"Bucket {self.bucket_name} not found. "
-                "Unable to store span attributes in GCS."
-            )
-            return "GCS bucket not found"
+        data = content.encode() if isinstance(content, str) else content
+        reference = self._offload(f"spans/{span_id}.json", data)
+        return reference.get("uri_payload", "GCS upload failed")
 
-        blob_name = f"spans/{span_id}.json"
-        blob = self.bucket.blob(blob_name)
 
-        blob.upload_from_string(content, "application/json")
-        return f"gs://{self.bucket_name}/{blob_name}"
+SPAN_EXPORTERS = ("cloud", "jsonl", "memory", "none")
 
-    def _process_large_attributes(self, span_dict: dict, span_id: str) -> dict:
-        """
-        Process large attribute values by storing them in GCS if they exceed the size
-        limit of Google Cloud Logging.
 
-        :param span_dict: The span data dictionary
-        :param trace_id: The trace ID
-        :param span_id: The span ID
-        :return: The updated span dictionary
-        """
-        attributes = span_dict["attributes"]
-        if len(json.dumps(attributes).encode()) > 255 * 1024:  # 250 KB
-            # Separate large payload from other attributes
-            attributes_payload = dict(attributes.items())
-            attributes_retain = dict(attributes.items())
-
-            # Store large payload in GCS
-            gcs_uri = self.store_in_gcs(json.dumps(attributes_payload), span_id)
-            attributes_retain["uri_payload"] = gcs_uri
-            attributes_retain["url_payload"] = (
-                f"https://storage.mtls.cloud.google.com/"
-                f"{self.bucket_name}/spans/{span_id}.json"
-            )
+def create_span_exporter(project_id: str | None = None) -> SpanExporter | None:
+    """
+    Create the span exporter selected by the ``TRACE_EXPORTER`` environment variable.
 
-            span_dict["attributes"] = attributes_retain
-            logging.info(
-                "Length of payload span above 250 KB, storing attributes in GCS "
-                "to avoid large log entry errors"
-            )
+    - ``cloud`` (default): CloudTraceLoggingSpanExporter
+    - ``jsonl``: JsonlSpanExporter writing to ``TRACE_LOG_PATH``, rotated at
+      ``TRACE_LOG_MAX_BYTES`` with ``TRACE_LOG_BACKUPS`` compressed backups
+    - ``memory``: RingBufferSpanExporter keeping ``TRACE_RING_CAPACITY`` spans
+    - ``none``: no exporter
+
+    :param project_id: Google Cloud project ID used in the trace names
+    :return: The exporter, or None when tracing export is disabled
+    """
+    kind = os.environ.get("TRACE_EXPORTER", "cloud").lower()
+    if kind not in SPAN_EXPORTERS:
+        raise ValueError(
+            f"Unknown TRACE_EXPORTER {kind!r}, expected one of {SPAN_EXPORTERS}"
+        )
+    if kind == "none":
+        return None
+    if kind == "cloud":
+        return CloudTraceLoggingSpanExporter(
+            project_id=project_id,
+            background=os.environ.get("TRACE_LOG_BACKGROUND", "false").lower()
+            == "true",
+        )
 
-        return span_dict
+    from app.utils.local_tracing import JsonlSpanExporter, RingBufferSpanExporter
+
+    if kind == "jsonl":
+        return JsonlSpanExporter(
+            os.environ.get(
+                "TRACE_LOG_PATH", os.path.join(".cache", "traces", "spans.jsonl")
+            ),
+            max_bytes=int(os.environ.get("TRACE_LOG_MAX_BYTES", 64 * 1024 * 1024)),
+            backup_count=int(os.environ.get("TRACE_LOG_BACKUPS", "5")),
+            compress=os.environ.get("TRACE_LOG_COMPRESS", "true").lower() == "true",
+            project_id=project_id,
+        )
+    return RingBufferSpanExporter(
+        capacity=int(os.environ.get("TRACE_RING_CAPACITY", "10000")),
+        project_id=project_id,
+    )
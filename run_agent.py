@@ -1,37 +1,115 @@
+import argparse
 import asyncio
+import logging
 import os
 
 from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
-from app.agent import root_agent
 from google.genai import types as genai_types
 
+from app.agent import pipeline_metrics, root_agent
+from app.utils.batch import load_intents, run_batch
+from app.utils.metrics import serve_metrics
+from app.utils.sessions import create_session_service
 
-async def main():
+
+async def main() -> None:
     """Runs the agent with a sample query."""
-    session_service = InMemorySessionService()
-    await session_service.create_session(
+    session_service = create_session_service()
+    # With SESSION_DB_PATH set, the session may survive from an earlier run.
+    if not await session_service.get_session(
         app_name="app", user_id="test_user", session_id="test_session"
-    )
-    runner = Runner(
-        agent=root_agent, app_name="app", session_service=session_service
-    )
+    ):
+        await session_service.create_session(
+            app_name="app", user_id="test_user", session_id="test_session"
+        )
+    runner = Runner(agent=root_agent, app_name="app", session_service=session_service)
     query = "We are launching a new summer collection for our apparel shop which focuses on t-shirts with cat prints. We need marketing assets for a social media campaign on X/Twitter. The campaign should have a relaxed, holiday vibe, targeting young adults. Use our baseline cat images to generate realistic images of people wearing the t-shirts in outdoor settings like beaches, parks, or on vacation."
-    print(f"--- Running Visual Marketing Agent with query: \"{query}\" ---")
+    print(f'--- Running Visual Marketing Agent with query: "{query}" ---')
     async for event in runner.run_async(
         user_id="test_user",
         session_id="test_session",
         new_message=genai_types.Content(
-            role="user",
-            parts=[genai_types.Part.from_text(text=query)]
+            role="user", parts=[genai_types.Part.from_text(text=query)]
         ),
     ):
         # Print all non-user text events to see the flow
-        if event.author != "user" and event.content and event.content.parts and event.content.parts[0].text:
+        if (
+            event.author != "user"
+            and event.content
+            and event.content.parts
+            and event.content.parts[0].text
+        ):
             print(f"\n--- Output from {event.author} ---")
             print(event.content.parts[0].text)
+    print_stage_breakdown()
+
+
+async def batch_main(
+    input_path: str, output_path: str, concurrency: int, resume: bool
+) -> None:
+    """Runs every intent in a JSONL file through one shared runner."""
+    runner = Runner(
+        agent=root_agent, app_name="app", session_service=create_session_service()
+    )
+    intents = load_intents(input_path)
+    print(
+        f"--- Running {len(intents)} intents from {input_path} (concurrency={concurrency}) ---"
+    )
+    counts = await run_batch(
+        runner, intents, output_path, concurrency=concurrency, resume=resume
+    )
+    print(
+        f"--- Batch finished: {counts['ok']} ok, {counts['error']} failed, {counts['skipped']} skipped ---"
+    )
+    print(f"--- Results written to {output_path} ---")
+    print_stage_breakdown()
+
+
+def print_stage_breakdown() -> None:
+    """Prints where the run's time went, per agent."""
+    print("\n--- Per-stage breakdown ---")
+    print(pipeline_metrics.format_stage_breakdown())
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Run the Visual Marketing Agent")
+    parser.add_argument(
+        "--batch",
+        metavar="INTENTS_JSONL",
+        default=None,
+        help="Run every intent in a JSONL file instead of the sample query",
+    )
+    parser.add_argument(
+        "--output",
+        default="batch_results.jsonl",
+        help="JSONL file that batch results are appended to",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=int(os.environ.get("BATCH_CONCURRENCY", "8")),
+        help="Maximum number of campaigns in flight at once",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Re-run intents that already have results in the output file",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=int(os.environ.get("METRICS_PORT", "0")) or None,
+        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics during the run",
+    )
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        serve_metrics(pipeline_metrics, args.metrics_port)
 
+    if args.batch:
+        logging.basicConfig(level=logging.INFO)
+        asyncio.run(
+            batch_main(args.batch, args.output, args.concurrency, not args.no_resume)
+        )
+    else:
+        asyncio.run(main())
@@ -0,0 +1,614 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Offline benchmark suite for the marketing pipeline.
+
+Model calls are replayed from the shipped cassettes with a fixed synthetic
+latency, so results only move when our own code gets faster or slower.
+Results are written as JSON. Ratios between metrics measured in the same run
+(lazy versus eager import, current versus legacy span encoding, cache hit versus
+miss, shared versus deep-copied clones) do not depend on the machine and gate
+every run. Medians are also compared against a baseline recorded locally on the
+first run; any metric that regresses by more than the tolerance fails the run.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import copy
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections.abc import Callable, Iterator
+from unittest.mock import MagicMock
+
+# The suite must run offline and measure the model path, not the response cache.
+os.environ["MODEL_BACKEND"] = "replay"
+os.environ.setdefault("LLM_CACHE_AGENTS", "")
+
+from google.adk.agents import BaseAgent, LlmAgent, ParallelAgent
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.trace import SpanContext, TraceFlags
+
+from app.agent import (
+    generate_image_from_prompt_and_image,
+    generate_video_from_prompt_and_image,
+    image_store,
+    list_baseline_images,
+    pipeline_metrics,
+    root_agent,
+    video_store,
+)
+from app.utils.batch import CampaignIntent, run_campaign
+from app.utils.local_tracing import RingBufferSpanExporter
+from app.utils.models import use_model_backend
+from app.utils.pipeline import VisualMarketingPipeline, clone_root_agent
+from app.utils.span_offload import span_to_dict
+from app.utils.tracing import CloudTraceLoggingSpanExporter
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, ".results", "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, ".results", "benchmarks.json")
+SAMPLE_INTENT = (
+    "We are launching a new summer collection of cat print t-shirts. We need "
+    "assets for an X/Twitter campaign with a relaxed, holiday vibe."
+)
+
+# A benchmark returns named metrics, each as a unit and a list of samples.
+Metrics = dict[str, tuple[str, list[float]]]
+BENCHMARKS: dict[str, Callable[[argparse.Namespace], Metrics]] = {}
+
+
+def benchmark(name: str) -> Callable:
+    """Registers a benchmark group under ``name``."""
+
+    def register(func: Callable[[argparse.Namespace], Metrics]) -> Callable:
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+def timed(func: Callable[[], object], iterations: int) -> list[float]:
+    """Returns the wall-clock time of ``iterations`` calls, in milliseconds."""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+@contextlib.contextmanager
+def temporary_asset_stores() -> Iterator[None]:
+    """Points the generation tools at a scratch directory instead of the real one."""
+    stores = [image_store, video_store]
+    root_dirs = [store.root_dir for store in stores]
+    with tempfile.TemporaryDirectory(prefix="benchmark-assets-") as scratch:
+        for store, root_dir in zip(stores, root_dirs, strict=True):
+            store.root_dir = os.path.join(scratch, os.path.basename(root_dir))
+        try:
+            yield
+        finally:
+            for store, root_dir in zip(stores, root_dirs, strict=True):
+                store.root_dir = root_dir
+
+
+@benchmark("pipeline")
+def bench_pipeline(args: argparse.Namespace) -> Metrics:
+    """End-to-end and per-stage latency of root_agent against replayed models."""
+    with temporary_asset_stores():
+        return _bench_pipeline(args)
+
+
+def _bench_pipeline(args: argparse.Namespace) -> Metrics:
+    use_model_backend(root_agent, "replay", latency=args.model_latency)
+    runner = Runner(
+        agent=root_agent, app_name="benchmark", session_service=InMemorySessionService()
+    )
+    stages = [
+        "VisualIdeationAgent",
+        "ImageGenerationAgent",
+        "VideoGenerationAgent",
+        "TwitterPublisherAgent",
+    ]
+    metrics: Metrics = {"pipeline.end_to_end": ("ms", [])}
+    metrics.update({f"pipeline.{stage}": ("ms", []) for stage in stages})
+    metrics["pipeline.VisualGenerationLayer"] = ("ms", [])
+    metrics["pipeline.model_calls"] = ("calls", [])
+
+    for i in range(args.iterations):
+        pipeline_metrics.reset()
+        record = asyncio.run(
+            run_campaign(runner, CampaignIntent(id=str(i), intent=SAMPLE_INTENT))
+        )
+        model_calls = pipeline_metrics.snapshot()["counters"].get("model.calls", [])
+        metrics["pipeline.model_calls"][1].append(sum(c["value"] for c in model_calls))
+        if record["status"] != "ok":
+            raise RuntimeError(f"Pipeline benchmark run failed: {record}")
+        timings = record["timings"]
+        metrics["pipeline.end_to_end"][1].append(record["total_s"] * 1000)
+        for stage in stages:
+            metrics[f"pipeline.{stage}"][1].append(timings[stage]["duration_s"] * 1000)
+        branches = [timings["ImageGenerationAgent"], timings["VideoGenerationAgent"]]
+        layer_s = max(b["end_s"] for b in branches) - min(
+            b["start_s"] for b in branches
+        )
+        metrics["pipeline.VisualGenerationLayer"][1].append(layer_s * 1000)
+
+    # The same campaign with ideation streamed and generation started per concept.
+    metrics["pipeline.end_to_end.pipelined"] = ("ms", [])
+    root_agent.pipelined = True
+    try:
+        for i in range(args.iterations):
+            record = asyncio.run(
+                run_campaign(runner, CampaignIntent(id=f"p{i}", intent=SAMPLE_INTENT))
+            )
+            if record["status"] != "ok":
+                raise RuntimeError(f"Pipelined benchmark run failed: {record}")
+            metrics["pipeline.end_to_end.pipelined"][1].append(record["total_s"] * 1000)
+    finally:
+        root_agent.pipelined = False
+    return metrics
+
+
+@benchmark("tools")
+def bench_tools(args: argparse.Namespace) -> Metrics:
+    """Micro-benchmarks of the agent tools, writing assets to a scratch directory."""
+    with temporary_asset_stores():
+        return _bench_tools(args)
+
+
+def _bench_tools(args: argparse.Namespace) -> Metrics:
+    tool_context = MagicMock()
+    baseline = list_baseline_images(tool_context)[0]
+    iterations = args.iterations * 20
+
+    def generate(tool: Callable, prompt: str) -> None:
+        asyncio.run(tool(prompt, baseline, tool_context))
+
+    cached_prompt = f"benchmark {uuid.uuid4().hex}"
+    generate(generate_image_from_prompt_and_image, cached_prompt)
+    generate(generate_video_from_prompt_and_image, cached_prompt)
+    return {
+        "tools.list_baseline_images": (
+            "ms",
+            timed(lambda: list_baseline_images(tool_context), iterations * 10),
+        ),
+        "tools.generate_image.miss": (
+            "ms",
+            timed(
+                lambda: generate(
+                    generate_image_from_prompt_and_image, uuid.uuid4().hex
+                ),
+                iterations,
+            ),
+        ),
+        "tools.generate_image.hit": (
+            "ms",
+            timed(
+                lambda: generate(generate_image_from_prompt_and_image, cached_prompt),
+                iterations,
+            ),
+        ),
+        "tools.generate_video.miss": (
+            "ms",
+            timed(
+                lambda: generate(
+                    generate_video_from_prompt_and_image, uuid.uuid4().hex
+                ),
+                iterations,
+            ),
+        ),
+        "tools.generate_video.hit": (
+            "ms",
+            timed(
+                lambda: generate(generate_video_from_prompt_and_image, cached_prompt),
+                iterations,
+            ),
+        ),
+    }
+
+
+def synthetic_spans(count: int, attribute_bytes: int) -> list[ReadableSpan]:
+    """Builds finished spans shaped like the ADK's LLM call spans."""
+    resource = Resource.create({"service.name": "marketingflow"})
+    spans = []
+    for i in range(count):
+        context = SpanContext(
+            trace_id=0x5B8AA5A2D2C872E8321CF37308D69DF2,
+            span_id=0x051581BF3CB55C13 + i,
+            is_remote=False,
+            trace_flags=TraceFlags(TraceFlags.SAMPLED),
+        )
+        spans.append(
+            ReadableSpan(
+                name=f"call_llm {i}",
+                context=context,
+                attributes={
+                    "gen_ai.system": "gcp.vertex.agent",
+                    "gen_ai.request.model": "gemini-2.5-flash",
+                    "gcp.vertex.agent.invocation_id": f"e-{i}",
+                    "gcp.vertex.agent.llm_request": "x" * attribute_bytes,
+                    "gcp.vertex.agent.llm_response": "y" * (attribute_bytes // 4),
+                },
+                resource=resource,
+                start_time=1_700_000_000_000_000_000 + i * 1_000_000,
+                end_time=1_700_000_000_000_000_000 + i * 1_000_000 + 500_000,
+            )
+        )
+    return spans
+
+
+def offline_exporter() -> CloudTraceLoggingSpanExporter:
+    """Returns an exporter whose Cloud Trace, Logging and Storage clients are fakes."""
+    return CloudTraceLoggingSpanExporter(
+        project_id="benchmark",
+        client=MagicMock(),
+        logging_client=MagicMock(),
+        storage_client=MagicMock(),
+    )
+
+
+@benchmark("tracing")
+def bench_tracing(args: argparse.Namespace) -> Metrics:
+    """Cost of exporting synthetic spans with the cloud and ring-buffer exporters."""
+    exporter = offline_exporter()
+    iterations = args.iterations * 10
+    small = synthetic_spans(50, attribute_bytes=2 * 1024)
+    large = synthetic_spans(5, attribute_bytes=300 * 1024)
+    ring_buffer = RingBufferSpanExporter(capacity=1000)
+    return {
+        "tracing.export.50_small_spans": (
+            "ms",
+            timed(lambda: exporter.export(small), iterations),
+        ),
+        "tracing.export.5_large_spans": (
+            "ms",
+            timed(lambda: exporter.export(large), iterations),
+        ),
+        "tracing.ring_buffer.50_small_spans": (
+            "ms",
+            timed(lambda: ring_buffer.export(small), iterations),
+        ),
+        "tracing.ring_buffer.5_large_spans": (
+            "ms",
+            timed(lambda: ring_buffer.export(large), iterations),
+        ),
+    }
+
+
+def legacy_encode(exporter: CloudTraceLoggingSpanExporter, span: ReadableSpan) -> dict:
+    """The span encoding path used before spans were encoded directly, for comparison."""
+    span_dict = json.loads(span.to_json())
+    attributes = span_dict["attributes"]
+    if len(json.dumps(attributes).encode()) > 255 * 1024:
+        attributes_payload = dict(attributes.items())
+        attributes_retain = dict(attributes.items())
+        exporter.store_in_gcs(json.dumps(attributes_payload), "legacy")
+        span_dict["attributes"] = attributes_retain
+    return span_dict
+
+
+def current_encode(exporter: CloudTraceLoggingSpanExporter, span: ReadableSpan) -> dict:
+    """The span encoding path used by CloudTraceLoggingSpanExporter.export."""
+    return exporter._process_large_attributes(span_to_dict(span), "current")
+
+
+@benchmark("tracing_encoding")
+def bench_tracing_encoding(args: argparse.Namespace) -> Metrics:
+    """CPU time and peak memory of encoding 250 KB+ spans, legacy versus current."""
+    exporter = offline_exporter()
+    spans = synthetic_spans(1, attribute_bytes=400 * 1024)
+    metrics: Metrics = {}
+    for label, encode in [("legacy", legacy_encode), ("current", current_encode)]:
+        cpu_ms, peak_kb = [], []
+        for _ in range(args.iterations * 4):
+            tracemalloc.start()
+            start = time.process_time()
+            encode(exporter, spans[0])
+            cpu_ms.append((time.process_time() - start) * 1000)
+            peak_kb.append(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+        metrics[f"tracing.encode_large_span.{label}.cpu"] = ("ms", cpu_ms)
+        metrics[f"tracing.encode_large_span.{label}.peak_memory"] = ("KiB", peak_kb)
+    return metrics
+
+
+def synthetic_agent_graph(size: int) -> VisualMarketingPipeline:
+    """A pipeline whose generation layer has ``size`` tool-using LlmAgents."""
+    branches: list[BaseAgent] = [
+        LlmAgent(
+            name=f"GenerationAgent{i}",
+            model="gemini-2.5-flash",
+            instruction=f"Generate asset {i} for {{visual_concepts}}. " * 20,
+            tools=[generate_image_from_prompt_and_image],
+            output_key=f"generated_path_{i}",
+        )
+        for i in range(size)
+    ]
+    return VisualMarketingPipeline(
+        name="VisualMarketingAgent",
+        sub_agents=[
+            LlmAgent(
+                name="VisualIdeationAgent",
+                model="gemini-2.5-flash",
+                output_key="visual_concepts",
+            ),
+            ParallelAgent(name="VisualGenerationLayer", sub_agents=branches),
+        ],
+    )
+
+
+@benchmark("clone")
+def bench_clone(args: argparse.Namespace) -> Metrics:
+    """Time and peak memory of cloning the agent graph, deep copy versus shared definition."""
+    metrics: Metrics = {}
+    for size in (4, 16, 64):
+        root = synthetic_agent_graph(size)
+        clones: list[tuple[str, Callable[[VisualMarketingPipeline], object]]] = [
+            ("deepcopy", copy.deepcopy),
+            ("shared", clone_root_agent),
+        ]
+        for label, clone in clones:
+            wall_ms, peak_kb = [], []
+            for _ in range(args.iterations * 4):
+                tracemalloc.start()
+                start = time.perf_counter()
+                clone(root)
+                wall_ms.append((time.perf_counter() - start) * 1000)
+                peak_kb.append(tracemalloc.get_traced_memory()[1] / 1024)
+                tracemalloc.stop()
+            metrics[f"clone.{label}.{size}_agents"] = ("ms", wall_ms)
+            metrics[f"clone.{label}.{size}_agents.peak_memory"] = ("KiB", peak_kb)
+    return metrics
+
+
+# Each snippet runs in a fresh interpreter. The "eager" ones do what importing the
+# package used to do: resolve the default credentials, build root_agent and load
+# every Cloud client up front. The subprocess inherits MODEL_BACKEND=replay, which
+# skips credential resolution in get_root_agent(), so the eager snippets resolve
+# them explicitly; without credentials the lookup still pays its full probing cost.
+_RESOLVE_CREDENTIALS = """
+import google.auth
+import google.auth.exceptions
+try:
+    google.auth.default()
+except google.auth.exceptions.DefaultCredentialsError:
+    pass
+"""
+IMPORT_SNIPPETS = {
+    "import.app": "import app",
+    "import.agent_engine_app": "import app.agent_engine_app",
+    "import.app.eager": _RESOLVE_CREDENTIALS
+    + "import app.agent\napp.agent.get_root_agent()",
+    "import.agent_engine_app.eager": _RESOLVE_CREDENTIALS
+    + "import app.agent_engine_app, app.agent, app.utils.gcs, app.utils.tracing\n"
+    "import google.cloud.logging, google.cloud.storage, vertexai.agent_engines\n"
+    "app.agent.get_root_agent()",
+}
+
+
+def cold_import_ms(snippet: str) -> float:
+    """Returns the time a fresh interpreter takes to run ``snippet``, in milliseconds."""
+    code = "\n".join(
+        [
+            "import time",
+            "start = time.perf_counter()",
+            snippet.strip(),
+            "print((time.perf_counter() - start) * 1000)",
+        ]
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(BENCHMARK_DIR)),
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+@benchmark("import")
+def bench_import(args: argparse.Namespace) -> Metrics:
+    """Cold-start import time of the package, lazy versus eager agent construction."""
+    metrics: Metrics = {
+        name: ("ms", [cold_import_ms(snippet) for _ in range(args.iterations)])
+        for name, snippet in IMPORT_SNIPPETS.items()
+    }
+    for lazy in ("import.app", "import.agent_engine_app"):
+        lazy_ms = statistics.median(metrics[lazy][1])
+        eager_ms = statistics.median(metrics[f"{lazy}.eager"][1])
+        print(
+            f"{lazy}: {eager_ms:.0f} ms eager, {lazy_ms:.0f} ms lazy "
+            f"({1 - lazy_ms / eager_ms:.0%} less cold-start time)"
+        )
+    return metrics
+
+
+def summarize(metrics: Metrics) -> dict[str, dict[str, float | str | int]]:
+    """Reduces raw samples to summary statistics."""
+    summary: dict[str, dict[str, float | str | int]] = {}
+    for name, (unit, samples) in metrics.items():
+        ordered = sorted(samples)
+        summary[name] = {
+            "unit": unit,
+            "n": len(ordered),
+            "mean": round(statistics.fmean(ordered), 4),
+            "p50": round(statistics.median(ordered), 4),
+            "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+            "min": round(ordered[0], 4),
+        }
+    return summary
+
+
+# (name, numerator, denominator, maximum) ratios of medians from the same run.
+RATIO_GATES = [
+    ("import.app.lazy_vs_eager", "import.app", "import.app.eager", 0.5),
+    (
+        "import.agent_engine_app.lazy_vs_eager",
+        "import.agent_engine_app",
+        "import.agent_engine_app.eager",
+        0.9,
+    ),
+    (
+        "tracing.encode_large_span.cpu.current_vs_legacy",
+        "tracing.encode_large_span.current.cpu",
+        "tracing.encode_large_span.legacy.cpu",
+        0.75,
+    ),
+    (
+        "tracing.encode_large_span.peak_memory.current_vs_legacy",
+        "tracing.encode_large_span.current.peak_memory",
+        "tracing.encode_large_span.legacy.peak_memory",
+        0.75,
+    ),
+    (
+        "tools.generate_image.hit_vs_miss",
+        "tools.generate_image.hit",
+        "tools.generate_image.miss",
+        1.0,
+    ),
+    (
+        "tools.generate_video.hit_vs_miss",
+        "tools.generate_video.hit",
+        "tools.generate_video.miss",
+        1.0,
+    ),
+    (
+        "clone.64_agents.peak_memory.shared_vs_deepcopy",
+        "clone.shared.64_agents.peak_memory",
+        "clone.deepcopy.64_agents.peak_memory",
+        0.9,
+    ),
+]
+
+
+def compare_ratios(summary: dict[str, dict]) -> list[str]:
+    """Returns a message for every ratio gate of ``RATIO_GATES`` that is exceeded."""
+    failures = []
+    for name, numerator, denominator, maximum in RATIO_GATES:
+        if numerator not in summary or denominator not in summary:
+            continue
+        ratio = summary[numerator]["p50"] / summary[denominator]["p50"]
+        print(f"{name:<45} ratio {ratio:>8.3f} (max {maximum})")
+        if ratio > maximum:
+            failures.append(
+                f"{name}: {numerator} / {denominator} is {ratio:.3f}, "
+                f"above the maximum of {maximum}"
+            )
+    return failures
+
+
+def compare(
+    summary: dict[str, dict], baseline: dict[str, dict], tolerance: float
+) -> list[str]:
+    """Returns a message for every metric whose median regressed past ``tolerance``."""
+    regressions = []
+    for name, result in summary.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        limit = reference["p50"] * (1 + tolerance)
+        if result["p50"] > limit:
+            regressions.append(
+                f"{name}: p50 {result['p50']}{result['unit']} exceeds baseline "
+                f"{reference['p50']}{result['unit']} by more than {tolerance:.0%}"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=sorted(BENCHMARKS),
+        help="Benchmark groups to run (default: all)",
+    )
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument(
+        "--model-latency",
+        type=float,
+        default=0.05,
+        help="Synthetic latency of each replayed model call, in seconds",
+    )
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Allowed relative regression of a metric's median",
+    )
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store these results as the new baseline instead of comparing them",
+    )
+    args = parser.parse_args(argv)
+
+    metrics: Metrics = {}
+    for name in args.only or sorted(BENCHMARKS):
+        print(f"--- Running {name} benchmarks ---")
+        metrics.update(BENCHMARKS[name](args))
+    summary = summarize(metrics)
+
+    for name, result in summary.items():
+        print(
+            f"{name:<45} p50 {result['p50']:>10.3f} {result['unit']:<5} p95 {result['p95']:>10.3f}"
+        )
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"--- Results written to {args.output} ---")
+
+    regressions = compare_ratios(summary)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if not args.save_baseline:
+        regressions += compare(summary, baseline, args.tolerance)
+    # Metrics without a baseline on this machine become the baseline.
+    recorded = {
+        name: result
+        for name, result in summary.items()
+        if args.save_baseline or name not in baseline
+    }
+    if recorded:
+        baseline.update(recorded)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(
+            f"--- Baseline for {len(recorded)} metrics written to {args.baseline} ---"
+        )
+    for message in regressions:
+        print(f"REGRESSION {message}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import os
+from collections.abc import Iterator
+from typing import Any
+
+import pytest
+from google.adk.events import Event
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from app.utils.fanout import VariantFanOutAgent
+from app.utils.models import iter_llm_agents, use_model_backend
+from app.utils.pipeline import VisualMarketingPipeline
+from app.utils.replay import CassetteLlm
+from app.utils.routing import RouterLlm
+
+
+@pytest.fixture
+def replayed_root_agent(
+    monkeypatch: pytest.MonkeyPatch,
+) -> Iterator[VisualMarketingPipeline]:
+    """Returns root_agent with every model call served from the shipped cassettes."""
+    monkeypatch.setenv("MODEL_BACKEND", "replay")
+    from app.agent import root_agent
+
+    previous = use_model_backend(root_agent, "replay", latency=0)
+    yield root_agent
+    for llm_agent in iter_llm_agents(root_agent):
+        llm_agent.model = previous[llm_agent.name]
+
+
+def test_pipeline_runs_offline_from_cassettes(
+    replayed_root_agent: VisualMarketingPipeline,
+) -> None:
+    """
+    Runs the full SequentialAgent/ParallelAgent pipeline, including its tools,
+    without network access and checks that every stage wrote its output.
+
+    Replay is strict, so every request must match a recorded fingerprint: a
+    change to an instruction or to the requests an agent sends fails here until
+    the cassettes are recorded again.
+    """
+    for llm_agent in iter_llm_agents(replayed_root_agent):
+        assert isinstance(llm_agent.model, RouterLlm)
+        for llm in llm_agent.model.candidates:
+            assert isinstance(llm, CassetteLlm)
+            llm.strict = True
+    session_service = InMemorySessionService()
+    runner = Runner(
+        agent=replayed_root_agent, session_service=session_service, app_name="test"
+    )
+
+    async def run() -> tuple[list[Event], dict[str, Any]]:
+        session = await session_service.create_session(
+            app_name="test", user_id="test_user"
+        )
+        message = types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text="Summer campaign for our cat print t-shirts")
+            ],
+        )
+        events = [
+            event
+            async for event in runner.run_async(
+                user_id="test_user", session_id=session.id, new_message=message
+            )
+        ]
+        updated = await session_service.get_session(
+            app_name="test", user_id="test_user", session_id=session.id
+        )
+        assert updated is not None
+        return events, updated.state
+
+    events, state = asyncio.run(run())
+
+    authors = {event.author for event in events}
+    assert {
+        "VisualIdeationAgent",
+        "ImageGenerationAgent",
+        "VideoGenerationAgent",
+        "TwitterPublisherAgent",
+    } <= authors
+    assert "#catmerch" in state["twitter_post"]
+    assert os.path.exists(state["generated_image_path"].strip())
+    assert os.path.exists(state["generated_video_path"].strip())
+
+
+def test_baseline_selection_saves_the_listing_turns(
+    replayed_root_agent: VisualMarketingPipeline,
+) -> None:
+    """
+    Counts the model calls of one campaign. With the baseline selected in code,
+    the image and video agents each make two calls (the generation tool call
+    and the answer) instead of three, for 6 calls in total instead of 8.
+    """
+    from app.agent import pipeline_metrics
+
+    runner = Runner(
+        agent=replayed_root_agent,
+        session_service=InMemorySessionService(),
+        app_name="test",
+    )
+
+    async def run() -> None:
+        session = await runner.session_service.create_session(
+            app_name="test", user_id="test_user"
+        )
+        message = types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text="Summer campaign for our cat print t-shirts")
+            ],
+        )
+        async for _ in runner.run_async(
+            user_id="test_user", session_id=session.id, new_message=message
+        ):
+            pass
+
+    pipeline_metrics.reset()
+    asyncio.run(run())
+
+    counters = pipeline_metrics.snapshot()["counters"]
+    calls: dict[str, float] = {}
+    for sample in counters["model.calls"]:
+        agent = sample["labels"]["agent"]
+        calls[agent] = calls.get(agent, 0) + sample["value"]
+    assert calls == {
+        "VisualIdeationAgent": 1,
+        "ImageGenerationAgent": 2,
+        "VideoGenerationAgent": 2,
+        "TwitterPublisherAgent": 1,
+    }
+    tools = {sample["labels"]["tool"] for sample in counters["tool.calls"]}
+    assert "list_baseline_images" not in tools
+
+
+def test_pipelined_mode_overlaps_ideation_and_generation(
+    replayed_root_agent: VisualMarketingPipeline, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """
+    Checks that in pipelined mode the generation branches start before ideation
+    has finished streaming, and that the pipeline still completes.
+    """
+    ideation = next(
+        a
+        for a in iter_llm_agents(replayed_root_agent)
+        if a.name == "VisualIdeationAgent"
+    )
+    for llm in getattr(ideation.model, "candidates", [ideation.model]):
+        llm.latency = 0.5
+    # A response cache hit would skip streaming altogether.
+    monkeypatch.setattr(ideation, "before_model_callback", None)
+    monkeypatch.setattr(ideation, "after_model_callback", None)
+    replayed_root_agent.pipelined = True
+    session_service = InMemorySessionService()
+    runner = Runner(
+        agent=replayed_root_agent, session_service=session_service, app_name="test"
+    )
+
+    async def run() -> tuple[list[str], dict[str, Any]]:
+        session = await session_service.create_session(
+            app_name="test", user_id="test_user"
+        )
+        message = types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text="Summer campaign for our cat print t-shirts")
+            ],
+        )
+        authors = [
+            event.author
+            async for event in runner.run_async(
+                user_id="test_user", session_id=session.id, new_message=message
+            )
+        ]
+        updated = await session_service.get_session(
+            app_name="test", user_id="test_user", session_id=session.id
+        )
+        assert updated is not None
+        return authors, updated.state
+
+    try:
+        authors, state = asyncio.run(run())
+    finally:
+        replayed_root_agent.pipelined = False
+
+    assert authors.index("ImageGenerationAgent") < authors.index("VisualIdeationAgent")
+    assert "Beach Day Getaway" in state["visual_concepts"]
+    assert "#catmerch" in state["twitter_post"]
+    assert os.path.exists(state["generated_image_path"].strip())
+
+
+def test_fanout_mode_collects_variants(
+    replayed_root_agent: VisualMarketingPipeline,
+) -> None:
+    """
+    Checks that in fan-out mode the variant matrix replaces the generation agents
+    and is handed to the publisher as a list.
+    """
+    fanout = next(
+        a for a in replayed_root_agent.sub_agents if isinstance(a, VariantFanOutAgent)
+    )
+    replayed_root_agent.fanout = True
+    fanout.variants = 2
+    session_service = InMemorySessionService()
+    runner = Runner(
+        agent=replayed_root_agent, session_service=session_service, app_name="test"
+    )
+
+    async def run() -> tuple[set[str], dict[str, Any]]:
+        session = await session_service.create_session(
+            app_name="test", user_id="test_user"
+        )
+        message = types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text="Summer campaign for our cat print t-shirts")
+            ],
+        )
+        authors = {
+            event.author
+            async for event in runner.run_async(
+                user_id="test_user", session_id=session.id, new_message=message
+            )
+        }
+        updated = await session_service.get_session(
+            app_name="test", user_id="test_user", session_id=session.id
+        )
+        assert updated is not None
+        return authors, updated.state
+
+    try:
+        authors, state = asyncio.run(run())
+    finally:
+        replayed_root_agent.fanout = False
+        fanout.variants = 1
+
+    assert "ImageGenerationAgent" not in authors
+    assert "VariantFanOutAgent" in authors
+    assert {v["kind"] for v in state["variants"]} == {"image", "video"}
+    assert all(os.path.exists(v["path"]) for v in state["variants"])
+    assert "#catmerch" in state["twitter_post"]
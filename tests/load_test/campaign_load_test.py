@@ -0,0 +1,433 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Load test of the campaign pipeline with latency percentiles and SLO gates.
+
+Runs a weighted mix of business intents at each concurrency level against an
+in-process runner or a streamQuery HTTP endpoint, and fails if an SLO is missed.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from typing import Any
+
+LOAD_TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INTENTS = os.path.join(LOAD_TEST_DIR, "intents.jsonl")
+DEFAULT_SLO = os.path.join(LOAD_TEST_DIR, "slo.json")
+DEFAULT_OUTPUT = os.path.join(LOAD_TEST_DIR, ".results", "campaign_load_test.json")
+LOCAL_PATH = (
+    "/v1beta1/projects/local/locations/local/reasoningEngines/marketingflow:streamQuery"
+)
+
+
+@dataclass(frozen=True)
+class WeightedIntent:
+    """A business intent and its share of the traffic."""
+
+    name: str
+    intent: str
+    weight: float = 1.0
+
+
+@dataclass
+class Sample:
+    """The timings of one campaign, in seconds from the request."""
+
+    intent: str
+    ok: bool = True
+    error: str | None = None
+    ttfe_s: float | None = None
+    total_s: float | None = None
+    stages: dict[str, float] = field(default_factory=dict)
+
+
+class LoadTestError(Exception):
+    """A campaign that failed, with a short reason used to group failures."""
+
+    def __init__(self, reason: str, detail: str = "") -> None:
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+
+
+def load_intent_mix(path: str) -> list[WeightedIntent]:
+    """Loads a JSONL file of ``{"name", "intent", "weight"}`` objects."""
+    mix: list[WeightedIntent] = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                mix.append(
+                    WeightedIntent(
+                        name=record.get("name", f"intent_{len(mix)}"),
+                        intent=record["intent"],
+                        weight=float(record.get("weight", 1)),
+                    )
+                )
+    if not mix:
+        raise ValueError(f"{path} has no intents")
+    return mix
+
+
+class InProcessTarget:
+    """Runs campaigns on a runner in this process, through a CampaignWorker."""
+
+    def __init__(self, runner: Any, max_sessions: int) -> None:
+        from app.utils.serving import CampaignWorker
+
+        self.runner = runner
+        self.worker = CampaignWorker(runner, max_sessions=max_sessions)
+
+    async def query(self, message: str, user_id: str) -> AsyncIterator[dict[str, Any]]:
+        from google.genai import types as genai_types
+
+        session = await self.runner.session_service.create_session(
+            app_name=self.runner.app_name, user_id=user_id
+        )
+        content = genai_types.Content(
+            role="user", parts=[genai_types.Part.from_text(text=message)]
+        )
+        async for event in self.worker.stream(user_id, session.id, content):
+            yield {"author": event.author}
+
+    async def close(self) -> None:
+        await self.worker.drain()
+
+
+class HttpTarget:
+    """Streams campaigns from a ``:streamQuery?alt=sse`` endpoint over kept-alive connections."""
+
+    def __init__(
+        self, url: str, max_connections: int, token: str | None = None
+    ) -> None:
+        import httpx
+
+        self.url = url
+        self.headers = {"Content-Type": "application/json"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    async def query(self, message: str, user_id: str) -> AsyncIterator[dict[str, Any]]:
+        body = {"input": {"message": message, "user_id": user_id}}
+        async with self.client.stream(
+            "POST", self.url, json=body, params={"alt": "sse"}, headers=self.headers
+        ) as response:
+            if response.status_code != 200:
+                detail = (await response.aread()).decode(errors="replace")[:200]
+                raise LoadTestError(f"http_{response.status_code}", detail)
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    yield json.loads(line[len("data: ") :])
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+async def measure(target: Any, intent: WeightedIntent, user_id: str) -> Sample:
+    """Runs one campaign and records time to first event, to each sub-agent's
+    last event (its output) and to the end of the stream."""
+    sample = Sample(intent=intent.name)
+    start = time.perf_counter()
+    try:
+        async for event in target.query(intent.intent, user_id):
+            now = time.perf_counter() - start
+            if sample.ttfe_s is None:
+                sample.ttfe_s = now
+            if "error" in event:
+                error = event["error"]
+                raise LoadTestError(
+                    f"error_{error.get('code', 'stream')}", error.get("message", "")
+                )
+            author = event.get("author")
+            if author and author != "user":
+                sample.stages[author] = now
+        sample.total_s = time.perf_counter() - start
+        if not sample.stages:
+            raise LoadTestError("empty_stream")
+    except LoadTestError as e:
+        sample.ok, sample.error = False, e.reason
+    except Exception as e:
+        sample.ok, sample.error = False, type(e).__name__
+    return sample
+
+
+async def run_level(
+    target: Any,
+    mix: list[WeightedIntent],
+    concurrency: int,
+    requests: int,
+    rng: random.Random,
+) -> tuple[list[Sample], float]:
+    """Runs ``requests`` campaigns from ``concurrency`` closed-loop virtual users.
+
+    Returns:
+        The samples and the wall time of the level.
+    """
+    intents = rng.choices(mix, weights=[i.weight for i in mix], k=requests)
+    samples: list[Sample] = []
+
+    async def user(index: int) -> None:
+        while intents:
+            samples.append(await measure(target, intents.pop(), f"load-user-{index}"))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(i) for i in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+def percentiles(values: list[float]) -> dict[str, float | None]:
+    """Returns the nearest-rank p50, p95 and p99 of ``values``."""
+    ordered = sorted(values)
+    if not ordered:
+        return {"p50": None, "p95": None, "p99": None}
+
+    def rank(p: float) -> float:
+        return round(ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)], 4)
+
+    return {"p50": rank(50), "p95": rank(95), "p99": rank(99)}
+
+
+def summarize(samples: list[Sample], wall_s: float, concurrency: int) -> dict[str, Any]:
+    """Reduces the samples of one concurrency level to percentiles and throughput."""
+    ok = [s for s in samples if s.ok]
+    errors: dict[str, int] = {}
+    for s in samples:
+        if not s.ok:
+            reason = s.error or "unknown"
+            errors[reason] = errors.get(reason, 0) + 1
+    # Stages in the order they finish, on average.
+    authors = sorted(
+        {a for s in ok for a in s.stages},
+        key=lambda a: statistics.mean(s.stages[a] for s in ok if a in s.stages),
+    )
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": errors,
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(ok) / wall_s, 3) if wall_s else 0.0,
+        "ttfe_s": percentiles([s.ttfe_s for s in ok if s.ttfe_s is not None]),
+        "total_s": percentiles([s.total_s for s in ok if s.total_s is not None]),
+        "stages": {
+            a: percentiles([s.stages[a] for s in ok if a in s.stages]) for a in authors
+        },
+        "mix": {
+            name: sum(1 for s in samples if s.intent == name)
+            for name in sorted({s.intent for s in samples})
+        },
+    }
+
+
+def _lookup(summary: dict[str, Any], key: str) -> Any:
+    value: Any = summary
+    for part in key.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def check_slos(
+    levels: list[dict[str, Any]], slos: dict[str, dict[str, float]]
+) -> list[str]:
+    """Returns a message for every SLO missed at any concurrency level.
+
+    ``slos`` has a ``max`` and a ``min`` section mapping dotted keys of a level
+    summary (such as ``total_s.p95`` or ``stages.TwitterPublisherAgent.p99``) to
+    their limits. A key missing from a summary is a violation, so an SLO on a
+    stage that never produced output fails.
+    """
+    violations = []
+    for level in levels:
+        for bound, limits in (
+            ("max", slos.get("max", {})),
+            ("min", slos.get("min", {})),
+        ):
+            for key, limit in limits.items():
+                value = _lookup(level, key)
+                missed = value is None or (
+                    value > limit if bound == "max" else value < limit
+                )
+                if missed:
+                    relation = ">" if bound == "max" else "<"
+                    violations.append(
+                        f"concurrency {level['concurrency']}: {key} = {value} {relation} {limit}"
+                    )
+    return violations
+
+
+def format_report(levels: list[dict[str, Any]]) -> str:
+    """Renders the summaries as a text table, one row per concurrency level and stage."""
+    header = (
+        f"{'conc':>4} {'reqs':>5} {'errors':>6} {'req/s':>7} "
+        f"{'metric':<30} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8}"
+    )
+    rows = [header, "-" * len(header)]
+    for level in levels:
+        metrics = [("time to first event", level["ttfe_s"])]
+        metrics += [(f"  {author}", p) for author, p in level["stages"].items()]
+        metrics.append(("total", level["total_s"]))
+        for i, (name, p) in enumerate(metrics):
+            prefix = (
+                f"{level['concurrency']:>4} {level['requests']:>5} "
+                f"{level['requests'] - level['ok']:>6} {level['throughput_rps']:>7.2f} "
+                if i == 0
+                else " " * 26
+            )
+            cells = " ".join(
+                f"{v:>8.3f}" if v is not None else f"{'-':>8}" for v in p.values()
+            )
+            rows.append(f"{prefix}{name:<30} {cells}")
+    return "\n".join(rows)
+
+
+def parse_slo_overrides(overrides: list[str]) -> dict[str, dict[str, float]]:
+    """Parses ``key<=value`` and ``key>=value`` overrides into SLO sections."""
+    slos: dict[str, dict[str, float]] = {"max": {}, "min": {}}
+    for override in overrides:
+        for operator, bound in (("<=", "max"), (">=", "min")):
+            if operator in override:
+                key, value = override.split(operator, 1)
+                slos[bound][key.strip()] = float(value)
+                break
+        else:
+            raise ValueError(f"SLO override {override!r} needs <= or >=")
+    return slos
+
+
+async def run_load_test(args: argparse.Namespace) -> list[dict[str, Any]]:
+    mix = load_intent_mix(args.intents)
+    rng = random.Random(args.seed)
+    if args.url:
+        target: Any = HttpTarget(
+            args.url, max(args.concurrency), os.environ.get("_AUTH_TOKEN")
+        )
+    else:
+        from app.utils.serving import build_runner
+
+        target = InProcessTarget(build_runner(), max_sessions=max(args.concurrency))
+    levels = []
+    try:
+        if args.warmup:
+            await run_level(target, mix, 1, args.warmup, rng)
+        for concurrency in args.concurrency:
+            requests = args.requests or concurrency * args.requests_per_user
+            print(f"--- {requests} campaigns at concurrency {concurrency} ---")
+            samples, wall_s = await run_level(target, mix, concurrency, requests, rng)
+            levels.append(summarize(samples, wall_s, concurrency))
+    finally:
+        await target.close()
+    return levels
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--url",
+        default=None,
+        help="streamQuery endpoint to load, e.g. http://127.0.0.1:8080"
+        + LOCAL_PATH
+        + " (default: run in process)",
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests-per-user", type=int, default=4)
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=None,
+        help="Campaigns per level (overrides --requests-per-user)",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=2,
+        help="Unmeasured campaigns before the first level",
+    )
+    parser.add_argument("--intents", default=DEFAULT_INTENTS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--model-latency",
+        type=float,
+        default=0.05,
+        help="Synthetic latency of each replayed model call in process, in seconds",
+    )
+    parser.add_argument(
+        "--slo", default=DEFAULT_SLO, help="JSON file of SLOs (empty to skip)"
+    )
+    parser.add_argument(
+        "--slo-override",
+        action="append",
+        default=[],
+        metavar="KEY<=VALUE",
+        help="Extra or replacement SLO, e.g. 'total_s.p95<=3' or 'throughput_rps>=2'",
+    )
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args(argv)
+
+    if not args.url:
+        # In process, every model call is served by the offline stub.
+        os.environ.setdefault("MODEL_BACKEND", "replay")
+        os.environ.setdefault("MODEL_REPLAY_LATENCY_S", str(args.model_latency))
+        os.environ.setdefault("LLM_CACHE_AGENTS", "")
+
+    levels = asyncio.run(run_load_test(args))
+    print(format_report(levels))
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "run_id": uuid.uuid4().hex,
+                "target": args.url or "in-process",
+                "levels": levels,
+            },
+            f,
+            indent=2,
+        )
+    print(f"--- Results written to {args.output} ---")
+
+    slos: dict[str, dict[str, float]] = {"max": {}, "min": {}}
+    if args.slo:
+        with open(args.slo) as f:
+            for bound, limits in json.load(f).items():
+                slos[bound].update(limits)
+    for bound, limits in parse_slo_overrides(args.slo_override).items():
+        slos[bound].update(limits)
+    violations = check_slos(levels, slos)
+    for message in violations:
+        print(f"SLO MISSED {message}")
+    if not violations:
+        print("--- All SLOs met ---")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
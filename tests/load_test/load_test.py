@@ -15,6 +15,7 @@
 import json
 import logging
 import os
+import random
 import time
 
 from locust import HttpUser, between, task
@@ -25,9 +26,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize Vertex AI and load agent config
-with open("deployment_metadata.json") as f:
-    remote_agent_engine_id = json.load(f)["remote_agent_engine_id"]
+# Target a local streamQuery server (python -m app.local_server) when
+# LOAD_TEST_HOST is set, the deployed agent engine otherwise.
+local_host = os.environ.get("LOAD_TEST_HOST")
+if local_host:
+    remote_agent_engine_id = (
+        "projects/local/locations/local/reasoningEngines/marketingflow"
+    )
+    base_url = local_host
+else:
+    with open("deployment_metadata.json") as f:
+        remote_agent_engine_id = json.load(f)["remote_agent_engine_id"]
 
 parts = remote_agent_engine_id.split("/")
 project_id = parts[1]
@@ -35,9 +44,14 @@ location = parts[3]
 engine_id = parts[5]
 
 # Convert remote agent engine ID to streaming URL.
-base_url = f"https://{location}-aiplatform.googleapis.com"
+if not local_host:
+    base_url = f"https://{location}-aiplatform.googleapis.com"
 url_path = f"/v1beta1/projects/{project_id}/locations/{location}/reasoningEngines/{engine_id}:streamQuery"
 
+# Weighted mix of business intents, shared with campaign_load_test.py.
+with open(os.path.join(os.path.dirname(__file__), "intents.jsonl")) as f:
+    intent_mix = [json.loads(line) for line in f if line.strip()]
+
 logger.info("Using remote agent engine ID: %s", remote_agent_engine_id)
 logger.info("Using base URL: %s", base_url)
 logger.info("Using URL path: %s", url_path)
@@ -53,11 +67,15 @@ class ChatStreamUser(HttpUser):
     def chat_stream(self) -> None:
         """Simulates a chat stream interaction."""
         headers = {"Content-Type": "application/json"}
-        headers["Authorization"] = f"Bearer {os.environ['_AUTH_TOKEN']}"
+        if not local_host:
+            headers["Authorization"] = f"Bearer {os.environ['_AUTH_TOKEN']}"
 
+        intent = random.choices(
+            intent_mix, weights=[i.get("weight", 1) for i in intent_mix]
+        )[0]
         data = {
             "input": {
-                "message": "What's the weather in San Francisco?",
+                "message": intent["intent"],
                 "user_id": "test",
             }
         }
@@ -92,7 +110,7 @@ class ChatStreamUser(HttpUser):
                 total_time = end_time - start_time
                 self.environment.events.request.fire(
                     request_type="POST",
-                    name="/stream_messages end",
+                    name=f"/stream_messages end {intent['name']}",
                     response_time=total_time * 1000,  # Convert to milliseconds
                     response_length=len(events),
                     response=response,
@@ -0,0 +1,75 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import cloudpickle
+import pytest
+from google.adk.agents import LlmAgent
+from google.cloud.aiplatform import initializer
+
+import app.agent
+from app.agent_engine_app import AgentEngineApp
+from app.utils.metrics import get_pipeline_metrics
+from app.utils.ratelimit import rate_limiter
+from app.utils.routing import RouterLlm, hedge_budget, model_health
+
+
+def test_import_does_not_build_agents_or_resolve_credentials(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that root_agent is built by the cached factory on first access only."""
+    calls: list[str] = []
+
+    def build() -> object:
+        calls.append("build")
+        return object()
+
+    monkeypatch.setattr(app.agent, "_build_root_agent", build)
+    monkeypatch.setattr(app.agent, "configure_vertex_ai", lambda: calls.append("auth"))
+    app.agent.get_root_agent.cache_clear()
+    try:
+        first = app.root_agent
+        assert app.agent.root_agent is first
+        assert app.agent.get_root_agent() is first
+        assert calls == ["auth", "build"]
+    finally:
+        app.agent.get_root_agent.cache_clear()
+
+
+def test_root_agent_and_agent_engine_app_can_be_pickled(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that deployment can pickle the app, and that the unpickled agents
+    use the process-wide metrics, health tracker, rate limiter and hedge budget."""
+    monkeypatch.setenv("MODEL_BACKEND", "replay")
+    monkeypatch.setattr(
+        type(initializer.global_config), "project", property(lambda self: "project")
+    )
+    root = app.agent._build_root_agent()
+
+    loaded = cloudpickle.loads(cloudpickle.dumps(root))
+    ideation = loaded.sub_agents[1]
+    assert isinstance(ideation, LlmAgent)
+    assert isinstance(ideation.model, RouterLlm)
+    assert ideation.model.health is model_health
+    assert ideation.model.limiter is rate_limiter
+    assert ideation.model.hedge_budget is hedge_budget
+    callbacks = ideation.before_model_callback
+    assert isinstance(callbacks, list)
+    assert any(
+        getattr(callback, "__self__", None) is get_pipeline_metrics()
+        for callback in callbacks
+    )
+
+    engine_app = cloudpickle.loads(cloudpickle.dumps(AgentEngineApp(agent=root)))
+    assert engine_app._tmpl_attrs["agent"].name == root.name
@@ -0,0 +1,99 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from app.utils.assets import AssetStore
+from app.utils.catalog import BaselineImageCatalog
+
+
+def test_key_depends_on_model_prompt_and_baseline_content(tmp_path: Path) -> None:
+    """Tests that the key changes with the baseline content but not its name."""
+    first = tmp_path / "a.png"
+    copy = tmp_path / "b.png"
+    other = tmp_path / "c.png"
+    first.write_bytes(b"cat")
+    copy.write_bytes(b"cat")
+    other.write_bytes(b"dog")
+    store = AssetStore(str(tmp_path / "out"))
+
+    key = store.key("model", "prompt", str(first))
+
+    assert key == store.key("model", "prompt", str(copy))
+    assert key != store.key("model", "prompt", str(other))
+    assert key != store.key("model", "other prompt", str(first))
+    assert key != store.key("other-model", "prompt", str(first))
+
+
+def test_key_follows_a_baseline_rewritten_in_place(tmp_path: Path) -> None:
+    """Tests that editing a catalogued baseline changes its key, even though the
+    directory mtime stays the same."""
+    baseline = tmp_path / "images_baseline" / "a.png"
+    baseline.parent.mkdir()
+    baseline.write_bytes(b"cat")
+    catalog = BaselineImageCatalog(image_dir=str(baseline.parent))
+    store = AssetStore(str(tmp_path / "out"), catalog=catalog)
+    key = store.key("model", "prompt", str(baseline))
+
+    dir_stat = os.stat(baseline.parent)
+    baseline.write_bytes(b"edited cat")
+    os.utime(baseline.parent, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+
+    assert store.key("model", "prompt", str(baseline)) != key
+
+
+def test_get_or_create_generates_once(tmp_path: Path) -> None:
+    """Tests that a repeated request is served from the store without generating."""
+    store = AssetStore(str(tmp_path))
+    calls: list[int] = []
+
+    def generate() -> bytes:
+        calls.append(1)
+        return b"asset"
+
+    path, cached = store.get_or_create("k" * 64, ".png", generate)
+    again, cached_again = store.get_or_create("k" * 64, ".png", generate)
+
+    assert (cached, cached_again) == (False, True)
+    assert path == again
+    assert open(path, "rb").read() == b"asset"
+    assert len(calls) == 1
+
+
+def test_concurrent_requests_share_one_generation(tmp_path: Path) -> None:
+    """Tests that concurrent identical requests wait for a single generation."""
+    store = AssetStore(str(tmp_path))
+    calls: list[int] = []
+    lock = threading.Lock()
+
+    def generate() -> bytes:
+        with lock:
+            calls.append(1)
+        time.sleep(0.05)
+        return b"asset"
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(
+            pool.map(
+                lambda _: store.get_or_create("k" * 64, ".mp4", generate), range(8)
+            )
+        )
+
+    assert len(calls) == 1
+    assert len({path for path, _ in results}) == 1
+    assert [name for name in os.listdir(tmp_path) if name.startswith(".tmp-")] == []
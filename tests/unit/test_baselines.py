@@ -0,0 +1,132 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from collections.abc import Callable
+from types import SimpleNamespace
+from typing import cast
+
+import pytest
+from google.adk.agents import LlmAgent, ParallelAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types as genai_types
+
+from app.utils.baselines import BaselineSelectionAgent, parse_weights, select_baseline
+from app.utils.pipeline import VisualMarketingPipeline
+
+PATHS = ["images_baseline/a.png", "images_baseline/b.png", "images_baseline/c.png"]
+
+
+def run_selection(catalog: Callable[[], list[str]]) -> list[Event]:
+    agent = BaselineSelectionAgent(name="BaselineSelectionAgent", catalog=catalog)
+    ctx = cast(
+        InvocationContext,
+        SimpleNamespace(
+            invocation_id="inv-1",
+            branch=None,
+            user_content=genai_types.Content(
+                role="user", parts=[genai_types.Part(text="Summer cat tees.")]
+            ),
+        ),
+    )
+
+    async def collect() -> list[Event]:
+        return [event async for event in agent._run_async_impl(ctx)]
+
+    return asyncio.run(collect())
+
+
+def test_selection_is_reproducible_per_intent() -> None:
+    """Tests that both strategies depend only on the intent."""
+    for strategy in ("deterministic", "weighted"):
+        first = select_baseline(PATHS, "Summer cat tees.", strategy)
+        assert first in PATHS
+        assert select_baseline(PATHS, "Summer cat tees.", strategy) == first
+    picks = {select_baseline(PATHS, f"intent {i}") for i in range(30)}
+    assert picks == set(PATHS)
+
+
+def test_weighted_selection_follows_weights() -> None:
+    """Tests that a zero weight excludes a file and a high weight dominates."""
+    weights = parse_weights("a.png=0, b.png=50")
+    picks = [
+        select_baseline(PATHS, f"intent {i}", "weighted", weights) for i in range(100)
+    ]
+    assert "images_baseline/a.png" not in picks
+    assert picks.count("images_baseline/b.png") > 80
+    with pytest.raises(ValueError):
+        select_baseline([], "intent")
+
+
+def test_agent_writes_catalog_and_selection_to_state() -> None:
+    """Tests the state delta of the selection stage."""
+    (event,) = run_selection(lambda: PATHS)
+
+    state_delta = event.actions.state_delta
+    assert state_delta["baseline_images"] == PATHS
+    assert state_delta["selected_baseline_image"] == select_baseline(
+        PATHS, "Summer cat tees."
+    )
+
+
+def test_missing_or_empty_catalog_ends_the_pipeline_gracefully() -> None:
+    """Tests that no baseline image reports an error instead of raising."""
+
+    def missing() -> list[str]:
+        raise FileNotFoundError("images_baseline")
+
+    for catalog in (missing, list):
+        (event,) = run_selection(catalog)
+        assert event.actions.escalate
+        assert event.actions.state_delta["baseline_images"] == []
+        assert "Skipping asset generation" in str(
+            event.actions.state_delta["pipeline_error"]
+        )
+
+    generation = LlmAgent(name="ImageGenerationAgent", model="gemini-2.5-flash")
+    root = VisualMarketingPipeline(
+        name="VisualMarketingAgent",
+        sub_agents=[
+            BaselineSelectionAgent(name="BaselineSelectionAgent", catalog=list),
+            LlmAgent(
+                name="VisualIdeationAgent",
+                model="gemini-2.5-flash",
+                output_key="visual_concepts",
+            ),
+            ParallelAgent(name="VisualGenerationLayer", sub_agents=[generation]),
+        ],
+    )
+    runner = Runner(
+        agent=root, app_name="test", session_service=InMemorySessionService()
+    )
+
+    async def run() -> list[str]:
+        session = await runner.session_service.create_session(
+            app_name="test", user_id="user"
+        )
+        message = genai_types.Content(
+            role="user", parts=[genai_types.Part(text="Summer cat tees.")]
+        )
+        return [
+            event.author
+            async for event in runner.run_async(
+                user_id="user", session_id=session.id, new_message=message
+            )
+        ]
+
+    # Reaching an LlmAgent would call the real model, which fails offline.
+    assert asyncio.run(run()) == ["BaselineSelectionAgent"]
@@ -0,0 +1,129 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+from collections.abc import AsyncIterator
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, cast
+
+from google.adk.runners import Runner
+
+from app.utils.batch import CampaignIntent, load_intents, run_batch
+
+
+class FakeSessionService:
+    def __init__(self) -> None:
+        self.created = 0
+
+    async def create_session(
+        self, app_name: str, user_id: str, session_id: str | None = None
+    ) -> SimpleNamespace:
+        self.created += 1
+        return SimpleNamespace(id=f"session-{self.created}")
+
+
+class FakeRunner:
+    """Emits one event per pipeline stage after a short simulated model delay."""
+
+    def __init__(self, delay: float = 0.05) -> None:
+        self.app_name = "app"
+        self.session_service = FakeSessionService()
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def run_async(
+        self, user_id: str, session_id: str, new_message: Any
+    ) -> AsyncIterator[SimpleNamespace]:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            for author, key in [
+                ("VisualIdeationAgent", "visual_concepts"),
+                ("ImageGenerationAgent", "generated_image_path"),
+                ("TwitterPublisherAgent", "twitter_post"),
+            ]:
+                await asyncio.sleep(self.delay)
+                yield SimpleNamespace(
+                    author=author,
+                    actions=SimpleNamespace(
+                        state_delta={key: f"{key} for {session_id}"}
+                    ),
+                )
+        finally:
+            self.in_flight -= 1
+
+
+def test_load_intents_accepts_strings_and_objects(tmp_path: Path) -> None:
+    """Tests that intents can be plain strings or objects with optional ids."""
+    path = tmp_path / "intents.jsonl"
+    path.write_text('"Summer cat tees"\n\n{"id": "c2", "intent": "Winter hoodies"}\n')
+
+    intents = load_intents(str(path))
+
+    assert [i.intent for i in intents] == ["Summer cat tees", "Winter hoodies"]
+    assert intents[1].id == "c2"
+    assert intents[0].id == load_intents(str(path))[0].id
+
+
+def test_run_batch_runs_concurrently_and_streams_results(tmp_path: Path) -> None:
+    """Tests that campaigns overlap and every result is written with timings."""
+    runner = FakeRunner()
+    intents = [CampaignIntent(id=str(i), intent=f"intent {i}") for i in range(6)]
+    output = tmp_path / "results.jsonl"
+
+    counts = asyncio.run(
+        run_batch(cast(Runner, runner), intents, str(output), concurrency=3)
+    )
+
+    assert counts == {"ok": 6, "error": 0, "skipped": 0}
+    assert runner.max_in_flight == 3
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert sorted(r["id"] for r in records) == [str(i) for i in range(6)]
+    assert all(r["twitter_post"] for r in records)
+    timings = records[0]["timings"]
+    assert set(timings) == {
+        "VisualIdeationAgent",
+        "ImageGenerationAgent",
+        "TwitterPublisherAgent",
+    }
+    assert (
+        timings["TwitterPublisherAgent"]["start_s"]
+        >= timings["ImageGenerationAgent"]["end_s"]
+    )
+
+
+def test_run_batch_resumes_after_crash(tmp_path: Path) -> None:
+    """Tests that completed intents are skipped and a torn last line is repaired."""
+    output = tmp_path / "results.jsonl"
+    output.write_text(
+        json.dumps({"id": "0", "status": "ok"})
+        + "\n"
+        + json.dumps({"id": "1", "status": "error"})
+        + "\n"
+        + '{"id": "2", "sta'
+    )
+    runner = FakeRunner(delay=0)
+    intents = [CampaignIntent(id=str(i), intent=f"intent {i}") for i in range(3)]
+
+    counts = asyncio.run(
+        run_batch(cast(Runner, runner), intents, str(output), concurrency=2)
+    )
+
+    assert counts == {"ok": 2, "error": 0, "skipped": 1}
+    lines = output.read_text().splitlines()
+    assert lines[2] == '{"id": "2", "sta'
+    assert sorted(json.loads(line)["id"] for line in lines[3:]) == ["1", "2"]
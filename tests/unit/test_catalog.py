@@ -0,0 +1,135 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+import struct
+from pathlib import Path
+
+import pytest
+
+from app.utils import catalog as catalog_module
+from app.utils.catalog import BaselineImage, BaselineImageCatalog
+
+
+def png_bytes(width: int, height: int, payload: bytes = b"") -> bytes:
+    """Builds the header of a PNG file with the given dimensions."""
+    ihdr = struct.pack(">II", width, height) + b"\x08\x06\x00\x00\x00"
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + struct.pack(">I", 13)
+        + b"IHDR"
+        + ihdr
+        + b"\x00" * 4
+        + payload
+    )
+
+
+@pytest.fixture
+def image_dir(tmp_path: Path) -> Path:
+    directory = tmp_path / "images_baseline"
+    directory.mkdir()
+    (directory / "red_cat_tee.png").write_bytes(png_bytes(600, 900))
+    (directory / "blue_cat_tee.png").write_bytes(png_bytes(900, 600))
+    (directory / "notes.txt").write_text("not an image")
+    return directory
+
+
+def test_catalog_indexes_size_dimensions_hash_and_tags(image_dir: Path) -> None:
+    """Tests that each entry carries the metadata read from the file."""
+    catalog = BaselineImageCatalog(image_dir=str(image_dir))
+    path = os.path.join(str(image_dir), "red_cat_tee.png")
+
+    entry = catalog.get(path)
+
+    assert entry is not None
+    data = (image_dir / "red_cat_tee.png").read_bytes()
+    assert entry.size == len(data)
+    assert entry.sha256 == hashlib.sha256(data).hexdigest()
+    assert (entry.width, entry.height) == (600, 900)
+    assert entry.tags == ["cat", "portrait", "red", "tee"]
+    assert catalog.get(os.path.join(str(image_dir), "notes.txt")) is None
+
+
+def test_catalog_query_by_tag_and_attribute(image_dir: Path) -> None:
+    """Tests tag lookups combined with attribute filters."""
+    (image_dir / "tags.json").write_text(json.dumps({"blue_cat_tee.png": ["Summer"]}))
+    catalog = BaselineImageCatalog(image_dir=str(image_dir))
+
+    assert [e.width for e in catalog.query(tag="cat")] == [900, 600]
+    assert [e.width for e in catalog.query(tag="cat", orientation="landscape")] == [900]
+    assert [e.width for e in catalog.query(tag="summer")] == [900]
+    assert catalog.query(tag="hoodie") == []
+
+
+def test_catalog_rehashes_only_changed_files(
+    image_dir: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that a persisted index is reused and only modified files are re-read."""
+    index_path = str(tmp_path / "index.json")
+    BaselineImageCatalog(image_dir=str(image_dir), index_path=index_path).paths()
+
+    indexed: list[str] = []
+    original = catalog_module._index_file
+
+    def index_file(path: str, stat: os.stat_result) -> BaselineImage:
+        indexed.append(os.path.basename(path))
+        return original(path, stat)
+
+    monkeypatch.setattr(catalog_module, "_index_file", index_file)
+    catalog = BaselineImageCatalog(image_dir=str(image_dir), index_path=index_path)
+    assert len(catalog.paths()) == 2
+    assert indexed == []
+
+    (image_dir / "red_cat_tee.png").write_bytes(png_bytes(700, 700, payload=b"v2"))
+    (image_dir / "green_cat_tee.png").write_bytes(png_bytes(100, 100))
+    catalog.refresh()
+
+    assert sorted(indexed) == ["green_cat_tee.png", "red_cat_tee.png"]
+    entry = catalog.get(os.path.join(str(image_dir), "red_cat_tee.png"))
+    assert entry is not None
+    assert entry.orientation == "square"
+
+
+def test_catalog_picks_up_new_files_without_explicit_refresh(image_dir: Path) -> None:
+    """Tests that adding a file to the directory invalidates the in-memory index."""
+    catalog = BaselineImageCatalog(image_dir=str(image_dir))
+    assert len(catalog.paths()) == 2
+
+    (image_dir / "green_cat_tee.png").write_bytes(png_bytes(100, 100))
+    os.utime(image_dir, ns=(0, os.stat(image_dir).st_mtime_ns + 1_000_000))
+
+    assert len(catalog.paths()) == 3
+
+
+def test_catalog_rehashes_a_file_rewritten_in_place(image_dir: Path) -> None:
+    """Tests that get() notices a rewrite that leaves the directory mtime unchanged."""
+    catalog = BaselineImageCatalog(image_dir=str(image_dir))
+    path = os.path.join(str(image_dir), "red_cat_tee.png")
+    before = catalog.get(path)
+    assert before is not None
+    old_sha256 = before.sha256
+
+    dir_stat = os.stat(image_dir)
+    (image_dir / "red_cat_tee.png").write_bytes(png_bytes(600, 900, payload=b"v2"))
+    os.utime(image_dir, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+
+    after = catalog.get(path)
+    assert after is not None
+    assert after.sha256 != old_sha256
+    assert (
+        after.sha256
+        == hashlib.sha256((image_dir / "red_cat_tee.png").read_bytes()).hexdigest()
+    )
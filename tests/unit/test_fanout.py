@@ -0,0 +1,144 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import Any, cast
+
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.genai import types as genai_types
+
+from app.utils.fanout import AssetGenerator, VariantFanOutAgent, parse_model_limits
+
+Log = list[tuple[str, str, float]]
+
+
+def make_context(concepts: str) -> InvocationContext:
+    return cast(
+        InvocationContext,
+        SimpleNamespace(
+            invocation_id="inv-1",
+            branch=None,
+            session=SimpleNamespace(state={"visual_concepts": concepts}),
+            user_content=genai_types.Content(
+                role="user", parts=[genai_types.Part(text="Summer cat tees.")]
+            ),
+        ),
+    )
+
+
+def run_agent(agent: VariantFanOutAgent, ctx: InvocationContext) -> list[Event]:
+    async def collect() -> list[Event]:
+        return [event async for event in agent._run_async_impl(ctx)]
+
+    return asyncio.run(collect())
+
+
+def fake_generator(kind: str, model: str, delay: float, log: Log) -> AssetGenerator:
+    async def generate(prompt: str, baseline: str) -> tuple[str, bool]:
+        log.append((kind, "start", time.perf_counter()))
+        await asyncio.sleep(delay)
+        log.append((kind, "end", time.perf_counter()))
+        return f"{kind}/{len(log)}", False
+
+    return AssetGenerator(kind, model, generate)
+
+
+def test_fanout_generates_variant_matrix_into_state() -> None:
+    """Tests concepts x baselines x variants x kinds and the resulting state delta."""
+    log: Log = []
+    agent = VariantFanOutAgent(
+        name="VariantFanOutAgent",
+        generators=[
+            fake_generator("image", "image-model", 0, log),
+            fake_generator("video", "video-model", 0, log),
+        ],
+        baselines=lambda: [
+            "images_baseline/a.png",
+            "images_baseline/b.png",
+            "images_baseline/c.png",
+        ],
+        variants=2,
+        max_concepts=2,
+        max_baselines=2,
+    )
+
+    (event,) = run_agent(agent, make_context("* Beach\n* Park\n* City"))
+
+    variants = cast(list[dict[str, Any]], event.actions.state_delta["variants"])
+    assert len(variants) == 2 * 2 * 2 * 2
+    assert {v["concept"] for v in variants} == {"Beach", "Park"}
+    assert variants[0]["id"] == "image-c1-b1-v1"
+    assert variants[0]["prompt"] != variants[2]["prompt"]
+    assert all(v["status"] == "ok" for v in variants)
+    assert event.actions.state_delta["generated_image_path"] == variants[0]["path"]
+    assert "[video-c2-b2-v2]" in str(event.actions.state_delta["variants_summary"])
+
+
+def test_slow_model_does_not_hold_up_other_models() -> None:
+    """Tests per-model limits and that queued video jobs never take global slots."""
+    log: Log = []
+    agent = VariantFanOutAgent(
+        name="VariantFanOutAgent",
+        generators=[
+            fake_generator("image", "image-model", 0.05, log),
+            fake_generator("video", "video-model", 0.3, log),
+        ],
+        baselines=lambda: ["a.png", "b.png"],
+        variants=2,
+        max_concepts=1,
+        concurrency=3,
+        model_concurrency=parse_model_limits("video-model=1"),
+    )
+
+    start = time.perf_counter()
+    run_agent(agent, make_context("* Beach"))
+
+    image_ends = [
+        t - start for kind, phase, t in log if kind == "image" and phase == "end"
+    ]
+    assert len(image_ends) == 4
+    assert max(image_ends) < 0.25
+    running = {"image": 0, "video": 0}
+    for kind, phase, _ in log:
+        running[kind] += 1 if phase == "start" else -1
+        assert running["video"] <= 1
+        assert sum(running.values()) <= 3
+
+
+def test_kind_without_any_successful_variant_gets_a_note() -> None:
+    """Tests that generated_<kind>_path is set even when every variant failed."""
+
+    async def fail(prompt: str, baseline: str) -> tuple[str, bool]:
+        raise RuntimeError("quota exceeded")
+
+    agent = VariantFanOutAgent(
+        name="VariantFanOutAgent",
+        generators=[
+            fake_generator("image", "image-model", 0, []),
+            AssetGenerator("video", "video-model", fail),
+        ],
+        baselines=lambda: ["a.png"],
+    )
+
+    (event,) = run_agent(agent, make_context("* Beach"))
+
+    state_delta = event.actions.state_delta
+    assert state_delta["generated_image_path"] == "image/2"
+    assert state_delta["generated_video_path"] == (
+        "No video was generated: every variant failed."
+    )
+    assert agent.model_concurrency == {}
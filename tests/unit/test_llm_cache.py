@@ -0,0 +1,134 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+from typing import cast
+from unittest.mock import patch
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types as genai_types
+
+from app.utils.llm_cache import ResponseCache, ResponseCacheCallbacks, cache_key
+
+
+def context(invocation_id: str) -> CallbackContext:
+    return cast(
+        CallbackContext,
+        SimpleNamespace(invocation_id=invocation_id, agent_name="VisualIdeationAgent"),
+    )
+
+
+def make_request(text: str) -> LlmRequest:
+    return LlmRequest(
+        model="gemini-2.5-flash",
+        contents=[
+            genai_types.Content(role="user", parts=[genai_types.Part(text=text)])
+        ],
+        config=genai_types.GenerateContentConfig(
+            system_instruction="Brainstorm concepts."
+        ),
+    )
+
+
+def test_cache_key_ignores_case_punctuation_and_whitespace() -> None:
+    """Tests that small wording differences normalize to the same key."""
+    key = cache_key("m", "instruction", "Summer  cat tees, relaxed vibe!")
+    assert key == cache_key("m", "instruction", "summer cat tees relaxed vibe")
+    assert key != cache_key("m", "other instruction", "summer cat tees relaxed vibe")
+    assert key != cache_key("m", "instruction", "winter cat tees relaxed vibe")
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    """Tests size-bounded LRU eviction and the hit/miss counters."""
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=10)
+    with patch("app.utils.llm_cache.time.time", side_effect=[1, 2, 3, 4, 5]):
+        cache.put("a", "aaaa")
+        cache.put("b", "bbbb")
+        assert cache.get("a") == "aaaa"
+        cache.put("c", "cccc")
+        assert cache.get("b") is None
+
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 1, "entries": 2}
+
+
+def test_response_cache_expires_entries(tmp_path: Path) -> None:
+    """Tests that entries older than the TTL are not served."""
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60)
+    with patch("app.utils.llm_cache.time.time", side_effect=[0, 30, 61]):
+        cache.put("a", "value")
+        assert cache.get("a") == "value"
+        assert cache.get("a") is None
+
+
+def test_callbacks_short_circuit_repeated_request(tmp_path: Path) -> None:
+    """Tests that a cached response is returned instead of calling the model."""
+    callbacks = ResponseCacheCallbacks(ResponseCache(str(tmp_path / "cache.sqlite3")))
+    callback_context = context("inv-1")
+    response = LlmResponse(
+        content=genai_types.Content(
+            role="model", parts=[genai_types.Part(text="* A picnic")]
+        )
+    )
+
+    async def run() -> tuple[LlmResponse | None, LlmResponse | None]:
+        miss = await callbacks.before_model(
+            callback_context, make_request("Summer cat tees")
+        )
+        await callbacks.after_model(callback_context, response)
+        hit = await callbacks.before_model(
+            callback_context, make_request("summer cat tees.")
+        )
+        return miss, hit
+
+    miss, hit = asyncio.run(run())
+
+    assert miss is None
+    assert hit is not None and hit.content is not None and hit.content.parts
+    assert hit.content.parts[0].text == "* A picnic"
+    assert callbacks.cache.stats()["hits"] == 1
+
+
+def test_callbacks_skip_tool_exchanges() -> None:
+    """Tests that requests carrying function responses are never cached."""
+    request = make_request("Generate an image")
+    request.contents.append(
+        genai_types.Content(
+            role="user",
+            parts=[
+                genai_types.Part.from_function_response(
+                    name="list_baseline_images", response={"result": []}
+                )
+            ],
+        )
+    )
+    assert ResponseCacheCallbacks.request_key(request) is None
+
+
+def test_callbacks_forget_misses_whose_response_never_arrives(tmp_path: Path) -> None:
+    """Tests that a failed or cancelled model call does not leave its miss behind."""
+    callbacks = ResponseCacheCallbacks(
+        ResponseCache(str(tmp_path / "cache.sqlite3")), pending_ttl_seconds=0.05
+    )
+
+    async def run() -> None:
+        await callbacks.before_model(context("failed"), make_request("Campaign A"))
+        await asyncio.sleep(0.1)
+        await callbacks.before_model(context("new"), make_request("Campaign B"))
+
+    asyncio.run(run())
+
+    assert [invocation_id for invocation_id, _ in callbacks._pending] == ["new"]
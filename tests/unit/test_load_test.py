@@ -0,0 +1,129 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import random
+from collections.abc import AsyncIterator
+from types import SimpleNamespace
+from typing import Any
+
+from tests.load_test.campaign_load_test import (
+    DEFAULT_INTENTS,
+    InProcessTarget,
+    Sample,
+    WeightedIntent,
+    check_slos,
+    format_report,
+    load_intent_mix,
+    parse_slo_overrides,
+    percentiles,
+    run_level,
+    summarize,
+)
+
+STAGES = ["IdeationAgent", "ImageGenerationAgent", "TwitterPublisherAgent"]
+
+
+class FakeSessionService:
+    async def create_session(
+        self, app_name: str, user_id: str, session_id: str | None = None
+    ) -> SimpleNamespace:
+        return SimpleNamespace(id=f"{user_id}-session")
+
+
+class FakeRunner:
+    """Emits one event per stage after a simulated model delay; fails on "fail" intents."""
+
+    def __init__(self, delay: float = 0.01) -> None:
+        self.app_name = "app"
+        self.session_service = FakeSessionService()
+        self.delay = delay
+
+    async def run_async(
+        self, user_id: str, session_id: str, new_message: Any
+    ) -> AsyncIterator[SimpleNamespace]:
+        for author in STAGES:
+            await asyncio.sleep(self.delay)
+            if new_message.parts[0].text == "fail" and author == STAGES[-1]:
+                raise RuntimeError("publisher failed")
+            yield SimpleNamespace(author=author)
+
+
+def test_percentiles_and_slo_gates() -> None:
+    """Tests nearest-rank percentiles and max, min and missing-key SLO checks."""
+    assert percentiles([float(v) for v in range(1, 101)]) == {
+        "p50": 50.0,
+        "p95": 95.0,
+        "p99": 99.0,
+    }
+    assert percentiles([2.0]) == {"p50": 2.0, "p95": 2.0, "p99": 2.0}
+    assert percentiles([]) == {"p50": None, "p95": None, "p99": None}
+
+    level = {
+        "concurrency": 4,
+        "error_rate": 0.1,
+        "throughput_rps": 3.0,
+        "total_s": {"p50": 1.0, "p95": 2.0, "p99": 4.0},
+        "stages": {"IdeationAgent": {"p50": 0.2, "p95": 0.5, "p99": 0.6}},
+    }
+    slos = parse_slo_overrides(
+        [
+            "error_rate<=0.05",
+            "total_s.p95<=3",
+            "stages.TwitterPublisherAgent.p95<=5",
+            "throughput_rps>=5",
+        ]
+    )
+
+    assert check_slos([level], slos) == [
+        "concurrency 4: error_rate = 0.1 > 0.05",
+        "concurrency 4: stages.TwitterPublisherAgent.p95 = None > 5.0",
+        "concurrency 4: throughput_rps = 3.0 < 5.0",
+    ]
+
+
+def test_in_process_level_reports_stage_latencies() -> None:
+    """Tests a weighted closed-loop run: stage timings, errors and the report."""
+    mix = [WeightedIntent("launch", "Launch", 3), WeightedIntent("broken", "fail", 1)]
+
+    async def run() -> tuple[list[Sample], float, InProcessTarget]:
+        target = InProcessTarget(FakeRunner(), max_sessions=4)
+        samples, wall_s = await run_level(
+            target, mix, concurrency=4, requests=40, rng=random.Random(1)
+        )
+        await target.close()
+        return samples, wall_s, target
+
+    samples, wall_s, target = asyncio.run(run())
+    summary = summarize(samples, wall_s, concurrency=4)
+
+    assert summary["requests"] == 40
+    assert summary["mix"]["launch"] > summary["mix"]["broken"] > 0
+    assert summary["errors"] == {"RuntimeError": summary["mix"]["broken"]}
+    assert summary["ok"] == summary["mix"]["launch"] == target.worker.stats["ok"]
+    assert list(summary["stages"]) == STAGES
+    stage_p50s = [summary["stages"][s]["p50"] for s in STAGES]
+    assert (
+        summary["ttfe_s"]["p50"]
+        <= stage_p50s[0]
+        < stage_p50s[1]
+        < stage_p50s[2]
+        <= summary["total_s"]["p50"]
+    )
+    assert summary["throughput_rps"] > 0
+    assert "TwitterPublisherAgent" in format_report([summary])
+    assert {i.name for i in load_intent_mix(DEFAULT_INTENTS)} >= {
+        "summer_launch",
+        "flash_sale",
+    }
@@ -0,0 +1,184 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+from collections.abc import AsyncIterator
+from types import SimpleNamespace
+from typing import Any, cast
+
+from google.adk.runners import Runner
+
+from app.local_server import MAX_BODY_BYTES, StreamQueryServer
+
+PATH = (
+    "/v1beta1/projects/local/locations/local/reasoningEngines/marketingflow:streamQuery"
+)
+
+
+class FakeEvent:
+    def __init__(self, author: str, text: str) -> None:
+        self.author = author
+        self.text = text
+
+    def model_dump(self, mode: str, exclude_none: bool) -> dict:
+        return {"author": self.author, "content": {"parts": [{"text": self.text}]}}
+
+
+class FakeSessionService:
+    def __init__(self) -> None:
+        self.sessions: set[str] = set()
+
+    async def create_session(
+        self, app_name: str, user_id: str, session_id: str | None = None
+    ) -> SimpleNamespace:
+        session_id = session_id or f"session-{len(self.sessions) + 1}"
+        self.sessions.add(session_id)
+        return SimpleNamespace(id=session_id)
+
+    async def get_session(
+        self, app_name: str, user_id: str, session_id: str
+    ) -> SimpleNamespace | None:
+        return SimpleNamespace(id=session_id) if session_id in self.sessions else None
+
+
+class FakeRunner:
+    """Emits one event per sub-agent, each after a simulated model delay."""
+
+    def __init__(self, delay: float = 0.02) -> None:
+        self.app_name = "app"
+        self.session_service = FakeSessionService()
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def run_async(
+        self, user_id: str, session_id: str, new_message: Any
+    ) -> AsyncIterator[FakeEvent]:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            for author in [
+                "VisualIdeationAgent",
+                "ImageGenerationAgent",
+                "TwitterPublisherAgent",
+            ]:
+                await asyncio.sleep(self.delay)
+                yield FakeEvent(author, f"{author} output")
+        finally:
+            self.in_flight -= 1
+
+
+async def request(
+    app: StreamQueryServer,
+    path: str = PATH,
+    body: Any = None,
+    query: bytes = b"alt=sse",
+    method: str = "POST",
+) -> tuple[int, dict[bytes, bytes], str]:
+    """Drives one ASGI request and returns its status, headers and body."""
+    body = (
+        {"input": {"message": "Summer cat tees", "user_id": "u"}}
+        if body is None
+        else body
+    )
+    incoming = [
+        {"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}
+    ]
+    sent: list[dict[str, Any]] = []
+
+    async def receive() -> dict[str, Any]:
+        if incoming:
+            return incoming.pop(0)
+        await asyncio.Event().wait()  # The client stays connected.
+        raise AssertionError("unreachable")
+
+    async def send(message: dict[str, Any]) -> None:
+        sent.append(message)
+
+    scope = {"type": "http", "path": path, "method": method, "query_string": query}
+    await app(scope, receive, send)
+    headers = dict(sent[0]["headers"])
+    return (
+        sent[0]["status"],
+        headers,
+        b"".join(m.get("body", b"") for m in sent[1:]).decode(),
+    )
+
+
+def test_stream_query_streams_each_sub_agent_event_as_sse() -> None:
+    """Tests the SSE framing, keep-alive comments, sessions and error routes."""
+    runner = FakeRunner(delay=0.05)
+    app = StreamQueryServer(runner=cast(Runner, runner), keepalive_s=0.03)
+
+    async def run() -> tuple[tuple[int, dict[bytes, bytes], str], ...]:
+        first = await request(app)
+        session_id = first[1][b"x-session-id"].decode()
+        body = {"input": {"message": "More", "user_id": "u", "session_id": session_id}}
+        return (
+            first,
+            await request(app, body=body, query=b""),
+            await request(
+                app,
+                body={"input": {"message": "x", "user_id": "u", "session_id": "nope"}},
+            ),
+            await request(app, path="/v1/elsewhere"),
+            await request(app, body={"input": {"message": "x" * MAX_BODY_BYTES}}),
+        )
+
+    (status, headers, body), (_, ndjson_headers, ndjson), missing, unknown, large = (
+        asyncio.run(run())
+    )
+
+    assert status == 200
+    assert headers[b"content-type"] == b"text/event-stream"
+    events = [
+        json.loads(line[len("data: ") :])
+        for line in body.split("\n\n")
+        if line.startswith("data: ")
+    ]
+    assert [e["author"] for e in events] == [
+        "VisualIdeationAgent",
+        "ImageGenerationAgent",
+        "TwitterPublisherAgent",
+    ]
+    assert ": keep-alive" in body
+    assert ndjson_headers[b"content-type"] == b"application/json"
+    assert [json.loads(line)["author"] for line in ndjson.splitlines()][
+        -1
+    ] == "TwitterPublisherAgent"
+    assert missing[0] == 404
+    assert unknown[0] == 404
+    assert large[0] == 413
+    assert json.loads(large[2])["error"]["status"] == "PAYLOAD_TOO_LARGE"
+
+
+def test_requests_beyond_capacity_are_rejected_with_429() -> None:
+    """Tests bounded concurrency: max_sessions run, max_queue wait, the rest get 429."""
+    runner = FakeRunner(delay=0.05)
+    app = StreamQueryServer(runner=cast(Runner, runner), max_sessions=2, max_queue=1)
+
+    async def run() -> list[tuple[int, dict[bytes, bytes], str]]:
+        return await asyncio.gather(*(request(app) for _ in range(5)))
+
+    responses = asyncio.run(run())
+
+    statuses = sorted(status for status, _, _ in responses)
+    assert statuses == [200, 200, 200, 429, 429]
+    rejected = next(r for r in responses if r[0] == 429)
+    assert rejected[1][b"retry-after"] == b"1"
+    assert json.loads(rejected[2])["error"]["status"] == "RESOURCE_EXHAUSTED"
+    assert runner.max_in_flight == 2
+    assert app.worker.stats["ok"] == 3
+    assert app.worker.in_flight == 0 and app._admitting == 0
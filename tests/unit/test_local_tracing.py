@@ -0,0 +1,152 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.trace import SpanContext, TraceFlags
+
+from app.utils.local_tracing import (
+    InMemoryPayloadStore,
+    JsonlSpanExporter,
+    RingBufferSpanExporter,
+)
+from app.utils.tracing import create_span_exporter
+
+
+def make_spans(count: int, attributes: dict | None = None) -> list[ReadableSpan]:
+    return [
+        ReadableSpan(
+            name=f"span {i}",
+            context=SpanContext(
+                trace_id=0x1234,
+                span_id=0x100 + i,
+                is_remote=False,
+                trace_flags=TraceFlags(TraceFlags.SAMPLED),
+            ),
+            attributes=attributes or {"gen_ai.request.model": "gemini-2.5-flash"},
+            resource=Resource.create({}),
+            start_time=1_000,
+            end_time=2_000,
+        )
+        for i in range(count)
+    ]
+
+
+def test_jsonl_exporter_rotates_and_compresses(tmp_path: Path) -> None:
+    """Tests that the log is rotated at max_bytes and backups are gzipped and capped."""
+    path = tmp_path / "spans.jsonl"
+    exporter = JsonlSpanExporter(str(path), max_bytes=4000, backup_count=2)
+
+    for _ in range(20):
+        exporter.export(make_spans(2))
+    exporter.shutdown()
+
+    assert exporter.stats()["rotations"] >= 2
+    assert sorted(os.listdir(tmp_path)) == [
+        "spans.jsonl",
+        "spans.jsonl.1.gz",
+        "spans.jsonl.2.gz",
+    ]
+    with gzip.open(tmp_path / "spans.jsonl.1.gz", "rt") as f:
+        entry = json.loads(f.readline())
+    assert entry["trace"] == "projects/local/traces/1234"
+    assert entry["attributes"] == {"gen_ai.request.model": "gemini-2.5-flash"}
+    assert os.path.getsize(path) <= 4000
+
+
+def test_jsonl_exporter_offloads_large_attributes_to_files(tmp_path: Path) -> None:
+    """Tests that the local exporter shares the offload logic of the cloud exporter."""
+    exporter = JsonlSpanExporter(str(tmp_path / "spans.jsonl"))
+
+    exporter.export(make_spans(1, attributes={"llm_request": "x" * (300 * 1024)}))
+    exporter.shutdown()
+
+    with open(tmp_path / "spans.jsonl") as f:
+        entry = json.loads(f.readline())
+    reference = entry["attributes"]["llm_request"]
+    payload_path = tmp_path / "payloads" / "spans" / "100" / "llm_request.json.gz"
+    assert reference["uri_payload"] == f"file://{payload_path}"
+    with gzip.open(payload_path) as f:
+        assert json.load(f) == "x" * (300 * 1024)
+
+
+def test_ring_buffer_keeps_last_spans() -> None:
+    """Tests that the ring buffer discards the oldest entries beyond its capacity."""
+    exporter = RingBufferSpanExporter(capacity=3)
+
+    exporter.export(make_spans(5))
+
+    assert [entry["name"] for entry in exporter.entries()] == [
+        "span 2",
+        "span 3",
+        "span 4",
+    ]
+    assert exporter.stats()["exported_spans"] == 5
+
+
+def test_ring_buffer_keeps_payloads_of_last_spans() -> None:
+    """Tests that the default payload store is bounded by the ring's capacity."""
+    exporter = RingBufferSpanExporter(capacity=3)
+
+    for span in make_spans(5, attributes={"llm_request": "x" * (300 * 1024)}):
+        exporter.export([span])
+        exporter.force_flush()
+
+    store = exporter.payload_store
+    assert isinstance(store, InMemoryPayloadStore)
+    assert list(store.payloads) == [
+        f"spans/{span_id}/llm_request.json.gz" for span_id in ("102", "103", "104")
+    ]
+
+
+@pytest.mark.parametrize(
+    "kind, expected",
+    [
+        ("jsonl", JsonlSpanExporter),
+        ("memory", RingBufferSpanExporter),
+        ("none", type(None)),
+    ],
+)
+def test_create_span_exporter_from_config(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: Path, kind: str, expected: type
+) -> None:
+    """Tests that TRACE_EXPORTER selects the exporter without any cloud client."""
+    monkeypatch.setenv("TRACE_EXPORTER", kind)
+    monkeypatch.setenv("TRACE_LOG_PATH", str(tmp_path / "spans.jsonl"))
+
+    exporter = create_span_exporter(project_id="test-project")
+
+    if exporter is not None:
+        exporter.shutdown()
+    assert isinstance(exporter, expected)
+
+
+def test_local_exporters_do_not_load_cloud_clients() -> None:
+    """Tests that importing the local exporters leaves the Cloud client libraries unloaded."""
+    code = (
+        "import sys, app.utils.local_tracing; "
+        "print([m for m in sys.modules if m.startswith(('google.cloud.', 'google.api_core'))])"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
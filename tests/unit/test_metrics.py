@@ -0,0 +1,147 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import urllib.request
+from types import SimpleNamespace
+from typing import cast
+from unittest.mock import MagicMock
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.adk.tools import BaseTool, ToolContext
+from google.genai import types as genai_types
+
+from app.utils.metrics import PipelineMetrics, serve_metrics
+
+
+def make_metrics() -> PipelineMetrics:
+    return PipelineMetrics(meter=MagicMock())
+
+
+def make_context(agent_name: str, branch: str | None = None) -> CallbackContext:
+    return cast(
+        CallbackContext,
+        SimpleNamespace(
+            invocation_id="inv-1",
+            agent_name=agent_name,
+            _invocation_context=SimpleNamespace(branch=branch),
+        ),
+    )
+
+
+def make_response(prompt_tokens: int = 120, output_tokens: int = 30) -> LlmResponse:
+    return LlmResponse(
+        content=genai_types.Content(
+            role="model", parts=[genai_types.Part(text="done")]
+        ),
+        usage_metadata=genai_types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens, candidates_token_count=output_tokens
+        ),
+    )
+
+
+def test_callbacks_produce_stage_breakdown() -> None:
+    """Tests model, tool and agent callbacks feed the per-stage breakdown."""
+    metrics = make_metrics()
+    context = make_context("ImageGenerationAgent")
+    tool_context = cast(
+        ToolContext,
+        SimpleNamespace(
+            invocation_id="inv-1",
+            agent_name="ImageGenerationAgent",
+            function_call_id="call-1",
+        ),
+    )
+    tool = cast(BaseTool, SimpleNamespace(name="list_baseline_images"))
+    response = make_response()
+
+    async def run() -> None:
+        await metrics.before_agent(callback_context=context)
+        await metrics.before_model(callback_context=context, llm_request=LlmRequest())
+        await metrics.after_model(callback_context=context, llm_response=response)
+        await metrics.before_tool(tool=tool, args={}, tool_context=tool_context)
+        await metrics.after_tool(
+            tool=tool, args={}, tool_context=tool_context, tool_response=["a.png"]
+        )
+        await metrics.after_agent(callback_context=context)
+
+    asyncio.run(run())
+
+    stage = metrics.stage_breakdown()["ImageGenerationAgent"]
+    assert stage["runs"] == 1
+    assert stage["model_calls"] == 1
+    assert stage["tool_calls"] == 1
+    assert stage["tokens_in"] == 120
+    assert stage["tokens_out"] == 30
+    assert stage["wall_s"] >= stage["model_s"] + stage["tool_s"]
+    assert "ImageGenerationAgent" in metrics.format_stage_breakdown()
+
+
+def test_concurrent_concept_copies_are_timed_separately() -> None:
+    """Tests that copies of one agent on different branches do not share a timer."""
+    metrics = make_metrics()
+    first = make_context("ImageGenerationAgent", branch="Layer.ImageGenerationAgent")
+    second = make_context(
+        "ImageGenerationAgent", branch="Layer.ImageGenerationAgent.concept_2"
+    )
+
+    async def run() -> None:
+        await metrics.before_model(callback_context=first, llm_request=LlmRequest())
+        await metrics.before_model(callback_context=second, llm_request=LlmRequest())
+        await metrics.after_model(callback_context=first, llm_response=make_response())
+        await metrics.after_model(callback_context=second, llm_response=make_response())
+
+    asyncio.run(run())
+
+    histogram = metrics.snapshot()["histograms"]["model.duration"]
+    assert histogram[0]["count"] == 2
+    assert metrics._started == {}
+
+
+def test_prometheus_snapshot_format() -> None:
+    """Tests histogram buckets are cumulative and counters carry their labels."""
+    metrics = make_metrics()
+    metrics.observe("tool.duration", 0.02, agent="A", tool="t")
+    metrics.observe("tool.duration", 3.0, agent="A", tool="t")
+    metrics.add("model.calls", agent="A", status="ok")
+
+    text = metrics.render_prometheus()
+
+    assert "# TYPE marketingflow_tool_duration_seconds histogram" in text
+    assert (
+        'marketingflow_tool_duration_seconds_bucket{agent="A",tool="t",le="0.025"} 1'
+        in text
+    )
+    assert (
+        'marketingflow_tool_duration_seconds_bucket{agent="A",tool="t",le="+Inf"} 2'
+        in text
+    )
+    assert 'marketingflow_tool_duration_seconds_count{agent="A",tool="t"} 2' in text
+    assert 'marketingflow_model_calls_total{agent="A",status="ok"} 1' in text
+
+
+def test_run_in_thread_records_queue_time_and_serves_metrics() -> None:
+    """Tests thread queue time is recorded and the snapshot can be scraped."""
+    metrics = make_metrics()
+
+    assert asyncio.run(metrics.run_in_thread("generate", lambda: 42)) == 42
+
+    server = serve_metrics(metrics, port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        body = urllib.request.urlopen(url, timeout=5).read().decode()
+    finally:
+        server.shutdown()
+    assert 'marketingflow_tool_queue_time_seconds_count{tool="generate"} 1' in body
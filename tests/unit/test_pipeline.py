@@ -0,0 +1,129 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+from typing import cast
+
+from google.adk.agents import LlmAgent, ParallelAgent
+from google.adk.agents.readonly_context import ReadonlyContext
+
+from app.utils.callbacks import add_callback
+from app.utils.concepts import ConceptStreamParser
+from app.utils.pipeline import VisualMarketingPipeline, clone_root_agent, concept_agent
+from app.utils.projection import ProjectedInstruction, first_concepts
+
+
+def test_parser_emits_concept_when_next_bullet_starts() -> None:
+    """Tests that a concept is released as soon as the following bullet begins."""
+    parser = ConceptStreamParser()
+
+    assert parser.feed("Here are some ideas:\n* **Beach:** A couple") == []
+    assert parser.feed(" at sunset.\n") == []
+    assert parser.feed("  Relaxed vibe.\n- Park") == [
+        "**Beach:** A couple at sunset. Relaxed vibe."
+    ]
+    assert parser.feed(" picnic\n1. City break") == ["Park picnic"]
+    assert parser.close() == ["City break"]
+
+
+def test_parser_treats_text_without_bullets_as_one_concept() -> None:
+    """Tests the fallback for ideation output that is not a bulleted list."""
+    parser = ConceptStreamParser()
+
+    assert parser.feed("A couple on a beach,\nat sunset") == []
+    assert parser.close() == ["A couple on a beach, at sunset"]
+
+
+def build_root() -> VisualMarketingPipeline:
+    ideation = LlmAgent(
+        name="VisualIdeationAgent",
+        model="gemini-2.5-flash",
+        instruction="Brainstorm concepts.",
+        output_key="visual_concepts",
+    )
+    image = LlmAgent(
+        name="ImageGenerationAgent",
+        model="gemini-2.5-flash",
+        instruction="Generate an image for {visual_concepts}.",
+    )
+    return VisualMarketingPipeline(
+        name="VisualMarketingAgent",
+        sub_agents=[
+            ideation,
+            ParallelAgent(name="VisualGenerationLayer", sub_agents=[image]),
+        ],
+    )
+
+
+def test_clone_root_agent_shares_definition_and_isolates_agent_state() -> None:
+    """Tests that clones share the definition but not flags, lists, callbacks or parents."""
+    root = build_root()
+    add_callback(root, "before_agent_callback", lambda **kwargs: None)
+    first, second = clone_root_agent(root), clone_root_agent(root)
+
+    first.pipelined = True
+    first.max_concepts = 3
+    first.sub_agents.append(LlmAgent(name="ExtraAgent", model="gemini-2.5-flash"))
+    add_callback(first, "before_agent_callback", lambda **kwargs: None)
+
+    for other in (root, second):
+        assert other.pipelined is False
+        assert other.max_concepts == 1
+        assert len(other.sub_agents) == 2
+        assert isinstance(other.before_agent_callback, list)
+        assert len(other.before_agent_callback) == 1
+    layer = second.sub_agents[1]
+    image = cast(LlmAgent, layer.sub_agents[0])
+    original_image = cast(LlmAgent, root.sub_agents[1].sub_agents[0])
+    assert layer is not root.sub_agents[1]
+    assert image is not original_image
+    assert image.parent_agent is layer
+    assert layer.parent_agent is second
+    assert second.sub_agents[0].root_agent is second
+    assert image.instruction is original_image.instruction
+
+    add_callback(image, "before_agent_callback", lambda **kwargs: None)
+    assert original_image.before_agent_callback is None
+
+
+def test_concept_agent_injects_state_and_shows_concept_verbatim() -> None:
+    """Tests that a concept copy renders state itself and keeps braces in the concept."""
+    image = LlmAgent(
+        name="ImageGenerationAgent",
+        model="gemini-2.5-flash",
+        instruction="Use {baseline_image} for {visual_concepts}.",
+        output_key="generated_image_path",
+    )
+    context = cast(
+        ReadonlyContext,
+        SimpleNamespace(
+            state={"baseline_image": "cat.png", "visual_concepts": "- every concept"},
+            agent_name="ImageGenerationAgent",
+        ),
+    )
+    concept = "A {name} sign, {{literally}}"
+
+    first = concept_agent(image, concept, 0, "visual_concepts")
+    second = concept_agent(image, concept, 1, "visual_concepts")
+    image.instruction = ProjectedInstruction(
+        "Use {baseline_image} for {visual_concepts}.",
+        {"visual_concepts": first_concepts(1, 10)},
+    )
+    projected = concept_agent(image, concept, 0, "visual_concepts")
+
+    for copy in (first, second, projected):
+        assert callable(copy.instruction)
+        assert copy.instruction(context) == f"Use cat.png for {concept}."
+    assert first.output_key == "generated_image_path"
+    assert second.output_key == "generated_image_path_2"
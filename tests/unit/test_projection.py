@@ -0,0 +1,103 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+from typing import cast
+
+import pytest
+from google.adk.agents.readonly_context import ReadonlyContext
+
+from app.utils.metrics import PipelineMetrics
+from app.utils.projection import (
+    ProjectedInstruction,
+    asset_path,
+    estimate_tokens,
+    first_concepts,
+    first_items,
+    render,
+)
+
+CONCEPTS = (
+    """Here are five concepts:
+* **Beach:** A couple at sunset on a quiet beach, wearing matching cat print t-shirts, """
+    + "relaxed " * 40
+    + """
+* **Park:** A picnic in a sunny park.
+* **City:** A weekend city break.
+* **Cabin:** A cosy cabin in the woods.
+* **Festival:** A summer music festival.
+"""
+)
+
+
+def test_render_projects_state_like_adk_injection() -> None:
+    """Tests projected, full, optional and missing placeholders."""
+    state = {
+        "visual_concepts": CONCEPTS,
+        "generated_image_path": "The image is ready at generated_images/ab12.png. Enjoy!",
+        "baseline_images": [f"images_baseline/cat_{i}.png" for i in range(8)],
+    }
+    projections = {
+        "visual_concepts": first_concepts(2, 20),
+        "generated_image_path": asset_path(),
+        "baseline_images": first_items(2),
+    }
+    template = "Concepts:\n{visual_concepts}\nImage: `{generated_image_path}` from {baseline_images}.{variants_summary?} {not a key}"
+
+    rendered = render(template, state, projections)
+
+    assert "**Park:** A picnic in a sunny park." in rendered
+    assert "City" not in rendered
+    assert rendered.count("relaxed") < 40
+    assert "Image: `generated_images/ab12.png`" in rendered
+    assert "images_baseline/cat_0.png, images_baseline/cat_1.png, (6 more)." in rendered
+    assert rendered.endswith(". {not a key}")
+    with pytest.raises(KeyError):
+        render("{generated_video_path}", state, projections)
+
+
+def test_projected_instruction_reports_tokens_saved() -> None:
+    """Tests that each render records the tokens saved against the full instruction."""
+    metrics = PipelineMetrics()
+    instruction = ProjectedInstruction(
+        "Review the visual concepts in `{visual_concepts}`.",
+        {"visual_concepts": first_concepts(1, 10)},
+        metrics=metrics,
+    )
+    context = cast(
+        ReadonlyContext,
+        SimpleNamespace(
+            state={"visual_concepts": CONCEPTS}, agent_name="ImageGenerationAgent"
+        ),
+    )
+
+    projected = instruction(context)
+    pipelined = instruction.with_template("Work on this concept: {visual_concepts}")(
+        context
+    )
+
+    state = context.state
+    saved = sum(
+        estimate_tokens(render(template, state, {})) - estimate_tokens(text)
+        for template, text in [
+            ("Review the visual concepts in `{visual_concepts}`.", projected),
+            ("Work on this concept: {visual_concepts}", pipelined),
+        ]
+    )
+    assert projected.startswith("Review the visual concepts in `- **Beach:**")
+    assert pipelined.startswith("Work on this concept: - **Beach:**")
+    assert (
+        metrics.stage_breakdown()["ImageGenerationAgent"]["tokens_saved"] == saved > 100
+    )
+    assert "tok saved" in metrics.format_stage_breakdown()
@@ -0,0 +1,103 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import cast
+
+import pytest
+
+from app.utils.metrics import PipelineMetrics
+from app.utils.ratelimit import RateLimiter, parse_limits, retry_after
+
+
+class RateLimited(Exception):
+    code = 429
+
+    def __init__(self, retry_after_s: str | None = None) -> None:
+        super().__init__("429 Too Many Requests")
+        headers = {"Retry-After": retry_after_s} if retry_after_s else {}
+        self.response = SimpleNamespace(headers=headers)
+
+
+def test_bucket_spaces_calls_beyond_the_burst() -> None:
+    """Tests that concurrent callers share one bucket and queue for admission."""
+    metrics = PipelineMetrics()
+    limiter = RateLimiter(parse_limits("model=600:2"), metrics=metrics)  # 10/s, burst 2
+    depths: list[int] = []
+
+    async def run() -> float:
+        async def one() -> None:
+            await limiter.acquire("model")
+            depths.append(limiter.stats()["model"]["queue_depth"])
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(5)))
+        return time.perf_counter() - start
+
+    elapsed = asyncio.run(run())
+
+    assert 0.25 < elapsed < 0.6
+    assert max(depths) >= 1
+    stats = limiter.stats()["model"]
+    assert stats["queue_depth"] == 0
+    assert stats["wait_s"] > 0.5
+    snapshot = metrics.snapshot()
+    assert snapshot["histograms"]["ratelimit.wait_time"][0]["count"] == 5
+
+
+def test_429_honours_retry_after_and_blocks_other_callers() -> None:
+    """Tests that a 429 backs off for retry-after and slows admission for everyone."""
+    limiter = RateLimiter(parse_limits("model=6000"), base_delay_s=0.001)
+    attempts: list[float] = []
+
+    def flaky() -> str:
+        attempts.append(time.perf_counter())
+        if len(attempts) == 1:
+            raise RateLimited("0.2")
+        return "ok"
+
+    assert limiter.call_sync("model", flaky) == "ok"
+    assert attempts[1] - attempts[0] >= 0.2
+    assert limiter.stats()["model"]["throttled"] == 1
+    rate = limiter.bucket("model").current_rate
+    assert rate is not None and rate < 100
+
+    limiter.bucket("model").throttled(0.1)
+    start = time.perf_counter()
+    limiter.acquire_sync("model")
+    assert time.perf_counter() - start >= 0.1
+
+
+def test_retries_stop_after_max_attempts() -> None:
+    """Tests that rate limit errors surface once the attempts are used up."""
+    limiter = RateLimiter(max_attempts=3, base_delay_s=0.001)
+    calls: list[int] = []
+
+    async def always_limited() -> None:
+        calls.append(1)
+        raise RateLimited()
+
+    with pytest.raises(RateLimited):
+        asyncio.run(limiter.call("model", always_limited))
+    assert len(calls) == 3
+
+
+def test_retry_after_sources() -> None:
+    """Tests the retry-after header, attribute and retryDelay detail forms."""
+    assert retry_after(RateLimited("7")) == 7
+    assert retry_after(cast(BaseException, SimpleNamespace(retry_after=3))) == 3
+    assert retry_after(Exception('{"@type": "RetryInfo", "retryDelay": "12s"}')) == 12
+    assert retry_after(Exception("boom")) is None
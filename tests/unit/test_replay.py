@@ -0,0 +1,164 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+from collections.abc import AsyncGenerator
+from pathlib import Path
+
+import pytest
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types as genai_types
+
+from app.utils.replay import CassetteLlm, request_fingerprint, request_step
+
+
+class CountingLlm(BaseLlm):
+    """Stands in for a live model and counts how often it is called."""
+
+    calls: int = 0
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        self.calls += 1
+        yield LlmResponse(
+            content=genai_types.Content(
+                role="model",
+                parts=[
+                    genai_types.Part.from_function_call(
+                        name="list_baseline_images", args={}
+                    )
+                ],
+            )
+        )
+
+
+def make_request(
+    *tool_results: str, text: str = "Summer tees", result: str = "x"
+) -> LlmRequest:
+    contents = [genai_types.Content(role="user", parts=[genai_types.Part(text=text)])]
+    for name in tool_results:
+        contents.append(
+            genai_types.Content(
+                role="model",
+                parts=[genai_types.Part.from_function_call(name=name, args={})],
+            )
+        )
+        contents.append(
+            genai_types.Content(
+                role="user",
+                parts=[
+                    genai_types.Part.from_function_response(
+                        name=name, response={"result": result}
+                    )
+                ],
+            )
+        )
+    return LlmRequest(
+        model="gemini-2.5-flash",
+        contents=contents,
+        config=genai_types.GenerateContentConfig(
+            system_instruction="Generate an image."
+        ),
+    )
+
+
+async def collect(llm: BaseLlm, request: LlmRequest) -> list[LlmResponse]:
+    return [r async for r in llm.generate_content_async(request)]
+
+
+def test_request_step_counts_tool_results_in_current_turn() -> None:
+    """Tests that the step is the position in the agent's tool loop."""
+    assert request_step(make_request()) == 0
+    assert request_step(make_request("list_baseline_images")) == 1
+    assert request_step(make_request("list_baseline_images", "generate")) == 2
+
+
+def test_fingerprint_ignores_tool_result_payloads() -> None:
+    """Tests that volatile tool results do not change the fingerprint."""
+    first = make_request("list_baseline_images")
+    second = make_request("list_baseline_images", result="other")
+
+    assert request_fingerprint(first) == request_fingerprint(second)
+    assert request_fingerprint(first) != request_fingerprint(make_request())
+
+
+def test_fingerprint_ignores_order_and_payloads_of_relayed_events() -> None:
+    """Tests that events relayed from parallel agents key the same in any order."""
+
+    def relayed(*texts: str) -> LlmRequest:
+        request = make_request()
+        request.contents += [
+            genai_types.Content(
+                role="user",
+                parts=[
+                    genai_types.Part(text="For context:"),
+                    genai_types.Part(text=text),
+                ],
+            )
+            for text in texts
+        ]
+        return request
+
+    image = "[ImageGenerationAgent] said: generated_images/a.png"
+    video = (
+        "[VideoGenerationAgent] `generate_video` tool returned result: {'cached': %s}"
+    )
+
+    assert request_fingerprint(relayed(image, video % "False")) == request_fingerprint(
+        relayed(video % "True", image)
+    )
+    assert request_fingerprint(relayed(image)) != request_fingerprint(
+        relayed("[ImageGenerationAgent] said: generated_images/b.png")
+    )
+
+
+def test_record_then_replay_without_inner_model(tmp_path: Path) -> None:
+    """Tests that recorded responses are replayed with synthetic latency."""
+    path = str(tmp_path / "ImageGenerationAgent.json")
+    live = CountingLlm(model="gemini-2.5-flash")
+    recorder = CassetteLlm(
+        model="gemini-2.5-flash", cassette_path=path, mode="record", inner=live
+    )
+    player = CassetteLlm(model="gemini-2.5-flash", cassette_path=path, latency=0.05)
+
+    recorded = asyncio.run(collect(recorder, make_request()))
+    start = time.perf_counter()
+    replayed = asyncio.run(collect(player, make_request()))
+
+    assert time.perf_counter() - start >= 0.05
+    assert live.calls == 1
+    content = replayed[0].content
+    assert content and content.parts and content.parts[0].function_call
+    assert content.parts[0].function_call.name == "list_baseline_images"
+    assert len(replayed) == len(recorded)
+
+
+def test_replay_falls_back_to_step_unless_strict(tmp_path: Path) -> None:
+    """Tests matching by tool-loop step when the exact request was never recorded."""
+    path = str(tmp_path / "ImageGenerationAgent.json")
+    live = CountingLlm(model="gemini-2.5-flash")
+    recorder = CassetteLlm(
+        model="gemini-2.5-flash", cassette_path=path, mode="record", inner=live
+    )
+    other_request = make_request(text="Winter hoodies")
+
+    asyncio.run(collect(recorder, make_request()))
+    loose = CassetteLlm(model="gemini-2.5-flash", cassette_path=path)
+    strict = CassetteLlm(model="gemini-2.5-flash", cassette_path=path, strict=True)
+
+    assert len(asyncio.run(collect(loose, other_request))) == 1
+    with pytest.raises(LookupError):
+        asyncio.run(collect(strict, other_request))
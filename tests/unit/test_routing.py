@@ -0,0 +1,210 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+from collections.abc import AsyncGenerator
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types as genai_types
+from pydantic import Field
+
+from app.utils import routing
+from app.utils.metrics import PipelineMetrics
+from app.utils.models import resolve_model
+from app.utils.ratelimit import RateLimiter
+from app.utils.replay import CassetteLlm
+from app.utils.routing import HedgeBudget, ModelHealthTracker, RouterLlm, parse_routes
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+class StubLlm(BaseLlm):
+    """A model with an injectable latency that can be made to return 429s."""
+
+    latency: float = 0.0
+    latencies: list[float] = Field(default_factory=list)
+    rate_limited: bool = False
+    calls: int = 0
+    cancelled: int = 0
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        self.calls += 1
+        try:
+            await asyncio.sleep(
+                self.latencies.pop(0) if self.latencies else self.latency
+            )
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.rate_limited:
+            raise RateLimited("429 RESOURCE_EXHAUSTED")
+        yield LlmResponse(
+            content=genai_types.Content(
+                role="model", parts=[genai_types.Part(text=self.model)]
+            )
+        )
+
+
+def call(router: RouterLlm) -> tuple[str, LlmRequest]:
+    request = LlmRequest(model=router.model, contents=[])
+
+    async def collect() -> list[LlmResponse]:
+        return [r async for r in router.generate_content_async(request)]
+
+    (response,) = asyncio.run(collect())
+    assert response.content and response.content.parts
+    return response.content.parts[0].text or "", request
+
+
+def test_rate_limited_primary_fails_over_and_is_skipped(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests 429 failover within a request, the cooldown, and the trace attributes."""
+    span = MagicMock()
+    monkeypatch.setattr(routing.trace, "get_current_span", lambda: span)
+    primary = StubLlm(model="flash-lite", rate_limited=True)
+    fallback = StubLlm(model="flash")
+    router = RouterLlm(
+        model="flash-lite",
+        candidates=[primary, fallback],
+        health=ModelHealthTracker(),
+        limiter=RateLimiter(base_delay_s=0),
+    )
+
+    text, request = call(router)
+    assert text == "flash"
+    assert request.model == "flash"
+    span.add_event.assert_called_once()
+    assert (
+        span.set_attributes.call_args.args[0]["routing.reason"]
+        == "failover:rate_limited"
+    )
+
+    primary.rate_limited = False
+    assert call(router)[0] == "flash"
+    assert primary.calls == 1
+    assert router.breach("flash-lite") == "rate_limited"
+
+
+def test_latency_slo_breach_routes_to_alternate(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that a model whose rolling p95 exceeds the SLO is routed around."""
+    span = MagicMock()
+    monkeypatch.setattr(routing.trace, "get_current_span", lambda: span)
+    health = ModelHealthTracker()
+    router = RouterLlm(
+        model="slow",
+        candidates=[StubLlm(model="slow", latency=0.03), StubLlm(model="fast")],
+        latency_slo_s=0.02,
+        min_samples=3,
+        health=health,
+        limiter=RateLimiter(),
+    )
+
+    assert [call(router)[0] for _ in range(4)] == ["slow", "slow", "slow", "fast"]
+    assert (
+        span.set_attributes.call_args.args[0]["routing.reason"]
+        == "failover:latency_slo"
+    )
+    stats = health.snapshot()["slow"]
+    assert stats["calls"] == 3
+    assert stats["p95_s"] >= stats["p50_s"] >= 0.03
+    assert stats["error_rate"] == 0
+
+
+def test_routes_resolve_to_router_of_replayed_models(tmp_path: Path) -> None:
+    """Tests route parsing and that every candidate is resolved under the backend."""
+    routes = parse_routes("VisualIdeationAgent=lite|flash, TwitterPublisherAgent=flash")
+    assert routes == {
+        "VisualIdeationAgent": ["lite", "flash"],
+        "TwitterPublisherAgent": ["flash"],
+    }
+
+    router = resolve_model(
+        "VisualIdeationAgent", routes["VisualIdeationAgent"], "replay", str(tmp_path)
+    )
+    assert isinstance(router, RouterLlm)
+    assert [c.model for c in router.candidates] == ["lite", "flash"]
+    assert all(isinstance(c, CassetteLlm) for c in router.candidates)
+    single = resolve_model(
+        "TwitterPublisherAgent", routes["TwitterPublisherAgent"], "live"
+    )
+    assert [c.model for c in single.candidates] == ["flash"]
+    assert single.agent_name == "TwitterPublisherAgent"
+
+
+def test_hedge_wins_over_slow_request_and_cancels_it(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that a slow first response is hedged, the hedge is used, and the original is cancelled."""
+    span = MagicMock()
+    monkeypatch.setattr(routing.trace, "get_current_span", lambda: span)
+    metrics = PipelineMetrics()
+    budget = HedgeBudget(ratio=1.0, burst=1.0, metrics=metrics)
+    model = StubLlm(model="lite", latencies=[0.5, 0.01])
+    router = RouterLlm(
+        model="lite",
+        candidates=[model],
+        hedge=True,
+        hedge_delay_s=0.05,
+        agent_name="TwitterPublisherAgent",
+        health=ModelHealthTracker(),
+        limiter=RateLimiter(),
+        hedge_budget=budget,
+    )
+
+    start = time.perf_counter()
+    assert call(router)[0] == "lite"
+    assert time.perf_counter() - start < 0.3
+    assert model.calls == 2
+    assert model.cancelled == 1
+    assert span.set_attributes.call_args.args[0]["routing.hedge_outcome"] == "won"
+    assert budget.stats()["hedge_rate"] == 1.0
+    assert budget.stats()["win_rate"] == 1.0
+    (counter,) = metrics.snapshot()["counters"]["model.hedges"]
+    assert counter["labels"] == {"agent": "TwitterPublisherAgent", "outcome": "won"}
+
+
+def test_hedge_budget_and_percentile_delay() -> None:
+    """Tests that hedges stop when the budget is spent and that the delay follows the percentile."""
+    budget = HedgeBudget(ratio=0.0, burst=0.0)
+    health = ModelHealthTracker()
+    model = StubLlm(model="lite", latency=0.01)
+    router = RouterLlm(
+        model="lite",
+        candidates=[model],
+        hedge=True,
+        hedge_delay_s=0.001,
+        hedge_percentile=50,
+        min_samples=3,
+        health=health,
+        limiter=RateLimiter(),
+        hedge_budget=budget,
+    )
+
+    for _ in range(3):
+        call(router)
+    assert model.calls == 3
+    assert budget.stats()["denied"] == 3
+    assert budget.stats()["hedge_rate"] == 0.0
+    assert 0.01 <= router.hedge_after("lite") < 0.05
@@ -0,0 +1,154 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from collections.abc import AsyncIterator, Iterator
+from types import SimpleNamespace
+from typing import Any, cast
+
+import pytest
+from google.adk.agents import LlmAgent
+from google.adk.runners import Runner
+from google.cloud.aiplatform import initializer
+from vertexai.preview.reasoning_engines import AdkApp
+
+from app.agent_engine_app import AgentEngineApp
+from app.utils.batch import CampaignIntent
+from app.utils.serving import CampaignWorker, WorkerDraining
+
+
+class FakeSessionService:
+    def __init__(self) -> None:
+        self.created = 0
+
+    async def create_session(
+        self, app_name: str, user_id: str, session_id: str | None = None
+    ) -> SimpleNamespace:
+        self.created += 1
+        return SimpleNamespace(id=f"session-{self.created}")
+
+
+class FakeRunner:
+    """Answers each campaign with a tweet after a simulated model delay."""
+
+    def __init__(self, delay: float = 0.05) -> None:
+        self.app_name = "app"
+        self.session_service = FakeSessionService()
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def run_async(
+        self, user_id: str, session_id: str, new_message: Any
+    ) -> AsyncIterator[SimpleNamespace]:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(
+                author="TwitterPublisherAgent",
+                actions=SimpleNamespace(
+                    state_delta={"twitter_post": f"Post for {session_id}"}
+                ),
+            )
+        finally:
+            self.in_flight -= 1
+
+
+def intents(count: int) -> list[CampaignIntent]:
+    return [CampaignIntent(id=str(i), intent=f"Campaign {i}") for i in range(count)]
+
+
+def test_worker_bounds_concurrent_sessions() -> None:
+    """Tests that campaigns share one runner with at most max_sessions in flight."""
+    runner = FakeRunner()
+    waiting: list[int] = []
+
+    async def run() -> tuple[CampaignWorker, list[dict[str, Any]]]:
+        worker = CampaignWorker(cast(Runner, runner), max_sessions=3)
+
+        tasks = [asyncio.create_task(worker.run(i)) for i in intents(10)]
+        await asyncio.sleep(0.01)
+        waiting.append(worker.waiting)
+        records = await asyncio.gather(*tasks)
+        return worker, records
+
+    worker, records = asyncio.run(run())
+
+    assert [r["status"] for r in records] == ["ok"] * 10
+    assert runner.max_in_flight == 3
+    assert waiting == [7]
+    assert worker.stats == {"ok": 10, "error": 0, "rejected": 0}
+    assert worker.in_flight == 0
+
+
+def test_drain_finishes_admitted_campaigns_and_rejects_new_ones() -> None:
+    """Tests graceful drain: admitted campaigns complete, later ones are rejected."""
+    runner = FakeRunner(delay=0.1)
+
+    async def run() -> tuple[CampaignWorker, bool, bool, list[dict[str, Any]]]:
+        worker = CampaignWorker(cast(Runner, runner), max_sessions=2)
+        admitted = [asyncio.create_task(worker.run(i)) for i in intents(4)]
+        await asyncio.sleep(0.01)
+        timed_out = await worker.drain(timeout=0.01)
+        with pytest.raises(WorkerDraining):
+            await worker.run(CampaignIntent(id="late", intent="Too late"))
+        drained = await worker.drain()
+        return worker, timed_out, drained, [task.result() for task in admitted]
+
+    worker, timed_out, drained, records = asyncio.run(run())
+
+    assert timed_out is False
+    assert drained is True
+    assert [r["status"] for r in records] == ["ok"] * 4
+    assert worker.stats["rejected"] == 1
+
+
+def test_agent_engine_app_releases_session_slots_of_abandoned_streams(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that both stream paths hold a slot and release it when closed early."""
+    monkeypatch.setenv("SESSION_CONCURRENCY", "1")
+    monkeypatch.setattr(
+        type(initializer.global_config), "project", property(lambda self: "project")
+    )
+
+    def stream_query(self: AdkApp, **kwargs: Any) -> Iterator[dict[str, Any]]:
+        yield from ({"n": n} for n in range(3))
+
+    async def async_stream_query(
+        self: AdkApp, **kwargs: Any
+    ) -> AsyncIterator[dict[str, Any]]:
+        for n in range(3):
+            yield {"n": n}
+
+    monkeypatch.setattr(AdkApp, "stream_query", stream_query)
+    monkeypatch.setattr(AdkApp, "async_stream_query", async_stream_query)
+    app = AgentEngineApp(agent=LlmAgent(name="Agent", model="gemini-2.5-flash"))
+
+    stream = app.stream_query(message="hi", user_id="u")
+    next(stream)
+    assert not app._session_slots.acquire(blocking=False)
+    stream.close()
+    assert app._session_slots.acquire(blocking=False)
+    app._session_slots.release()
+
+    async def run() -> list[bool]:
+        stream = app.async_stream_query(message="hi", user_id="u")
+        await anext(stream)
+        held = app._async_session_slots.locked()
+        await stream.aclose()
+        return [held, app._async_session_slots.locked()]
+
+    assert asyncio.run(run()) == [True, False]
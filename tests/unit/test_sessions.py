@@ -0,0 +1,159 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any
+
+from google.adk.events import Event, EventActions
+from google.adk.sessions import Session
+from google.adk.sessions.base_session_service import ListSessionsResponse
+
+from app.utils.sessions import BoundedSessionService
+
+
+def event(invocation_id: str, **state_delta: Any) -> Event:
+    return Event(
+        invocation_id=invocation_id,
+        author="VisualIdeationAgent",
+        actions=EventActions(state_delta=state_delta),
+    )
+
+
+async def run_campaign(service: BoundedSessionService, events: int = 4) -> str:
+    session = await service.create_session(app_name="app", user_id="batch_user")
+    for i in range(events):
+        await service.append_event(session, event("inv", step=i))
+    return session.id
+
+
+def test_memory_stays_bounded_across_many_sessions() -> None:
+    """Tests LRU eviction of sessions and TTL eviction of idle ones."""
+    service = BoundedSessionService(max_sessions=50, ttl_seconds=0.2)
+
+    async def run() -> tuple[Session | None, Session | None]:
+        ids = [await run_campaign(service) for _ in range(2000)]
+        recent = await service.get_session(
+            app_name="app", user_id="batch_user", session_id=ids[-1]
+        )
+        evicted = await service.get_session(
+            app_name="app", user_id="batch_user", session_id=ids[0]
+        )
+        return recent, evicted
+
+    recent, evicted = asyncio.run(run())
+
+    assert recent is not None
+    assert recent.state == {"step": 3}
+    assert evicted is None
+    assert service.memory_stats()["sessions"] == 50
+    assert service.stats["evicted_lru"] == 1950
+
+    time.sleep(0.25)
+    asyncio.run(run_campaign(service))
+    assert service.memory_stats()["sessions"] == 1
+    assert service.stats["evicted_ttl"] == 50
+
+
+def test_compaction_keeps_current_invocation_and_state() -> None:
+    """Tests that only events of earlier invocations are dropped."""
+    service = BoundedSessionService(max_events=5)
+
+    async def run() -> Session | None:
+        session = await service.create_session(
+            app_name="app", user_id="u", session_id="s"
+        )
+        for invocation in ("inv-1", "inv-2", "inv-3"):
+            for i in range(4):
+                await service.append_event(
+                    session, event(invocation, **{invocation: i})
+                )
+        return await service.get_session(app_name="app", user_id="u", session_id="s")
+
+    session = asyncio.run(run())
+
+    assert session is not None
+    assert [e.invocation_id for e in session.events] == ["inv-2"] + ["inv-3"] * 4
+    assert session.state == {"inv-1": 3, "inv-2": 3, "inv-3": 3}
+    assert service.stats["compacted_events"] == 7
+
+
+def test_sqlite_mode_reloads_evicted_sessions_and_survives_restart(
+    tmp_path: Path,
+) -> None:
+    """Tests batched WAL persistence, reload after eviction, and app/user state."""
+    db_path = str(tmp_path / "sessions.sqlite3")
+    service = BoundedSessionService(
+        max_sessions=2, db_path=db_path, flush_interval_s=60
+    )
+
+    async def first_run() -> tuple[list[str], Session | None]:
+        session = await service.create_session(
+            app_name="app", user_id="u", session_id="keep", state={"user:tier": "gold"}
+        )
+        await service.append_event(
+            session, event("inv", concepts="Beach", **{"app:campaigns": 1})
+        )
+        ids = [await run_campaign(service) for _ in range(5)]
+        reloaded = await service.get_session(
+            app_name="app", user_id="u", session_id="keep"
+        )
+        return ids, reloaded
+
+    ids, reloaded = asyncio.run(first_run())
+    assert reloaded is not None
+    assert reloaded.state == {
+        "concepts": "Beach",
+        "app:campaigns": 1,
+        "user:tier": "gold",
+    }
+    assert service.stats["flushes"] == 0
+
+    service.close()
+    assert service.stats["flushes"] == 1
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    restarted = BoundedSessionService(db_path=db_path)
+
+    async def second_run() -> tuple[
+        Session | None, ListSessionsResponse, Session | None
+    ]:
+        keep = await restarted.get_session(
+            app_name="app", user_id="u", session_id="keep"
+        )
+        listed = await restarted.list_sessions(app_name="app", user_id="batch_user")
+        other = await restarted.get_session(
+            app_name="app", user_id="batch_user", session_id=ids[0]
+        )
+        await restarted.delete_session(app_name="app", user_id="u", session_id="keep")
+        return keep, listed, other
+
+    keep, listed, other = asyncio.run(second_run())
+    restarted.close()
+
+    assert keep is not None and other is not None
+    assert keep.state["user:tier"] == "gold"
+    assert len(keep.events) == 1
+    assert {s.id for s in listed.sessions} == set(ids)
+    assert other.state == {"step": 3, "app:campaigns": 1}
+    with sqlite3.connect(db_path) as conn:
+        assert (
+            conn.execute("SELECT COUNT(*) FROM sessions WHERE id = 'keep'").fetchone()[
+                0
+            ]
+            == 0
+        )
@@ -12,29 +12,127 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import os
-from unittest.mock import patch, MagicMock
+import time
+from pathlib import Path
+from typing import Any
+from unittest.mock import MagicMock
 
-from app.agent import list_baseline_images
+import pytest
 
-def test_list_baseline_images_success():
+from app.agent import (
+    generate_image_from_prompt_and_image,
+    generate_video_from_prompt_and_image,
+    list_baseline_images,
+)
+from app.utils.assets import AssetStore
+
+
+@pytest.fixture
+def baseline_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Runs the test from an empty working directory with an images_baseline folder."""
+    monkeypatch.chdir(tmp_path)
+    image_dir = tmp_path / "images_baseline"
+    image_dir.mkdir()
+    return image_dir
+
+
+def test_list_baseline_images_success(baseline_dir: Path) -> None:
     """Tests that the tool correctly lists PNG files from the directory."""
-    mock_listdir = ["image1.png", "image2.jpg", "image3.png", "document.txt"]
-    expected_files = [os.path.join("images_baseline", "image1.png"), os.path.join("images_baseline", "image3.png")]
+    for name in ["image1.png", "image2.jpg", "image3.png", "document.txt"]:
+        (baseline_dir / name).write_bytes(b"fake image data")
+    expected_files = [
+        os.path.join("images_baseline", "image1.png"),
+        os.path.join("images_baseline", "image3.png"),
+    ]
+
+    # The tool_context argument is not used in the current implementation, so we can pass a mock.
+    result = list_baseline_images(tool_context=MagicMock())
+    assert result == expected_files
 
-    with patch("os.listdir", return_value=mock_listdir):
-        # The tool_context argument is not used in the current implementation, so we can pass a mock.
-        result = list_baseline_images(tool_context=MagicMock())
-        assert result == expected_files
 
-def test_list_baseline_images_file_not_found():
-    """Tests that the tool handles a FileNotFoundError gracefully."""
-    with patch("os.listdir", side_effect=FileNotFoundError):
-        result = list_baseline_images(tool_context=MagicMock())
-        assert result == ["Error: 'images_baseline' directory not found."]
+def test_list_baseline_images_file_not_found(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that the tool handles a missing directory gracefully."""
+    monkeypatch.chdir(tmp_path)
+    result = list_baseline_images(tool_context=MagicMock())
+    assert result == ["Error: 'images_baseline' directory not found."]
 
-def test_list_baseline_images_empty_directory():
+
+def test_list_baseline_images_empty_directory(baseline_dir: Path) -> None:
     """Tests that the tool returns an empty list for an empty directory."""
-    with patch("os.listdir", return_value=[]):
-        result = list_baseline_images(tool_context=MagicMock())
-        assert result == []
+    result = list_baseline_images(tool_context=MagicMock())
+    assert result == []
+
+
+def test_generate_image_reuses_asset_for_identical_request(baseline_dir: Path) -> None:
+    """Tests that an identical (prompt, baseline) request returns the stored asset."""
+    (baseline_dir / "image1.png").write_bytes(b"fake image data")
+    baseline = os.path.join("images_baseline", "image1.png")
+
+    first = asyncio.run(
+        generate_image_from_prompt_and_image(
+            "A picnic", baseline, tool_context=MagicMock()
+        )
+    )
+    second = asyncio.run(
+        generate_image_from_prompt_and_image(
+            "A picnic", baseline, tool_context=MagicMock()
+        )
+    )
+    other = asyncio.run(
+        generate_image_from_prompt_and_image(
+            "A beach", baseline, tool_context=MagicMock()
+        )
+    )
+
+    assert (first.cached, second.cached, other.cached) == (False, True, False)
+    assert first.generated_image_path == second.generated_image_path
+    assert first.generated_image_path != other.generated_image_path
+    assert os.path.exists(first.generated_image_path)
+
+
+def test_generation_branches_run_concurrently(
+    baseline_dir: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Tests that slow asset writes in the image and video tools overlap without blocking the event loop."""
+    (baseline_dir / "image1.png").write_bytes(b"fake image data")
+    baseline = os.path.join("images_baseline", "image1.png")
+    original_put = AssetStore.put
+
+    def slow_put(self: AssetStore, key: str, extension: str, data: bytes) -> str:
+        time.sleep(0.3)  # Stands in for a multi-MB write or a blocking API call.
+        return original_put(self, key, extension, data)
+
+    monkeypatch.setattr(AssetStore, "put", slow_put)
+
+    async def run_branches() -> tuple[Any, Any, float, int]:
+        ticks = 0
+
+        async def ticker() -> None:
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        start = time.perf_counter()
+        image, video = await asyncio.gather(
+            generate_image_from_prompt_and_image(
+                "A picnic", baseline, tool_context=MagicMock()
+            ),
+            generate_video_from_prompt_and_image(
+                "A picnic", baseline, tool_context=MagicMock()
+            ),
+        )
+        elapsed = time.perf_counter() - start
+        ticking.cancel()
+        return image, video, elapsed, ticks
+
+    image, video, elapsed, ticks = asyncio.run(run_branches())
+
+    assert image.status == video.status == "success"
+    assert elapsed < 0.55, "image and video generation were serialized"
+    assert ticks >= 10, "the event loop was blocked during generation"
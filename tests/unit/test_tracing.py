@@ -0,0 +1,276 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+import json
+import threading
+import time
+from typing import Any, cast
+from unittest.mock import MagicMock
+
+import pytest
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import Event, ReadableSpan
+from opentelemetry.trace import Link, SpanContext, TraceFlags
+
+from app.utils.gcs import GcsPayloadStore
+from app.utils.span_offload import span_to_dict
+from app.utils.tracing import CloudTraceLoggingSpanExporter
+
+
+class FakePayloadStore:
+    def __init__(self, delay: float = 0.0, available: bool = True) -> None:
+        self.delay = delay
+        self.is_available = available
+        self.uploads: dict[str, tuple[bytes, str | None]] = {}
+
+    def available(self) -> bool:
+        return self.is_available
+
+    def upload(
+        self,
+        name: str,
+        data: bytes,
+        content_type: str = "application/json",
+        content_encoding: str | None = None,
+    ) -> None:
+        time.sleep(self.delay)
+        self.uploads[name] = (data, content_encoding)
+
+    def uri(self, name: str) -> str:
+        return f"memory://{name}"
+
+    def url(self, name: str) -> str:
+        return f"memory://{name}"
+
+
+def make_spans(count: int, attributes: dict | None = None) -> list[ReadableSpan]:
+    return [
+        ReadableSpan(
+            name=f"span {i}",
+            context=SpanContext(
+                trace_id=0x1234,
+                span_id=0x100 + i,
+                is_remote=False,
+                trace_flags=TraceFlags(TraceFlags.SAMPLED),
+            ),
+            attributes=attributes or {"gen_ai.request.model": "gemini-2.5-flash"},
+            resource=Resource.create({}),
+            start_time=1_000,
+            end_time=2_000,
+        )
+        for i in range(count)
+    ]
+
+
+def make_exporter(**kwargs: Any) -> CloudTraceLoggingSpanExporter:
+    return CloudTraceLoggingSpanExporter(
+        project_id="test-project",
+        client=MagicMock(),
+        logging_client=MagicMock(),
+        storage_client=MagicMock(),
+        **kwargs,
+    )
+
+
+def test_export_writes_all_spans_in_one_batch() -> None:
+    """Tests that one export call produces a single log write."""
+    exporter = make_exporter()
+
+    exporter.export(make_spans(5))
+
+    batch = exporter.logger.batch.return_value
+    assert exporter.logger.batch.call_count == 1
+    assert batch.log_struct.call_count == 5
+    assert batch.commit.call_count == 1
+    exporter.logger.log_struct.assert_not_called()
+    stats = exporter.stats()
+    assert stats["exports"] == 1
+    assert stats["exported_spans"] == 5
+    assert stats["log_writes"] == 1
+    assert stats["export_seconds_last"] > 0
+
+
+def test_export_splits_log_writes_and_survives_failed_writes() -> None:
+    """Tests that writes are bounded by count and bytes, and that a failed write
+    neither stops the other writes nor the Cloud Trace export."""
+    exporter = make_exporter(max_batch_size=3, max_batch_bytes=2_200)
+    sizes: list[int] = []
+
+    def new_batch() -> MagicMock:
+        batch = MagicMock()
+        batch.commit.side_effect = (
+            RuntimeError("request too large") if len(sizes) == 1 else None
+        )
+        sizes.append(0)
+
+        def log_struct(entry: dict, **kwargs: Any) -> None:
+            sizes[-1] += 1
+
+        batch.log_struct.side_effect = log_struct
+        return batch
+
+    exporter.logger.batch.side_effect = new_batch
+    spans = make_spans(4) + make_spans(2, {"big": "x" * 900})
+
+    assert exporter.export(spans).name == "SUCCESS"
+
+    assert sizes == [3, 1, 1, 1]
+    assert exporter.stats()["log_writes"] == 3
+    assert exporter.stats()["failed_log_writes"] == 1
+    cast(MagicMock, exporter.client).batch_write_spans.assert_called_once()
+
+
+def test_background_queue_drops_oldest_and_flushes_on_shutdown() -> None:
+    """Tests drop-oldest overflow and that shutdown writes whatever is queued."""
+    exporter = make_exporter(background=True, max_queue_size=3)
+    release = threading.Event()
+    written: list[str] = []
+
+    def commit_blocking() -> None:
+        release.wait(5)
+
+    batch = exporter.logger.batch.return_value
+    batch.log_struct.side_effect = lambda entry, **kwargs: written.append(entry["name"])
+    batch.commit.side_effect = commit_blocking
+
+    exporter.export(make_spans(1))
+    while exporter.stats()["queued_spans"]:
+        time.sleep(0.001)  # Wait for the writer to pick up the first entry and block.
+    exporter.export(make_spans(5))
+    release.set()
+    exporter.shutdown()
+
+    stats = exporter.stats()
+    assert stats["dropped_spans"] == 2
+    assert stats["queued_spans"] == 0
+    assert written == ["span 0", "span 2", "span 3", "span 4"]
+
+
+def test_span_to_dict_matches_to_json() -> None:
+    """Tests that the direct encoding is identical to parsing span.to_json()."""
+    parent = SpanContext(trace_id=0x1234, span_id=0x99, is_remote=False)
+    span = ReadableSpan(
+        name="call_llm",
+        context=SpanContext(trace_id=0x1234, span_id=0x100, is_remote=False),
+        parent=parent,
+        attributes={"model": "gemini-2.5-flash", "tags": ("a", "b"), "tokens": 42},
+        events=[Event("retry", attributes={"attempt": 2}, timestamp=1_500)],
+        links=[Link(parent, attributes={"kind": "follows"})],
+        resource=Resource.create({"service.name": "marketingflow"}),
+        start_time=1_000,
+        end_time=2_000,
+    )
+
+    assert span_to_dict(span) == json.loads(span.to_json())
+
+
+def test_large_attributes_are_serialized_once(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Tests that each attribute of an oversized span is encoded only once."""
+    store = FakePayloadStore()
+    exporter = make_exporter(payload_store=store)
+    dumps_calls = 0
+    original_dumps = json.dumps
+
+    def counting_dumps(obj: Any, **kwargs: Any) -> str:
+        nonlocal dumps_calls
+        dumps_calls += 1
+        return original_dumps(obj, **kwargs)
+
+    monkeypatch.setattr("app.utils.span_offload.json.dumps", counting_dumps)
+    span = make_spans(1, attributes={"llm_request": "x" * (300 * 1024)})[0]
+
+    exporter.export([span])
+    exporter.force_flush()
+
+    assert dumps_calls == 1
+    data, encoding = store.uploads["spans/100/llm_request.json.gz"]
+    assert encoding == "gzip"
+    assert json.loads(gzip.decompress(data)) == "x" * (300 * 1024)
+
+
+def test_only_oversized_attributes_are_offloaded() -> None:
+    """Tests that small attributes stay in the log entry next to the reference."""
+    store = FakePayloadStore()
+    exporter = make_exporter(payload_store=store)
+    span = make_spans(
+        1, attributes={"llm_request": "x" * (300 * 1024), "model": "gemini-2.5-flash"}
+    )[0]
+
+    exporter.export([span])
+    exporter.force_flush()
+
+    entry = exporter.logger.batch.return_value.log_struct.call_args.args[0]
+    assert entry["attributes"]["model"] == "gemini-2.5-flash"
+    assert entry["attributes"]["llm_request"] == {
+        "uri_payload": "memory://spans/100/llm_request.json.gz",
+        "url_payload": "memory://spans/100/llm_request.json.gz",
+        "size_bytes": 300 * 1024 + 2,
+    }
+    assert list(store.uploads) == ["spans/100/llm_request.json.gz"]
+    assert exporter.stats()["offloaded_attributes"] == 1
+    assert exporter.stats()["uploads"] == 1
+
+
+def test_export_does_not_wait_for_uploads() -> None:
+    """Tests that slow uploads run off the export path and overflow is dropped."""
+    store = FakePayloadStore(delay=0.3)
+    exporter = make_exporter(
+        payload_store=store, upload_workers=1, max_pending_uploads=1
+    )
+    spans = make_spans(2, attributes={"llm_request": "x" * (300 * 1024)})
+
+    start = time.perf_counter()
+    exporter.export(spans)
+    elapsed = time.perf_counter() - start
+    exporter.shutdown()
+
+    assert elapsed < 0.2
+    assert len(store.uploads) == 1
+    assert exporter.stats()["dropped_uploads"] == 1
+    dropped = exporter.logger.batch.return_value.log_struct.call_args_list[1].args[0]
+    assert dropped["attributes"]["llm_request"]["offload_failed"] is True
+    assert "uri_payload" not in dropped["attributes"]["llm_request"]
+
+
+def test_unavailable_store_keeps_truncated_payload_inline() -> None:
+    """Tests that an entry never references a payload that was not uploaded."""
+    store = FakePayloadStore(available=False)
+    exporter = make_exporter(payload_store=store)
+    span = make_spans(1, attributes={"llm_request": "x" * (300 * 1024)})[0]
+
+    exporter.export([span])
+    exporter.force_flush()
+
+    entry = exporter.logger.batch.return_value.log_struct.call_args.args[0]
+    assert entry["attributes"]["llm_request"] == {
+        "offload_failed": True,
+        "payload_truncated": '"' + "x" * 1023,
+        "size_bytes": 300 * 1024 + 2,
+    }
+    assert store.uploads == {}
+    assert exporter.stats()["failed_uploads"] == 1
+
+
+def test_gcs_payload_store_caches_bucket_check() -> None:
+    """Tests that the bucket existence check is not repeated for every upload."""
+    storage_client = MagicMock()
+    store = GcsPayloadStore("bucket", storage_client=storage_client)
+
+    assert store.available()
+    assert store.available()
+
+    assert storage_client.bucket.return_value.exists.call_count == 1